@@ -1,30 +1,132 @@
 import asyncio
 import logging
 import os
+import re
 import sys
 from aiohttp import web
 
 from aiogram import Bot, Dispatcher
 from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
 
-from src.database.session import engine, init_models, Base  # ← Добавь Base!
-from src.bot.handlers import router, auto_clean_old_rides
+from src.config import WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, FSM_STORAGE
+
+from src.database.session import engine, init_models, warm_pool, pool_stats, async_session, Base  # ← Добавь Base!
+from src.bot.handlers import router, nlu, notifier, notify_batch_matches
+from src.bot.storage import SQLAlchemyStorage
+from src.bot.middlewares import HandlerMetricsMiddleware, UpdateTrackerMiddleware, PollingTrackerMiddleware
+from src.services.health import health
+from src.services.metrics import registry, instrument_engine
+from src.services.user_cache import user_cache
+from src.services.search import route_search_cache, inline_cache
+from src.services import cleanup, templates
 
 logging.basicConfig(level=logging.INFO, stream=sys.stdout)
 logger = logging.getLogger(__name__)
 
+# Формат secret_token, который принимает setWebhook
+WEBHOOK_SECRET_RE = re.compile(r"[A-Za-z0-9_-]{1,256}")
+
+
+def webhook_secret_is_valid(secret) -> bool:
+    return bool(secret and WEBHOOK_SECRET_RE.fullmatch(secret))
+
 
 async def healthcheck(request):
-    """Health check endpoint for Render"""
+    """Liveness: процесс и цикл событий отвечают"""
     return web.Response(text="Bot is running!")
 
 
-async def start_webserver():
-    """Start web server for health checks"""
+async def readiness(request):
+    """Readiness для Render: БД, обработка апдейтов, polling, предохранитель NLU"""
+    result = await health.readiness()
+    return web.json_response(result, status=200 if result["ready"] else 503)
+
+
+async def metrics(request):
+    """Prometheus text exposition"""
+    return web.Response(text=registry.render(), content_type="text/plain")
+
+
+def setup_metrics():
+    """Hot-path instrumentation: handler middleware, SQLAlchemy listeners, service counters"""
+    router.message.middleware(HandlerMetricsMiddleware())
+    router.callback_query.middleware(HandlerMetricsMiddleware())
+    router.inline_query.middleware(HandlerMetricsMiddleware())
+    instrument_engine(engine)
+
+    registry.register_collector(
+        "db_pool_connections", "Соединения пула БД по состоянию",
+        lambda: {(("state", k),): v for k, v in pool_stats().items()}
+    )
+    registry.register_collector(
+        "notifications_total", "Уведомления через очередь по результату",
+        lambda: {(("result", k),): v for k, v in notifier.stats.items()}, kind="counter"
+    )
+    registry.register_collector(
+        "notification_queue_size", "Уведомлений в очереди", lambda: {None: notifier.pending()}
+    )
+    registry.register_collector(
+        "nlu_cache_hit_rate", "Доля попаданий в кэш NLU", lambda: {None: nlu.cache.stats()["hit_rate"]}
+    )
+    registry.register_collector(
+        "nlu_fast_path_hit_rate", "Доля сообщений, разобранных без LLM", lambda: {None: nlu.fast_path_stats()["hit_rate"]}
+    )
+    registry.register_collector(
+        "nlu_prompt_bytes_per_turn", "Средний размер сообщения в pro-talk",
+        lambda: {(("kind", k),): v["bytes_per_turn"] for k, v in nlu.prompt_stats().items()}
+    )
+    registry.register_collector(
+        "nlu_circuit_open", "Предохранитель pro-talk разомкнут (1) или нет (0)",
+        lambda: {None: int(nlu.breaker.state != "closed")}
+    )
+    registry.register_collector(
+        "nlu_hedged_requests_total", "Хеджирующие копии запросов к pro-talk",
+        lambda: {(("result", k),): v for k, v in nlu.hedges.items()}, kind="counter"
+    )
+    registry.register_collector(
+        "user_cache_hit_rate", "Доля попаданий в кэш пользователей", lambda: {None: user_cache.stats()["hit_rate"]}
+    )
+    registry.register_collector(
+        "route_search_cache_hit_rate", "Доля попаданий в кэш поиска по маршруту",
+        lambda: {None: route_search_cache.stats()["hit_rate"]}
+    )
+    registry.register_collector(
+        "inline_cache_hit_rate", "Доля inline-запросов, отвеченных из кэша",
+        lambda: {None: inline_cache.stats()["hit_rate"]}
+    )
+    registry.register_collector(
+        "cleanup_last_deleted", "Удалено поездок последним прогоном очистки",
+        lambda: {None: cleanup.last_run.get("deleted", 0)}
+    )
+
+
+def create_app(dp: Dispatcher, bot: Bot) -> web.Application:
+    """Health checks + (in webhook mode) Telegram webhook endpoint"""
     app = web.Application()
     app.router.add_get("/", healthcheck)
-    app.router.add_get("/health", healthcheck)
-    
+    app.router.add_get("/livez", healthcheck)
+    app.router.add_get("/readyz", readiness)
+    app.router.add_get("/health", readiness)
+    app.router.add_get("/metrics", metrics)
+
+    if WEBHOOK_URL:
+        # Без секрета любой, кто узнал адрес, может прислать поддельный апдейт
+        if not webhook_secret_is_valid(WEBHOOK_SECRET):
+            raise RuntimeError("WEBHOOK_SECRET is required in webhook mode (1-256 chars: A-Z, a-z, 0-9, _, -)")
+        # Апдейт обрабатывается в фоне, Telegram сразу получает 200.
+        # Запросы без верного X-Telegram-Bot-Api-Secret-Token отклоняются с 401.
+        SimpleRequestHandler(
+            dispatcher=dp,
+            bot=bot,
+            handle_in_background=True,
+            secret_token=WEBHOOK_SECRET
+        ).register(app, path=WEBHOOK_PATH)
+    return app
+
+
+async def start_webserver(app: web.Application) -> web.AppRunner:
+    """Start web server for health checks and webhook"""
     port = int(os.environ.get("PORT", 10000))
     
     runner = web.AppRunner(app)
@@ -32,6 +134,7 @@ async def start_webserver():
     site = web.TCPSite(runner, "0.0.0.0", port)
     await site.start()
     logger.info(f"🕸 Web server started on port {port}")
+    return runner
 
 
 async def main():
@@ -41,25 +144,55 @@ async def main():
         # await conn.run_sync(Base.metadata.create_all)
 
     await init_models()
+    await warm_pool()
     
     bot_token = os.getenv("BOT_TOKEN")
     if not bot_token:
         logger.error("BOT_TOKEN is not set")
         return
+    if WEBHOOK_URL and not webhook_secret_is_valid(WEBHOOK_SECRET):
+        logger.error("WEBHOOK_SECRET is not set or invalid (1-256 chars: A-Z, a-z, 0-9, _, -), webhook mode refused")
+        return
     
     bot = Bot(token=bot_token)
-    dp = Dispatcher(storage=MemoryStorage())
+    if FSM_STORAGE == "memory":
+        storage = MemoryStorage()
+    else:
+        storage = SQLAlchemyStorage(async_session)
+        await storage.start()
+    dp = Dispatcher(storage=storage)
+    dp.update.outer_middleware(UpdateTrackerMiddleware())
+    health.configure(async_session, breaker=nlu.breaker)
+    setup_metrics()
     dp.include_router(router)
     
-    await start_webserver()
-    asyncio.create_task(auto_clean_old_rides())
-    
-    await bot.delete_webhook(drop_pending_updates=True)
-    logger.info("🚀 Bot started polling")
+    runner = await start_webserver(create_app(dp, bot))
+    await nlu.start()
+    notifier.start(bot)
+    asyncio.create_task(cleanup.auto_clean_old_rides())
+    asyncio.create_task(templates.auto_materialize_templates(on_matches=notify_batch_matches))
     
     try:
-        await dp.start_polling(bot)
+        if WEBHOOK_URL:
+            # Все реплики ставят один и тот же адрес, поэтому очередь апдейтов не сбрасываем
+            await bot.set_webhook(
+                f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}",
+                secret_token=WEBHOOK_SECRET,
+                allowed_updates=dp.resolve_used_update_types()
+            )
+            logger.info(f"🚀 Bot started in webhook mode on {WEBHOOK_PATH}")
+            await asyncio.Event().wait()
+        else:
+            await bot.delete_webhook(drop_pending_updates=True)
+            bot.session.middleware(PollingTrackerMiddleware())
+            logger.info("🚀 Bot started polling")
+            health.polling_task = asyncio.create_task(dp.start_polling(bot))
+            await health.polling_task
     finally:
+        await runner.cleanup()
+        await notifier.stop()
+        await storage.close()
+        await nlu.close()
         await bot.session.close()
 
 
@@ -0,0 +1,53 @@
+import re
+from datetime import date
+
+from src.services.fast_parser import extract_ride_fields
+
+# --- ПОШАГОВАЯ АНКЕТА (когда pro-talk недоступен) ---
+
+FORM_QUESTIONS = {
+    "origin": "Откуда вы выезжаете? Например: <i>из Здравого</i>",
+    "destination": "Куда едете? Например: <i>в Краснодар</i>",
+    "date": "Какого числа поездка? Например: <i>завтра</i> или <i>25.12</i>",
+    "start_time": "Во сколько выезд? Например: <i>9:00</i> или <i>18 вечера</i>",
+    "seats": "Сколько мест? Напишите число, например: <i>2</i>",
+}
+
+_BARE_NUMBER_RE = re.compile(r"^\s*(\d{1,2})\s*$")
+
+
+def required_fields(role: str) -> list:
+    """Поля, без которых заявку не сохранить; время обязательно только водителю"""
+    fields = ["origin", "destination", "date"]
+    if role == "driver":
+        fields.append("start_time")
+    fields.append("seats")
+    return fields
+
+
+def merge_form_answer(form: dict, pending: str, text: str, role: str, today: date = None):
+    """
+    Добавляет в анкету то, что нашлось в ответе пользователя.
+    Возвращает (анкета, следующее незаполненное поле или None, если всё собрано).
+    """
+    form = dict(form or {})
+    fields = extract_ride_fields(text, today)
+
+    # Голый город или число — ответ на заданный вопрос
+    city = fields.pop("city", None)
+    if city and pending in ("origin", "destination"):
+        fields.setdefault(pending, city)
+    bare = _BARE_NUMBER_RE.match(text or "")
+    if bare:
+        number = int(bare.group(1))
+        if pending == "seats" and 0 < number <= 8:
+            fields["seats"] = number
+        elif pending == "start_time" and number < 24:
+            fields["start_time"] = f"{number:02d}:00"
+
+    form.update(fields)
+    if form.get("origin") and form.get("origin") == form.get("destination"):
+        # Совпадение — значит, перепутано одно из полей; переспросим то, что спрашивали
+        form.pop(pending if pending in ("origin", "destination") else "destination", None)
+    missing = next((f for f in required_fields(role) if not form.get(f)), None)
+    return form, missing
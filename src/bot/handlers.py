@@ -3,27 +3,49 @@ import logging
 import json
 import re
 import html
+import time
 from datetime import datetime, timedelta, date
 from sqlalchemy import delete, select, update
 from aiogram import Router, types, F
-from aiogram.filters import Command, StateFilter
+from aiogram.filters import Command, CommandObject, StateFilter
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
+from aiogram.types import (
+    ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardButton, InlineQueryResultArticle, InputTextMessageContent
+)
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
 
-from src.database.session import async_session
-from src.database.models import User, Ride, Booking
+from src.database.session import async_session, dialect_insert
+from src.database.models import User, Ride, Booking, RideTemplate
 from src.services.nlu import NLUProcessor
+from src.services.matching import segment_index, find_compatible_rides
+from src.services.ranking import rank_drivers
+from src.services.notifier import NotificationDispatcher
+from src.services.user_cache import user_cache
+from src.services.routes import normalize_stop, route_graph
+from src.services.bulk import BulkFileError, parse_bulk_file, insert_rides, match_batch
+from src.services.templates import WEEKDAYS_MASK, materialize_templates
+from src.config import BULK_ALLOWED_IDS, BULK_MAX_FILE_SIZE, BULK_NOTIFY_LIMIT, TEMPLATE_DAYS_AHEAD, INLINE_CACHE_TTL
+from src.services.search import (
+    PAGE_SIZE, fetch_drivers, fetch_user_rides, encode_cursor, encode_user_cursor,
+    parse_find_query, fetch_route_drivers, route_search_cache, suggest_routes, inline_cache
+)
+from src.bot.rendering import MESSAGE_LIMIT, fit_blocks, join_blocks
+from src.bot.form import FORM_QUESTIONS, merge_form_answer
 
 logger = logging.getLogger(__name__)
 router = Router()
 nlu = NLUProcessor()
+notifier = NotificationDispatcher()
 
 class RideForm(StatesGroup):
     chatting_with_ai = State()
 
+class BulkImport(StatesGroup):
+    waiting_file = State()
+
 def main_kb():
     kb = [
         [KeyboardButton(text="🙋 Подвези"), KeyboardButton(text="🚗 Подвезу")],
@@ -31,49 +53,6 @@ def main_kb():
     ]
     return ReplyKeyboardMarkup(keyboard=kb, resize_keyboard=True)
 
-# --- НАСТРОЙКА МАРШРУТОВ ---
-
-ROUTE_ORDER = [
-    "Сказочный край",
-    "Живой дом",
-    "Здравое",
-    "Григорьевская",
-    "Смоленская",
-    "Афипский",
-    "Энем",
-    "Яблоновский",
-    "Краснодар"
-]
-
-def get_city_index(city_name: str) -> int:
-    city_name = city_name.lower()
-    for i, stop in enumerate(ROUTE_ORDER):
-        if stop.lower() in city_name:
-            return i
-    return -1
-
-def is_route_compatible(driver_origin, driver_dest, pass_origin, pass_dest):
-    d_start = get_city_index(driver_origin)
-    d_end = get_city_index(driver_dest)
-    p_start = get_city_index(pass_origin)
-    p_end = get_city_index(pass_dest)
-
-    if -1 in [d_start, d_end, p_start, p_end]:
-        return (pass_origin.lower() in driver_origin.lower()) and \
-               (pass_dest.lower() in driver_dest.lower())
-
-    driver_direction = d_end > d_start 
-    pass_direction = p_end > p_start
-
-    if driver_direction != pass_direction:
-        return False 
-
-    if driver_direction: 
-        return p_start >= d_start and p_end <= d_end
-    else: 
-        return p_start <= d_start and p_end >= d_end
-
-    
 def parse_date(date_str: str):
     formats = [
         "%Y-%m-%d", "%d.%m.%Y", "%d.%m.%y", "%d-%m-%Y"
@@ -85,6 +64,22 @@ def parse_date(date_str: str):
             continue
     return None
 
+def parse_time(time_str):
+    """"18:00" -> time(18, 0); пустое значение, "По договоренности" и мусор -> None"""
+    if not time_str:
+        return None
+    for fmt in ("%H:%M", "%H:%M:%S", "%H.%M"):
+        try:
+            return datetime.strptime(str(time_str).strip(), fmt).time()
+        except ValueError:
+            continue
+    return None
+
+def fmt_time(ride) -> str:
+    if ride.start_time:
+        return ride.start_time.strftime("%H:%M")
+    return "По договоренности"
+
 def fmt_date(d) -> str:
     """Вспомогательная функция для форматирования даты в DD.MM.YYYY"""
     if not d:
@@ -97,30 +92,19 @@ def fmt_date(d) -> str:
     return d.strftime("%d.%m.%Y")
 
 
-# --- ФОНОВЫЕ ЗАДАЧИ ---
-async def auto_clean_old_rides():
-    while True:
-        try:
-            async with async_session() as session:
-                limit = datetime.utcnow() - timedelta(days=2)
-                await session.execute(delete(Ride).where(Ride.created_at < limit))
-                await session.execute(delete(Booking).where(Booking.created_at < limit))
-                await session.commit()
-                logger.info("Фоновая очистка базы завершена успешно.")
-            await asyncio.sleep(43200)
-        except Exception as e:
-            logger.error(f"Ошибка фоновой очистки: {e}")
-            await asyncio.sleep(3600)
-
 # --- ПРИВЕТСТВИЕ ---
 @router.message(Command("start"))
 async def start(m: types.Message, state: FSMContext):
     await state.clear()
+    nlu.reset_conversation(m.from_user.id)
     async with async_session() as session:
-        result = await session.execute(select(User).where(User.telegram_id == m.from_user.id))
-        if not result.scalar():
-            session.add(User(telegram_id=m.from_user.id, username=m.from_user.username))
+        # Заодно обновляет username, если пользователь его сменил
+        user = await user_cache.get(session, m.from_user.id, username=m.from_user.username)
+        if not user:
+            user = User(telegram_id=m.from_user.id, username=m.from_user.username)
+            session.add(user)
             await session.commit()
+            user_cache.put(user)
     
     welcome_text = (
         "Привет! Я помогу найти попутчиков.\n\n"
@@ -129,7 +113,8 @@ async def start(m: types.Message, state: FSMContext):
         "Вы пассажир - нажмите 🙋 Подвези\n"
         "Вы водитель - нажмите 🚗 Подвезу\n\n"
         "<b>Посмотреть все активные поездки:</b>\n"
-        "Нажмите 🔍 Найти поездку\n\n"
+        "Нажмите 🔍 Найти поездку\n"
+        "или по маршруту: /find Здравое Краснодар завтра\n\n"
         "<b>Проверить/удалить свои поездки:</b>\n"
         "Нажмите кнопку 📋 Мои поездки"
     )
@@ -140,66 +125,195 @@ async def start(m: types.Message, state: FSMContext):
 @router.message(F.text.in_({"🔍 Найти поездку"}))
 async def find_rides(m: types.Message, state: FSMContext):
     await state.clear()
-    
+    text, kb = await render_drivers_page()
+    await m.answer(text or "Нет актуальных объявлений водителей.", reply_markup=kb, parse_mode="HTML")
+
+
+@router.callback_query(F.data.startswith("more_"))
+async def more_rides(cb: types.CallbackQuery):
+    cursor = cb.data.split("_", 1)[1]
+    text, kb = await render_drivers_page(None if cursor == "first" else cursor)
+    await cb.answer()
+    # Листаем в том же сообщении, а не присылаем новое
+    await edit_in_place(cb.message, text or "Больше поездок нет.", kb)
+
+
+def driver_card(r: Ride, u: User) -> str:
+    username = html.escape(u.username or 'скрыт')
+    return (
+        f"<b>🚗 Водитель</b>\n"
+        f"📍 {html.escape(r.origin)} -> {html.escape(r.destination)}\n"
+        f"📅 {fmt_date(r.ride_date)} | {fmt_time(r)}\n"
+        f"Мест: {r.seats}\n"
+        f"👤 @{username}"
+    )
+
+
+async def render_drivers_page(cursor: str = None):
+    """Одна страница водителей одним сообщением: (текст, клавиатура) или (None, None), если пусто"""
     async with async_session() as s:
-        # Получаем текущую дату и время для фильтрации
-        now = datetime.now()
-        today = now.date()
-        current_time = now.time()
-        
-        # Ищем только водителей, у которых есть свободные места
-        rides_stmt = await s.execute(
-            select(Ride, User).join(User).where(
-                Ride.role == 'driver',
-                Ride.seats > 0,
-                Ride.ride_date >= today  # Дата не раньше сегодняшней
-            ).order_by(Ride.ride_date.asc(), Ride.created_at.desc()).limit(20)
-        )
-        all_rides = rides_stmt.all()
-        
-        # Фильтруем поездки по времени
-        rides = []
-        for r, u in all_rides:
-            # Если дата в будущем - всегда показываем
-            if r.ride_date > today:
-                rides.append((r, u))
-            # Если дата сегодня - проверяем время
-            elif r.ride_date == today:
-                # Если время не указано или "По договоренности" - показываем
-                if not r.start_time or r.start_time == "По договоренности":
-                    rides.append((r, u))
-                else:
-                    # Парсим время поездки
-                    try:
-                        ride_time = datetime.strptime(r.start_time, "%H:%M").time()
-                        # Показываем только если время в будущем
-                        if ride_time > current_time:
-                            rides.append((r, u))
-                    except ValueError:
-                        # Если формат времени неправильный, всё равно показываем
-                        rides.append((r, u))
-            
-            # Ограничиваем до 10 актуальных поездок
-            if len(rides) >= 10:
-                break
-        
-        if not rides:
-            return await m.answer("Нет актуальных объявлений водителей.")
-        
-        for r, u in rides:
-            role_icon = '🚗 Водитель'
-            seats_text = f"Мест: {r.seats}"
-            
-            username = html.escape(u.username or 'скрыт')
-            
-            txt = (
-                f"<b>{role_icon}</b>\n"
-                f"📍 {html.escape(r.origin)} -> {html.escape(r.destination)}\n"
-                f"📅 {fmt_date(r.ride_date)} | {r.start_time}\n"
-                f"{seats_text}\n"
-                f"👤 @{username}"
-            )
-            await m.answer(txt, parse_mode="HTML")
+        # Только водители со свободными местами, которые ещё не уехали (фильтр по времени — в SQL)
+        rows = await fetch_drivers(s, cursor, limit=PAGE_SIZE + 1)
+    if not rows:
+        return None, None
+
+    blocks = [driver_card(r, u) for r, u in rows[:PAGE_SIZE]]
+    shown = fit_blocks("", blocks)
+
+    kb = InlineKeyboardBuilder()
+    if shown < len(rows):
+        kb.button(text="Ещё ▶️", callback_data=f"more_{encode_cursor(rows[shown - 1][0])}")
+    if cursor:
+        kb.button(text="⏮ В начало", callback_data="more_first")
+    kb.button(text="🧭 Поиск по маршруту", callback_data="fs_new")
+    return join_blocks("", blocks[:shown]), kb.as_markup()
+
+
+async def edit_in_place(message: types.Message, text: str, kb=None):
+    try:
+        await message.edit_text(text, reply_markup=kb, parse_mode="HTML")
+    except TelegramBadRequest as e:
+        # "message is not modified" — страница не изменилась
+        logger.debug(f"edit_in_place skipped: {e}")
+
+
+# --- ПОИСК ПО МАРШРУТУ ---
+FIND_HELP = (
+    "Не нашёл такой маршрут. Напишите, например: <code>/find Здравое Краснодар завтра</code> "
+    "или выберите остановки кнопками."
+)
+FIND_MORE_NOTE = "\n\nПоказаны ближайшие поездки — укажите дату, чтобы увидеть остальные."
+
+
+def stops_keyboard(prefix: str, stop_ids, back: str = None):
+    kb = InlineKeyboardBuilder()
+    for stop_id in stop_ids:
+        kb.button(text=route_graph.names[stop_id], callback_data=f"{prefix}{stop_id}")
+    if back:
+        kb.button(text="◀️ Назад", callback_data=back)
+    kb.adjust(2)
+    return kb.as_markup()
+
+
+def origins_keyboard():
+    return stops_keyboard("fso_", [s for s in route_graph.names if route_graph.destinations(s)])
+
+
+async def route_drivers(pair: tuple, ride_date: date = None) -> list:
+    """Выдача поиска по отрезку: из кэша на (маршрут, дата), при промахе — один запрос"""
+    rows = route_search_cache.get((pair, ride_date))
+    if rows is None:
+        async with async_session() as s:
+            rows = await fetch_route_drivers(s, pair, ride_date)
+        route_search_cache.put((pair, ride_date), rows)
+    return rows
+
+
+def route_search_text(pair: tuple, ride_date: date, rows: list) -> str:
+    route = f"{route_graph.names[pair[0]]} -> {route_graph.names[pair[1]]}"
+    header = f"<b>🔍 {html.escape(route)}, {fmt_date(ride_date) if ride_date else 'ближайшие дни'}</b>\n\n"
+    if not rows:
+        return header + "Подходящих водителей пока нет."
+    blocks = [driver_card(r, u) for r, u in rows[:PAGE_SIZE]]
+    shown = fit_blocks(header, blocks, MESSAGE_LIMIT - len(FIND_MORE_NOTE))
+    text = join_blocks(header, blocks[:shown])
+    if shown < len(rows):
+        text += FIND_MORE_NOTE
+    return text
+
+
+async def render_route_search(pair: tuple, ride_date: date = None):
+    """Водители на отрезке pair одним сообщением: (текст, клавиатура)"""
+    rows = await route_drivers(pair, ride_date)
+    kb = InlineKeyboardBuilder()
+    kb.button(text="🧭 Другой маршрут", callback_data="fs_new")
+    return route_search_text(pair, ride_date, rows), kb.as_markup()
+
+
+@router.message(Command("find"))
+async def find_route(m: types.Message, state: FSMContext, command: CommandObject):
+    await state.clear()
+    if command.args:
+        query = parse_find_query(command.args)
+        if query:
+            text, kb = await render_route_search(*query)
+            return await m.answer(text, reply_markup=kb, parse_mode="HTML")
+        await m.answer(FIND_HELP, parse_mode="HTML")
+    await m.answer("Откуда едете?", reply_markup=origins_keyboard())
+
+
+@router.callback_query(F.data == "fs_new")
+async def find_route_restart(cb: types.CallbackQuery):
+    await cb.answer()
+    await cb.message.answer("Откуда едете?", reply_markup=origins_keyboard())
+
+
+@router.callback_query(F.data.startswith("fso_"))
+async def find_route_origin(cb: types.CallbackQuery):
+    origin = int(cb.data.split("_")[1])
+    await cb.answer()
+    await edit_in_place(
+        cb.message, f"Из <b>{html.escape(route_graph.names[origin])}</b>. Куда?",
+        stops_keyboard(f"fsd_{origin}_", route_graph.destinations(origin), back="fs_back")
+    )
+
+
+@router.callback_query(F.data == "fs_back")
+async def find_route_back(cb: types.CallbackQuery):
+    await cb.answer()
+    await edit_in_place(cb.message, "Откуда едете?", origins_keyboard())
+
+
+@router.callback_query(F.data.startswith("fsd_"))
+async def find_route_destination(cb: types.CallbackQuery):
+    _, origin, dest = cb.data.split("_")
+    today = date.today()
+    kb = InlineKeyboardBuilder()
+    for label, offset in (("Сегодня", 0), ("Завтра", 1), ("Послезавтра", 2)):
+        kb.button(text=label, callback_data=f"fst_{origin}_{dest}_{(today + timedelta(days=offset)).toordinal()}")
+    kb.button(text="Любая дата", callback_data=f"fst_{origin}_{dest}_0")
+    kb.adjust(3, 1)
+    await cb.answer()
+    route = f"{route_graph.names[int(origin)]} -> {route_graph.names[int(dest)]}"
+    await edit_in_place(cb.message, f"<b>{html.escape(route)}</b>. Когда?", kb.as_markup())
+
+
+@router.callback_query(F.data.startswith("fst_"))
+async def find_route_results(cb: types.CallbackQuery):
+    _, origin, dest, ordinal = cb.data.split("_")
+    ride_date = date.fromordinal(int(ordinal)) if int(ordinal) else None
+    text, kb = await render_route_search((int(origin), int(dest)), ride_date)
+    await cb.answer()
+    await edit_in_place(cb.message, text, kb)
+
+
+# --- INLINE-РЕЖИМ ---
+@router.inline_query()
+async def inline_search(q: types.InlineQuery):
+    """
+    @bot Здравое Кра — подсказки маршрутов на каждое нажатие клавиши. Остановки дополняются
+    по префиксному дереву в памяти, готовые ответы кэшируются по тексту запроса, а выдача
+    по маршруту берётся из того же кэша, что и /find, — БД видит только промахи.
+    """
+    key = normalize_stop(q.query)
+    results = inline_cache.get(key)
+    if results is None:
+        pairs, ride_date = suggest_routes(q.query)
+        found = await asyncio.gather(*(route_drivers(pair, ride_date) for pair in pairs))
+        results = []
+        for pair, rows in zip(pairs, found):
+            count = f"{PAGE_SIZE}+" if len(rows) > PAGE_SIZE else str(len(rows))
+            results.append(InlineQueryResultArticle(
+                id=f"{pair[0]}_{pair[1]}_{ride_date.toordinal() if ride_date else 0}",
+                title=f"{route_graph.names[pair[0]]} -> {route_graph.names[pair[1]]}",
+                description=f"Водителей: {count}, {fmt_date(ride_date) if ride_date else 'ближайшие дни'}",
+                input_message_content=InputTextMessageContent(
+                    message_text=route_search_text(pair, ride_date, rows), parse_mode="HTML"
+                )
+            ))
+        inline_cache.put(key, results)
+    # Ответ одинаков для всех пользователей — пусть Telegram тоже его кэширует
+    await q.answer(results, cache_time=INLINE_CACHE_TTL, is_personal=False)
 
 
 # --- КНОПКИ МОИ ПОЕЗДКИ ---
@@ -209,27 +323,62 @@ async def list_rides(m: types.Message, state: FSMContext):
     await state.clear()
     
     async with async_session() as s:
-        user_stmt = await s.execute(select(User.id).where(User.telegram_id == m.from_user.id))
-        u_id_res = user_stmt.scalar()
+        user = await user_cache.get(s, m.from_user.id)
         
-        if not u_id_res:
-            return await m.answer("Сначала нажмите /start")
+    if not user:
+        return await m.answer("Сначала нажмите /start")
 
-        rides_stmt = await s.execute(select(Ride).where(Ride.user_id == u_id_res).order_by(Ride.ride_date.desc()))
-        rides = rides_stmt.scalars().all()
-        
-        if not rides:
-            return await m.answer("У вас пока нет активных поездок.")
-        
-        for r in rides:
-            role_text = "🚗 Я - Водитель" if r.role == 'driver' else "🙋 Я - Пассажир"
-            txt = (
-                f"<b>{role_text}</b>\n"
-                f"📍 <b>{html.escape(r.origin)}</b> -> <b>{html.escape(r.destination)}</b>\n"
-                f"📅 {fmt_date(r.ride_date)} | {r.start_time}"
-            )
-            kb = InlineKeyboardBuilder().button(text="❌ Удалить", callback_data=f"del_{r.id}").as_markup()
-            await m.answer(txt, reply_markup=kb, parse_mode="HTML")
+    text, kb = await render_user_rides(user.id)
+    await m.answer(text or "У вас пока нет активных поездок.", reply_markup=kb, parse_mode="HTML")
+
+
+@router.callback_query(F.data.startswith("mine_"))
+async def more_user_rides(cb: types.CallbackQuery):
+    cursor = cb.data.split("_", 1)[1]
+    async with async_session() as s:
+        user = await user_cache.get(s, cb.from_user.id)
+    if not user:
+        return await cb.answer("Сначала нажмите /start", show_alert=True)
+
+    text, kb = await render_user_rides(user.id, None if cursor == "first" else cursor)
+    await cb.answer()
+    await edit_in_place(cb.message, text or "У вас пока нет активных поездок.", kb)
+
+
+async def render_user_rides(user_id: int, cursor: str = None):
+    """
+    Страница "Мои поездки" одним сообщением с общей клавиатурой удаления.
+    Курсор страницы зашит в кнопки удаления, чтобы после удаления перерисовать ту же страницу.
+    """
+    async with async_session() as s:
+        rides = await fetch_user_rides(s, user_id, cursor, limit=PAGE_SIZE + 1)
+    if not rides:
+        return None, None
+
+    header = "<b>📋 Ваши поездки:</b>\n\n"
+    blocks = []
+    for i, r in enumerate(rides[:PAGE_SIZE], start=1):
+        role_text = "🚗 Я - Водитель" if r.role == 'driver' else "🙋 Я - Пассажир"
+        blocks.append(
+            f"<b>{i}. {role_text}</b>\n"
+            f"📍 <b>{html.escape(r.origin)}</b> -> <b>{html.escape(r.destination)}</b>\n"
+            f"📅 {fmt_date(r.ride_date)} | {fmt_time(r)}"
+        )
+    shown = fit_blocks(header, blocks)
+
+    page_suffix = f"_{cursor}" if cursor else ""
+    kb = InlineKeyboardBuilder()
+    for i, r in enumerate(rides[:shown], start=1):
+        kb.button(text=f"❌ {i}", callback_data=f"del_{r.id}{page_suffix}")
+    kb.adjust(5)
+    nav = []
+    if shown < len(rides):
+        nav.append(InlineKeyboardButton(text="Ещё ▶️", callback_data=f"mine_{encode_user_cursor(rides[shown - 1])}"))
+    if cursor:
+        nav.append(InlineKeyboardButton(text="⏮ В начало", callback_data="mine_first"))
+    if nav:
+        kb.row(*nav)
+    return join_blocks(header, blocks[:shown]), kb.as_markup()
 
 # --- ВЫБОР РОЛИ ---
 @router.message(F.text.in_(["🙋 Подвези", "🚗 Подвезу"]))
@@ -237,6 +386,7 @@ async def ask_route(m: types.Message, state: FSMContext):
     await state.clear()
     
     role = "passenger" if "🙋" in m.text else "driver"
+    nlu.reset_conversation(m.from_user.id)
     await state.update_data(role=role)
     await state.set_state(RideForm.chatting_with_ai)
     
@@ -264,14 +414,13 @@ async def handle_ai_conversation(m: types.Message, state: FSMContext):
     if not role:
         async with async_session() as s:
             # Ищем пользователя
-            user_res = await s.execute(select(User.id).where(User.telegram_id == m.from_user.id))
-            u_id = user_res.scalar()
+            user = await user_cache.get(s, m.from_user.id)
             
-            if u_id:
+            if user:
                 # Ищем последнюю поездку этого пользователя
                 last_ride_res = await s.execute(
                     select(Ride.role)
-                    .where(Ride.user_id == u_id)
+                    .where(Ride.user_id == user.id)
                     .order_by(Ride.created_at.desc())
                     .limit(1)
                 )
@@ -287,13 +436,18 @@ async def handle_ai_conversation(m: types.Message, state: FSMContext):
 
     logger.info(f"👤 User role: {role}")
 
+    # Анкета уже идёт (pro-talk был недоступен) — продолжаем её без LLM
+    if data.get("form_pending"):
+        return await continue_form(m, state, role)
+
     # 3. Передаем роль в NLU
     res = await nlu.parse_intent(m.text, m.from_user.id, role=role)
 
     logger.info(f"🤖 NLU response: {res}")
     
     if not res:
-        return await m.answer("Извините, сервис временно недоступен.")
+        # pro-talk недоступен или предохранитель разомкнут — собираем заявку по шагам
+        return await continue_form(m, state, role, intro=True)
 
     is_ride_saved = False
     if res.get("origin") and res.get("destination") and res.get("date"):
@@ -324,6 +478,22 @@ async def handle_ai_conversation(m: types.Message, state: FSMContext):
     elif not is_ride_saved:
         await m.answer("🤷🏻‍♂️ Поездка не сохранена! Я не понял детали маршрута. Попробуйте еще раз, указав Откуда, Куда и Дату.")
 
+async def continue_form(m: types.Message, state: FSMContext, role: str, intro: bool = False):
+    """Шаг пошаговой анкеты: разбираем ответ локально и спрашиваем следующее недостающее поле"""
+    data = await state.get_data()
+    form, missing = merge_form_answer(data.get("form"), data.get("form_pending"), m.text, role)
+
+    if missing is None:
+        logger.info(f"📝 Form completed without NLU for user {m.from_user.id}: {form}")
+        await state.update_data(role=role, form=None, form_pending=None)
+        return await process_ride_data(m, dict(form, raw_text=""), state)
+
+    await state.update_data(role=role, form=form, form_pending=missing)
+    question = FORM_QUESTIONS[missing]
+    if intro:
+        question = f"Сервис распознавания сейчас недоступен, заполним заявку по шагам.\n\n{question}"
+    await m.answer(question, parse_mode="HTML")
+
 async def process_ride_data(m: types.Message, res: dict, state: FSMContext):
     data = await state.get_data()
     role = data.get('role', 'passenger')
@@ -331,8 +501,7 @@ async def process_ride_data(m: types.Message, res: dict, state: FSMContext):
     logger.info(f"🔍 process_ride_data called with res={res}, role={role}")
     
     async with async_session() as s:
-        user_stmt = await s.execute(select(User).where(User.telegram_id == m.from_user.id))
-        user = user_stmt.scalar()
+        user = await user_cache.get(s, m.from_user.id, username=m.from_user.username)
         if not user:
             logger.error(f"❌ User not found for telegram_id={m.from_user.id}")
             return
@@ -347,10 +516,8 @@ async def process_ride_data(m: types.Message, res: dict, state: FSMContext):
 
         seats = int(res.get('seats', 1 if role == 'passenger' else 3))
         
-        # Если время не указано, ставим "По договоренности"
-        start_time = res.get('start_time')
-        if not start_time or start_time == 'None' or start_time == '':
-            start_time = "По договоренности"
+        # Если время не указано или не распознано — "По договоренности"
+        start_time = parse_time(res.get('start_time'))
 
         logger.info(f"💾 Creating ride: origin={res.get('origin')}, dest={res.get('destination')}, date={parsed_date}, time={start_time}, seats={seats}, role={role}")
 
@@ -367,6 +534,8 @@ async def process_ride_data(m: types.Message, res: dict, state: FSMContext):
         s.add(new_ride)
         await s.commit()
         await s.refresh(new_ride)
+        segment_index.add(new_ride)
+        route_search_cache.invalidate(new_ride.ride_date, role, new_ride.origin_stop_id, new_ride.dest_stop_id)
 
         logger.info(f"✅ Ride created: ID={new_ride.id}, ride_date={new_ride.ride_date}")
 
@@ -374,86 +543,242 @@ async def process_ride_data(m: types.Message, res: dict, state: FSMContext):
 
     if role == 'driver':
         await match_passengers(m, new_ride, res, user)
+        if new_ride.start_time and new_ride.origin_stop_id is not None:
+            kb = InlineKeyboardBuilder()
+            kb.button(text="🔁 Повторять по будням", callback_data=f"repeat_{new_ride.id}")
+            await m.answer(
+                "Ездите так каждый будний день? Я буду публиковать поездку сам, без переписки.",
+                reply_markup=kb.as_markup()
+            )
     elif role == 'passenger':
         await notify_drivers_about_passenger(m, new_ride, user)
 
     await state.clear()
 
+def enqueue_found_passenger(driver_tid: int, driver_ride: Ride, passenger_ride: Ride, passenger_user: User):
+    """Водителю, который только что создал поездку: попутчик на его маршруте"""
+    kb = InlineKeyboardBuilder()
+    kb.button(text="✅ Взять пассажира", callback_data=f"take_{passenger_ride.id}_{driver_ride.id}")
+
+    username = html.escape(passenger_user.username or 'скрыт')
+    match_msg = (
+        f"🔔 <b>Найден попутчик (по пути)!</b>\n"
+        f"📍 {html.escape(passenger_ride.origin)} ➡️ {html.escape(passenger_ride.destination)}\n"
+        f"📅 {fmt_date(passenger_ride.ride_date)} | {fmt_time(passenger_ride)}\n"
+        f"👤 @{username}"
+    )
+    notifier.enqueue(driver_tid, match_msg, reply_markup=kb.as_markup(), parse_mode="HTML")
+
+def enqueue_new_passenger(driver_tid: int, driver_ride: Ride, passenger_ride: Ride, passenger_user: User):
+    """Водителю с уже опубликованной поездкой: появился новый пассажир"""
+    kb = InlineKeyboardBuilder()
+    kb.button(text="✅ Взять пассажира", callback_data=f"take_{passenger_ride.id}_{driver_ride.id}")
+
+    msg = (
+        f"🔔 <b>Для вас найден пассажир!</b>\n"
+        f"📍 {html.escape(passenger_ride.origin)} ➡️ {html.escape(passenger_ride.destination)}\n"
+        f"📅 {fmt_date(passenger_ride.ride_date)} | {fmt_time(passenger_ride)}\n"
+        f"👥 Нужно мест: {passenger_ride.initial_seats}\n"
+        f"👤 Контакт: @{html.escape(passenger_user.username or 'скрыт')}"
+    )
+    notifier.enqueue(driver_tid, msg, reply_markup=kb.as_markup(), parse_mode="HTML")
+
 async def match_passengers(m: types.Message, new_ride: Ride, res: dict, user: User):
-    target_date = parse_date(res['date'])
-    if not target_date:
+    if not parse_date(res['date']):
         return
 
     async with async_session() as s:
-        matches_stmt = await s.execute(
-            select(Ride, User).join(User).where(
-                Ride.ride_date == target_date, 
-                Ride.role == 'passenger',
-                Ride.user_id != user.id
-            )
-        )
-        matches = matches_stmt.all()
+        matches = await find_compatible_rides(s, new_ride, exclude_user_id=user.id)
 
         for r_obj, match_user in matches:
-            if is_route_compatible(new_ride.origin, new_ride.destination, r_obj.origin, r_obj.destination):
-                if new_ride.seats > 0:
-                    kb = InlineKeyboardBuilder()
-                    kb.button(text="✅ Взять пассажира", callback_data=f"take_{r_obj.id}_{new_ride.id}")
-                    
-                    username = html.escape(match_user.username or 'скрыт')
-                    match_msg = (
-                        f"🔔 <b>Найден попутчик (по пути)!</b>\n"
-                        f"📍 {html.escape(r_obj.origin)} ➡️ {html.escape(r_obj.destination)}\n"
-                        f"📅 {fmt_date(r_obj.ride_date)} | {r_obj.start_time}\n"
-                        f"👤 @{username}"
-                    )
-                    try:
-                        await m.bot.send_message(m.from_user.id, match_msg, reply_markup=kb.as_markup(), parse_mode="HTML")
-                    except Exception as e:
-                        logger.error(f"Ошибка уведомления водителю: {e}")
+            if new_ride.seats > 0:
+                enqueue_found_passenger(m.from_user.id, new_ride, r_obj, match_user)
 
 async def notify_drivers_about_passenger(m: types.Message, passenger_ride: Ride, passenger_user: User):
-    target_date = passenger_ride.ride_date
-
     async with async_session() as s:
-        drivers_stmt = await s.execute(
-            select(Ride, User).join(User).where(
-                Ride.ride_date == target_date,
-                Ride.role == 'driver',
-                Ride.seats > 0,
-                Ride.user_id != passenger_user.id
-            )
-        )
-        drivers = drivers_stmt.all()
+        drivers = await find_compatible_rides(s, passenger_ride, exclude_user_id=passenger_user.id)
 
         for driver_ride, driver_user in drivers:
-            if not is_route_compatible(driver_ride.origin, driver_ride.destination,
-                                       passenger_ride.origin, passenger_ride.destination):
-                continue
+            enqueue_new_passenger(driver_user.telegram_id, driver_ride, passenger_ride, passenger_user)
 
-            kb = InlineKeyboardBuilder()
-            kb.button(
-                text="✅ Взять пассажира",
-                callback_data=f"take_{passenger_ride.id}_{driver_ride.id}"
-            )
+    # Пассажиру сразу — лучшие из тех же кандидатов, одним сообщением
+    best = rank_drivers(passenger_ride, drivers)
+    if not best:
+        return
+    header = "<b>🚗 Лучшие варианты для вас:</b>\n\n"
+    blocks = [driver_card(r, u) for r, u in best]
+    shown = fit_blocks(header, blocks)
+    await m.answer(join_blocks(header, blocks[:shown]), parse_mode="HTML")
+
+def notify_batch_matches(matches: list, limit: int = BULK_NOTIFY_LIMIT) -> int:
+    """
+    Уведомления по результату match_batch: новые пассажиры — их водителям, новым водителям —
+    карточки попутчиков. Не больше limit карточек на получателя: пачка пассажиров не должна
+    заваливать одного водителя. Возвращает число непоказанных карточек.
+    """
+    shown = {}  # telegram_id получателя -> карточек в очереди
+    skipped = 0
+    for new_ride, new_user, other_ride, other_user in matches:
+        recipient = other_user.telegram_id if new_ride.role == "passenger" else new_user.telegram_id
+        if shown.get(recipient, 0) >= limit:
+            skipped += 1
+            continue
+        shown[recipient] = shown.get(recipient, 0) + 1
+        if new_ride.role == "passenger":
+            enqueue_new_passenger(recipient, other_ride, new_ride, new_user)
+        else:
+            enqueue_found_passenger(recipient, new_ride, other_ride, other_user)
+    return skipped
+
+# --- МАССОВАЯ ЗАГРУЗКА ---
+BULK_HELP = (
+    "📥 <b>Массовая загрузка поездок</b>\n\n"
+    "Пришлите файл CSV или TSV (можно сохранить из Excel). Первая строка — заголовок:\n"
+    "<code>роль;откуда;куда;дата;время;места</code>\n"
+    "<code>водитель;Здравое;Краснодар;25.12.2025;07:30;3</code>\n\n"
+    "Обязательны откуда, куда и дата. Роль по умолчанию — водитель, для водителя нужно время. "
+    "Остановки: {stops}."
+)
 
-            msg = (
-                f"🔔 <b>Для вас найден пассажир!</b>\n"
-                f"📍 {html.escape(passenger_ride.origin)} ➡️ {html.escape(passenger_ride.destination)}\n"
-                f"📅 {fmt_date(passenger_ride.ride_date)} | {passenger_ride.start_time}\n"
-                f"👥 Нужно мест: {passenger_ride.initial_seats}\n"
-                f"👤 Контакт: @{html.escape(passenger_user.username or 'скрыт')}"
-            )
+BULK_FORBIDDEN = "Массовая загрузка доступна только перевозчикам. Напишите администратору, чтобы получить доступ."
 
-            try:
-                await m.bot.send_message(
-                    driver_user.telegram_id,
-                    msg,
-                    reply_markup=kb.as_markup(),
-                    parse_mode="HTML"
-                )
-            except Exception as e:
-                logger.error(f"Ошибка уведомления водителю: {e}")
+@router.message(Command("bulk"))
+async def bulk_start(m: types.Message, state: FSMContext):
+    await state.clear()
+    if m.from_user.id not in BULK_ALLOWED_IDS:
+        return await m.answer(BULK_FORBIDDEN)
+    await state.set_state(BulkImport.waiting_file)
+    # Список остановок берётся из загруженной сети маршрутов
+    await m.answer(BULK_HELP.format(stops=html.escape(", ".join(route_graph.stop_names()))), parse_mode="HTML")
+
+@router.message(BulkImport.waiting_file, F.document)
+async def bulk_import(m: types.Message, state: FSMContext):
+    # Доступ могли отозвать, пока бот ждал файл
+    if m.from_user.id not in BULK_ALLOWED_IDS:
+        await state.clear()
+        return await m.answer(BULK_FORBIDDEN)
+    if m.document.file_size and m.document.file_size > BULK_MAX_FILE_SIZE:
+        return await m.answer(f"❌ Файл больше {BULK_MAX_FILE_SIZE // 1024} КБ, разбейте его на части.")
+
+    started = time.perf_counter()
+    content = (await m.bot.download(m.document)).read()
+    try:
+        rows, errors = parse_bulk_file(content)
+    except BulkFileError as e:
+        return await m.answer(f"❌ Файл не загружен: {e}.")
+
+    # Всё или ничего: повторная загрузка исправленного файла не создаст дублей
+    if errors:
+        lines = [f"строка {line_no}: {html.escape(error)}" for line_no, error in errors[:15]]
+        if len(errors) > 15:
+            lines.append(f"… и ещё {len(errors) - 15}")
+        return await m.answer(
+            f"❌ Файл не загружен, ошибок: {len(errors)}\n\n" + "\n".join(lines), parse_mode="HTML"
+        )
+    if not rows:
+        return await m.answer("❌ В файле нет ни одной поездки.")
+
+    async with async_session() as s:
+        user = await user_cache.get(s, m.from_user.id, username=m.from_user.username)
+        if not user:
+            user = User(telegram_id=m.from_user.id, username=m.from_user.username)
+            s.add(user)
+            await s.commit()
+            user_cache.put(user)
+        created_at, inserted = await insert_rides(s, rows, user_id=user.id)
+        await s.commit()
+        segment_index.add_rows(inserted)
+        route_search_cache.invalidate_rows(inserted)
+        matches = await match_batch(s, created_at, user_id=user.id)
+
+    elapsed = time.perf_counter() - started
+    logger.info(f"📥 Bulk import by {m.from_user.id}: {len(inserted)} rides, {len(matches)} matches in {elapsed:.2f}s ({len(inserted) / elapsed:.0f} rows/s)")
+    await state.clear()
+
+    skipped = notify_batch_matches(matches)
+    summary = f"✅ Загружено поездок: {len(inserted)} за {elapsed:.1f} с.\nНайдено совпадений: {len(matches)}."
+    if skipped:
+        summary += f"\nНе больше {BULK_NOTIFY_LIMIT} уведомлений на получателя, остальные совпадения — в «🔍 Найти поездку» и «📋 Мои поездки»."
+    await m.answer(summary, reply_markup=main_kb())
+
+# --- РЕГУЛЯРНЫЕ ПОЕЗДКИ ---
+@router.callback_query(F.data.startswith("repeat_"))
+async def repeat_ride(cb: types.CallbackQuery):
+    ride_id = int(cb.data.split("_")[1])
+    async with async_session() as s:
+        user = await user_cache.get(s, cb.from_user.id)
+        ride = await s.get(Ride, ride_id)
+        if not user or not ride or ride.user_id != user.id:
+            return await cb.answer("Поездка не найдена", show_alert=True)
+        if ride.template_id:
+            return await cb.answer("Эта поездка уже повторяется", show_alert=True)
+
+        template = RideTemplate(
+            user_id=user.id,
+            role=ride.role,
+            origin=ride.origin,
+            destination=ride.destination,
+            weekday_mask=WEEKDAYS_MASK,
+            start_time=ride.start_time,
+            seats=ride.initial_seats or ride.seats,
+            materialized_until=ride.ride_date
+        )
+        s.add(template)
+        await s.flush()
+        ride.template_id = template.id
+        await s.commit()
+        template_id = template.id
+
+    # Ближайшие будни создаём сразу, не дожидаясь фоновой задачи
+    notify_batch_matches(await materialize_templates(template_ids=[template_id]))
+    await cb.answer("Готово!")
+    await edit_in_place(
+        cb.message,
+        f"🔁 Поездка будет публиковаться по будням на {TEMPLATE_DAYS_AHEAD} дней вперёд.\n"
+        f"Отключить — командой /templates"
+    )
+
+@router.message(Command("templates"))
+async def list_templates(m: types.Message, state: FSMContext):
+    await state.clear()
+    async with async_session() as s:
+        user = await user_cache.get(s, m.from_user.id)
+        if not user:
+            return await m.answer("Сначала нажмите /start")
+        templates = (await s.execute(
+            select(RideTemplate)
+            .where(RideTemplate.user_id == user.id, RideTemplate.active.is_(True))
+            .order_by(RideTemplate.id)
+        )).scalars().all()
+
+    if not templates:
+        return await m.answer("У вас нет регулярных поездок.")
+    kb = InlineKeyboardBuilder()
+    lines = ["🔁 <b>Регулярные поездки (по будням):</b>"]
+    for t in templates:
+        start_time = t.start_time.strftime("%H:%M") if t.start_time else "По договоренности"
+        lines.append(f"📍 {html.escape(t.origin)} ➡️ {html.escape(t.destination)} | {start_time}")
+        kb.row(InlineKeyboardButton(
+            text=f"❌ Отключить {t.origin} ➡️ {t.destination}", callback_data=f"untpl_{t.id}"
+        ))
+    await m.answer("\n".join(lines), reply_markup=kb.as_markup(), parse_mode="HTML")
+
+@router.callback_query(F.data.startswith("untpl_"))
+async def disable_template(cb: types.CallbackQuery):
+    template_id = int(cb.data.split("_")[1])
+    async with async_session() as s:
+        user = await user_cache.get(s, cb.from_user.id)
+        result = await s.execute(
+            update(RideTemplate)
+            .where(RideTemplate.id == template_id, RideTemplate.user_id == (user.id if user else None))
+            .values(active=False)
+        )
+        await s.commit()
+    if not result.rowcount:
+        return await cb.answer("Шаблон не найден", show_alert=True)
+    # Уже созданные поездки остаются — их можно удалить в «📋 Мои поездки»
+    await cb.answer("Повторение отключено. Созданные поездки остались в «📋 Мои поездки»", show_alert=True)
+    await edit_in_place(cb.message, cb.message.html_text + "\n\n❌ Повторение отключено")
 
 # --- CALLBACKS ---
 @router.callback_query(F.data.startswith("take_"))
@@ -468,31 +793,31 @@ async def take_passenger(cb: types.CallbackQuery):
             if not driver_ride or driver_ride.seats <= 0:
                 return await cb.answer("Места закончились🤷🏻‍♂️", show_alert=True)
             
-            new_booking = Booking(
-                driver_ride_id=d_ride_id,
-                passenger_ride_id=p_ride_id,
-                status='pending'
-            )
-            s.add(new_booking)
+            # Идемпотентно: при повторном нажатии или гонке уникальный индекс не даст второй брони,
+            # а пассажира уведомляет только тот, чей INSERT действительно вставил строку
+            booking_id = (await s.execute(
+                dialect_insert(s)(Booking)
+                .values(driver_ride_id=d_ride_id, passenger_ride_id=p_ride_id, status='pending')
+                .on_conflict_do_nothing(index_elements=["driver_ride_id", "passenger_ride_id"])
+                .returning(Booking.id)
+            )).scalar_one_or_none()
             await s.commit()
-            await s.refresh(new_booking)
+            if booking_id is None:
+                return await cb.answer("Вы уже откликались на этого пассажира", show_alert=True)
             
-            p_user_stmt = await s.execute(select(User.telegram_id, User.username).join(Ride).where(Ride.id == p_ride_id))
-            res = p_user_stmt.first()
-            if not res:
+            p_tid = await user_cache.telegram_id_for_ride(s, p_ride_id)
+            if not p_tid:
                 return await cb.answer("Пассажир не найден (удален)", show_alert=True)
             
-            p_tid, p_username = res
-            
             kb = InlineKeyboardBuilder()
-            kb.button(text="🤝 Еду с вами", callback_data=f"confirm_{new_booking.id}")
+            kb.button(text="🤝 Еду с вами", callback_data=f"confirm_{booking_id}")
             
             driver_username = html.escape(cb.from_user.username or 'скрыт')
             match_msg = (
                 f"🔔 <b>Водитель готов вас подвезти!</b>\n"
                 f"📍 {html.escape(driver_ride.origin)} ➡️ {html.escape(driver_ride.destination)}\n"
                 f"📅 Дата: {fmt_date(driver_ride.ride_date)}\n"
-                f"🕒 Время: {driver_ride.start_time}\n"
+                f"🕒 Время: {fmt_time(driver_ride)}\n"
                 f"👤 Контакт: @{driver_username}"
             )
             try:
@@ -513,36 +838,52 @@ async def confirm_booking(cb: types.CallbackQuery):
         booking_id = int(booking_id)
         
         async with async_session() as s:
-            booking = await s.get(Booking, booking_id)
-            if not booking or booking.status != 'pending':
+            # Забираем бронь из pending условным UPDATE: второй параллельный confirm получит пустой результат
+            claim = await s.execute(
+                update(Booking)
+                .where(Booking.id == booking_id, Booking.status == 'pending')
+                .values(status='confirmed')
+                .returning(Booking.driver_ride_id, Booking.passenger_ride_id)
+            )
+            claimed = claim.first()
+            if not claimed:
                 return await cb.answer("Бронирование уже обработано!", show_alert=True)
-            
-            driver_ride = await s.get(Ride, booking.driver_ride_id)
-            if not driver_ride:
-                return await cb.answer("Поездка водителя не найдена", show_alert=True)
+            driver_ride_id, passenger_ride_id = claimed
 
-            passenger_ride = await s.get(Ride, booking.passenger_ride_id)
-            seats_needed = passenger_ride.initial_seats if passenger_ride else 1
+            passenger_ride = await s.get(Ride, passenger_ride_id)
+            seats_needed = passenger_ride.initial_seats if passenger_ride and passenger_ride.initial_seats else 1
 
-            if driver_ride.seats < seats_needed:
-                booking.status = 'rejected'
+            # Проверка и списание мест — один атомарный UPDATE, без чтения в Python
+            reserve = await s.execute(
+                update(Ride)
+                .where(Ride.id == driver_ride_id, Ride.seats >= seats_needed)
+                .values(seats=Ride.seats - seats_needed)
+                .returning(Ride.seats, Ride.start_time, Ride.ride_date, Ride.origin_stop_id, Ride.dest_stop_id)
+            )
+            reserved = reserve.first()
+            if not reserved:
+                await s.execute(update(Booking).where(Booking.id == booking_id).values(status='rejected'))
                 await s.commit()
                 await cb.answer("К сожалению, мест недостаточно!", show_alert=True)
                 await cb.message.edit_text(cb.message.text + "\n\n❌ Недостаточно мест")
                 return
+            remaining_seats, driver_start_time, driver_date, driver_origin_id, driver_dest_id = reserved
             
             # --- ВАЖНОЕ ИЗМЕНЕНИЕ ---
             # Обновляем время у пассажира на время водителя
-            if passenger_ride and driver_ride.start_time != "По договоренности":
-                passenger_ride.start_time = driver_ride.start_time
+            if passenger_ride and driver_start_time:
+                passenger_ride.start_time = driver_start_time
             # ------------------------
 
-            booking.status = 'confirmed'
-            driver_ride.seats -= seats_needed
             await s.commit()
+            # Индекс матчинга: у пассажира теперь время водителя, у водителя могли кончиться места
+            if passenger_ride:
+                segment_index.add(passenger_ride)
+            if remaining_seats <= 0:
+                segment_index.discard(driver_ride_id)
+            route_search_cache.invalidate(driver_date, "driver", driver_origin_id, driver_dest_id)
             
-            d_user_stmt = await s.execute(select(User.telegram_id).join(Ride).where(Ride.id == booking.driver_ride_id))
-            d_tid = d_user_stmt.scalar()
+            d_tid = await user_cache.telegram_id_for_ride(s, driver_ride_id)
             
             if d_tid:
                 await cb.bot.send_message(d_tid, f"🎉 Пассажир подтвердил поездку! Занято мест: {seats_needed}. Приятного пути!")
@@ -557,24 +898,33 @@ async def confirm_booking(cb: types.CallbackQuery):
 @router.callback_query(F.data.startswith("del_"))
 async def delete_ride(cb: types.CallbackQuery):
     try:
-        r_id = int(cb.data.split("_")[1])
+        _, r_id, *page = cb.data.split("_")
+        r_id = int(r_id)
+        cursor = "_".join(page) or None
         async with async_session() as s:
+            user = await user_cache.get(s, cb.from_user.id)
+            u_id = user.id if user else None
             ride = await s.get(Ride, r_id)
-            if ride:
+            if ride and ride.user_id == u_id:
                 # Удаляем зависимости перед удалением самой поездки
                 await s.execute(delete(Booking).where(Booking.driver_ride_id == r_id))
                 await s.execute(delete(Booking).where(Booking.passenger_ride_id == r_id))
                 
                 await s.delete(ride)
                 await s.commit()
+                segment_index.discard(r_id)
+                route_search_cache.invalidate(ride.ride_date, ride.role, ride.origin_stop_id, ride.dest_stop_id)
                 await cb.answer("Поездка удалена")
-                await cb.message.delete()
             else:
                 await cb.answer("Поездка уже удалена", show_alert=True)
-                try:
-                    await cb.message.delete()
-                except:
-                    pass
+
+        if not u_id:
+            return
+        # Перерисовываем текущую страницу списка; если она опустела — первую
+        text, kb = await render_user_rides(u_id, cursor)
+        if not text and cursor:
+            text, kb = await render_user_rides(u_id)
+        await edit_in_place(cb.message, text or "У вас пока нет активных поездок.", kb)
     except Exception as e:
         logger.error(f"Error in delete_ride: {e}")
         await cb.answer("Ошибка при удалении")
@@ -0,0 +1,56 @@
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.methods import GetUpdates
+from aiogram.types import TelegramObject
+
+from src.services.health import health
+from src.services.metrics import HANDLER_SECONDS
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Гистограмма времени каждого хендлера роутера; сами хендлеры не меняются"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object else "unknown"
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            return await handler(event, data)
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, handler=name, status=status)
+
+
+class UpdateTrackerMiddleware(BaseMiddleware):
+    """Внешний middleware на dp.update: время последнего успешно обработанного апдейта для /readyz"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        result = await handler(event, data)
+        health.mark_update()
+        return result
+
+
+class PollingTrackerMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: время последнего успешного getUpdates — polling жив, даже когда апдейтов нет"""
+
+    async def __call__(self, make_request, bot, method):
+        response = await make_request(bot, method)
+        if isinstance(method, GetUpdates):
+            health.mark_poll()
+        return response
@@ -0,0 +1,17 @@
+# Telegram не принимает сообщения длиннее 4096 символов
+MESSAGE_LIMIT = 4096
+SEPARATOR = "\n\n"
+
+
+def fit_blocks(header: str, blocks: list, limit: int = MESSAGE_LIMIT) -> int:
+    """Сколько первых блоков поместится в одно сообщение вместе с заголовком (минимум один)"""
+    length = len(header)
+    for i, block in enumerate(blocks):
+        length += len(block) + (len(SEPARATOR) if i else 0)
+        if length > limit:
+            return max(i, 1)
+    return len(blocks)
+
+
+def join_blocks(header: str, blocks: list) -> str:
+    return header + SEPARATOR.join(blocks)
@@ -0,0 +1,188 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from sqlalchemy import delete
+
+from src.config import FSM_FLUSH_INTERVAL, FSM_CACHE_TTL, FSM_STATE_TTL
+from src.database.models import FSMRecord
+from src.database.session import dialect_insert
+
+logger = logging.getLogger(__name__)
+
+
+class _Entry:
+    __slots__ = ("state", "data", "loaded_at")
+
+    def __init__(self, state: Optional[str], data: Dict[str, Any]):
+        self.state = state
+        self.data = data
+        self.loaded_at = time.monotonic()
+
+
+class SQLAlchemyStorage(BaseStorage):
+    """
+    FSM-хранилище aiogram в таблице fsm_states с write-behind кэшем в процессе.
+    Изменения копятся в памяти и пишутся одним upsert раз в FSM_FLUSH_INTERVAL секунд.
+    Прочитанная запись живёт в кэше FSM_CACHE_TTL секунд, так что get_state на каждый апдейт
+    (и на каждое нажатие клавиши в inline-режиме) не ходит в БД; запись с незаписанными
+    изменениями из кэша не вытесняется. Диалоги без активности дольше FSM_STATE_TTL удаляются.
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        flush_interval: float = FSM_FLUSH_INTERVAL,
+        cache_ttl: int = FSM_CACHE_TTL,
+        state_ttl: int = FSM_STATE_TTL
+    ):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        self.cache_ttl = cache_ttl
+        self.state_ttl = state_ttl
+        self._cache = OrderedDict()  # key -> _Entry
+        self._dirty = set()
+        self._flushing = set()  # ключи, которые сейчас пишутся: в БД их ещё нет
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+        self._last_purge = 0.0
+
+    @staticmethod
+    def _make_key(key: StorageKey) -> str:
+        return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.destiny}"
+
+    async def start(self):
+        if not self._task:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                if time.monotonic() - self._last_purge > 3600:
+                    await self.purge_expired()
+            except Exception as e:
+                logger.error(f"Ошибка записи FSM: {e}")
+
+    def _pinned(self, k: str, entry: _Entry) -> bool:
+        """Запись из кэша главнее БД: есть незаписанные изменения или она ещё свежая"""
+        return k in self._dirty or k in self._flushing or time.monotonic() - entry.loaded_at < self.cache_ttl
+
+    async def _entry(self, key: StorageKey) -> _Entry:
+        k = self._make_key(key)
+        entry = self._cache.get(k)
+        if entry and self._pinned(k, entry):
+            self._cache.move_to_end(k)
+            return entry
+
+        async with self.session_factory() as s:
+            record = await s.get(FSMRecord, k)
+        # Пока шло чтение, параллельный set_state/set_data мог изменить запись (или другой
+        # вызов уже перечитал её) — тогда прочитанное из БД устарело
+        current = self._cache.get(k)
+        if current is not None and (current is not entry or self._pinned(k, current)):
+            return current
+        if record:
+            entry = _Entry(record.state, json.loads(record.data) if record.data else {})
+        else:
+            entry = _Entry(None, {})
+        self._cache[k] = entry
+        self._evict_clean()
+        return entry
+
+    def _evict_clean(self):
+        """Выкидывает из кэша чистые записи, которые уже не нужны (их всё равно перечитаем)"""
+        while self._cache:
+            k, entry = next(iter(self._cache.items()))
+            if self._pinned(k, entry):
+                break
+            del self._cache[k]
+
+    def _mark_dirty(self, key: StorageKey, entry: _Entry):
+        k = self._make_key(key)
+        entry.loaded_at = time.monotonic()
+        self._cache[k] = entry
+        self._cache.move_to_end(k)
+        self._dirty.add(k)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        entry = await self._entry(key)
+        entry.state = state.state if isinstance(state, State) else state
+        self._mark_dirty(key, entry)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._entry(key)).state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        entry = await self._entry(key)
+        entry.data = dict(data)
+        self._mark_dirty(key, entry)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return dict((await self._entry(key)).data)
+
+    async def flush(self):
+        """Пишет накопленные изменения: один upsert для живых диалогов и один delete для очищенных"""
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            keys, self._dirty = self._dirty, set()
+            self._flushing = keys
+            rows, cleared = [], []
+            now = datetime.now()
+            for k in keys:
+                entry = self._cache.get(k)
+                if entry is None or (entry.state is None and not entry.data):
+                    cleared.append(k)
+                else:
+                    rows.append({
+                        "key": k,
+                        "state": entry.state,
+                        "data": json.dumps(entry.data, ensure_ascii=False, default=str),
+                        "updated_at": now
+                    })
+            try:
+                async with self.session_factory() as s:
+                    if cleared:
+                        await s.execute(delete(FSMRecord).where(FSMRecord.key.in_(cleared)))
+                    if rows:
+                        stmt = dialect_insert(s)(FSMRecord).values(rows)
+                        stmt = stmt.on_conflict_do_update(
+                            index_elements=[FSMRecord.key],
+                            set_={
+                                "state": stmt.excluded.state,
+                                "data": stmt.excluded.data,
+                                "updated_at": stmt.excluded.updated_at
+                            }
+                        )
+                        await s.execute(stmt)
+                    await s.commit()
+            except Exception:
+                # Не теряем изменения: попробуем записать их в следующий раз
+                self._dirty |= keys
+                raise
+            finally:
+                self._flushing = set()
+
+    async def purge_expired(self):
+        """Удаляет брошенные диалоги старше FSM_STATE_TTL"""
+        self._last_purge = time.monotonic()
+        limit = datetime.now() - timedelta(seconds=self.state_ttl)
+        async with self.session_factory() as s:
+            result = await s.execute(delete(FSMRecord).where(FSMRecord.updated_at < limit))
+            await s.commit()
+        if result.rowcount:
+            logger.info(f"🧹 Удалено устаревших FSM-диалогов: {result.rowcount}")
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
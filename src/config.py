@@ -7,3 +7,114 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 DATABASE_URL = os.getenv("DATABASE_URL")
 PROTALK_TOKEN = os.getenv("PROTALK_TOKEN")
 PROTALK_BOT_ID = os.getenv("PROTALK_BOT_ID")
+
+# Горячее окно индекса маршрутов: сколько дней вперёд держать в памяти и как часто перечитывать из БД
+MATCH_INDEX_DAYS = int(os.getenv("MATCH_INDEX_DAYS", "3"))
+MATCH_INDEX_TTL = int(os.getenv("MATCH_INDEX_TTL", "60"))
+
+# HTTP-клиент pro-talk: пул соединений, таймауты (секунды) и лимит одновременных запросов
+NLU_POOL_SIZE = int(os.getenv("NLU_POOL_SIZE", "20"))
+NLU_MAX_CONCURRENCY = int(os.getenv("NLU_MAX_CONCURRENCY", "10"))
+NLU_DNS_TTL = int(os.getenv("NLU_DNS_TTL", "300"))
+NLU_CONNECT_TIMEOUT = float(os.getenv("NLU_CONNECT_TIMEOUT", "5"))
+NLU_READ_TIMEOUT = float(os.getenv("NLU_READ_TIMEOUT", "30"))
+
+# Отправлять системную инструкцию pro-talk только в начале диалога (и при смене даты/роли)
+NLU_INSTRUCTION_ONCE = os.getenv("NLU_INSTRUCTION_ONCE", "1") == "1"
+NLU_CONVERSATION_TTL = int(os.getenv("NLU_CONVERSATION_TTL", "3600"))
+
+# Кэш ответов NLU; NLU_CACHE_SQLITE_PATH включает общий файловый бэкенд для нескольких реплик
+NLU_CACHE_SIZE = int(os.getenv("NLU_CACHE_SIZE", "1000"))
+NLU_CACHE_TTL = int(os.getenv("NLU_CACHE_TTL", "3600"))
+NLU_CACHE_SQLITE_PATH = os.getenv("NLU_CACHE_SQLITE_PATH")
+
+# Webhook-режим (опционально): включается, если задан публичный адрес сервиса
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # например https://<service>.onrender.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # обязателен в webhook-режиме, без него бот не запустится
+
+# FSM-хранилище: "sql" — в таблице fsm_states (переживает рестарт, общее для реплик), "memory" — в процессе
+FSM_STORAGE = os.getenv("FSM_STORAGE", "sql")
+FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", "1"))
+# FSM_CACHE_TTL: сколько секунд доверять прочитанному состоянию без перечитывания из БД. Столько же
+# реплика может не видеть изменение, записанное другой; 0 — перечитывать при каждом обращении
+FSM_CACHE_TTL = int(os.getenv("FSM_CACHE_TTL", "30"))
+FSM_STATE_TTL = int(os.getenv("FSM_STATE_TTL", "86400"))
+
+# Очередь уведомлений: общий лимит Bot API (сообщений/сек), интервал на один чат (сек), параллельность
+NOTIFY_GLOBAL_RATE = float(os.getenv("NOTIFY_GLOBAL_RATE", "25"))
+NOTIFY_CHAT_INTERVAL = float(os.getenv("NOTIFY_CHAT_INTERVAL", "1"))
+NOTIFY_CONCURRENCY = int(os.getenv("NOTIFY_CONCURRENCY", "8"))
+NOTIFY_MAX_RETRIES = int(os.getenv("NOTIFY_MAX_RETRIES", "3"))
+NOTIFY_DEDUP_TTL = int(os.getenv("NOTIFY_DEDUP_TTL", "600"))
+NOTIFY_QUEUE_SIZE = int(os.getenv("NOTIFY_QUEUE_SIZE", "10000"))
+
+# Кэш telegram_id -> User
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "600"))
+
+# Кэш выдачи /find по (маршрут, дата); сбрасывается при изменении поездок на маршруте
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "1000"))
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", "30"))
+
+# Inline-режим (@bot Здравое Краснодар): кэш ответов по тексту запроса и число маршрутов в ответе
+INLINE_CACHE_SIZE = int(os.getenv("INLINE_CACHE_SIZE", "5000"))
+INLINE_CACHE_TTL = int(os.getenv("INLINE_CACHE_TTL", "10"))
+INLINE_MAX_ROUTES = int(os.getenv("INLINE_MAX_ROUTES", "3"))
+
+# Фоновая очистка: удаляются поездки с ride_date старше CLEANUP_KEEP_DAYS дней, пачками по CLEANUP_BATCH_SIZE
+CLEANUP_INTERVAL = int(os.getenv("CLEANUP_INTERVAL", "43200"))
+CLEANUP_BATCH_SIZE = int(os.getenv("CLEANUP_BATCH_SIZE", "500"))
+CLEANUP_BATCH_PAUSE = float(os.getenv("CLEANUP_BATCH_PAUSE", "0.05"))
+CLEANUP_KEEP_DAYS = int(os.getenv("CLEANUP_KEEP_DAYS", "2"))
+CLEANUP_ARCHIVE = os.getenv("CLEANUP_ARCHIVE", "0") == "1"
+
+# Предохранитель pro-talk: окно статистики (сек), минимум вызовов в окне, пороги доли ошибок
+# и медленных (дольше NLU_BREAKER_SLOW_CALL сек) вызовов; через NLU_BREAKER_RESET сек — пробные запросы
+NLU_BREAKER_WINDOW = float(os.getenv("NLU_BREAKER_WINDOW", "60"))
+NLU_BREAKER_MIN_CALLS = int(os.getenv("NLU_BREAKER_MIN_CALLS", "5"))
+NLU_BREAKER_ERROR_RATE = float(os.getenv("NLU_BREAKER_ERROR_RATE", "0.5"))
+NLU_BREAKER_SLOW_CALL = float(os.getenv("NLU_BREAKER_SLOW_CALL", "15"))
+NLU_BREAKER_SLOW_RATE = float(os.getenv("NLU_BREAKER_SLOW_RATE", "0.8"))
+NLU_BREAKER_RESET = float(os.getenv("NLU_BREAKER_RESET", "30"))
+NLU_BREAKER_PROBES = int(os.getenv("NLU_BREAKER_PROBES", "1"))
+
+# Хеджирование: если ответа на самодостаточное сообщение нет NLU_HEDGE_DELAY сек, отправить копию (0 — выкл.)
+NLU_HEDGE_DELAY = float(os.getenv("NLU_HEDGE_DELAY", "0"))
+
+# /readyz: кэш результата проверок (сек), таймаут SELECT 1, допустимый возраст последнего апдейта
+# и последнего успешного getUpdates (0 — не проверять)
+HEALTH_CACHE_TTL = float(os.getenv("HEALTH_CACHE_TTL", "5"))
+HEALTH_DB_TIMEOUT = float(os.getenv("HEALTH_DB_TIMEOUT", "2"))
+HEALTH_MAX_UPDATE_AGE = int(os.getenv("HEALTH_MAX_UPDATE_AGE", "0"))
+HEALTH_MAX_POLL_AGE = int(os.getenv("HEALTH_MAX_POLL_AGE", "120"))
+HEALTH_REQUIRE_NLU = os.getenv("HEALTH_REQUIRE_NLU", "0") == "1"
+
+# Пул соединений Postgres: размер, переполнение, ожидание свободного соединения (сек),
+# пересоздание соединений старше DB_POOL_RECYCLE сек и проверка соединения перед выдачей
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "300"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+DB_POOL_WARM = int(os.getenv("DB_POOL_WARM", "2"))
+# Кэш выражений asyncpg и подготовленных выражений SQLAlchemy (0 — выключить, нужно за pgbouncer)
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+DB_PREPARED_STATEMENT_CACHE_SIZE = int(os.getenv("DB_PREPARED_STATEMENT_CACHE_SIZE", "100"))
+
+# Массовая загрузка поездок (/bulk): лимиты файла, размер пачки INSERT и сколько карточек совпадений слать
+BULK_MAX_ROWS = int(os.getenv("BULK_MAX_ROWS", "10000"))
+BULK_MAX_FILE_SIZE = int(os.getenv("BULK_MAX_FILE_SIZE", str(2 * 1024 * 1024)))
+BULK_INSERT_CHUNK = int(os.getenv("BULK_INSERT_CHUNK", "1000"))
+BULK_NOTIFY_LIMIT = int(os.getenv("BULK_NOTIFY_LIMIT", "30"))
+# Telegram id перевозчиков и админов, которым доступен /bulk (через запятую); пусто — никому
+BULK_ALLOWED_IDS = {int(x) for x in os.getenv("BULK_ALLOWED_IDS", "").replace(",", " ").split()}
+
+# Регулярные поездки: на сколько дней вперёд создавать поездки по шаблонам и как часто проверять (сек)
+TEMPLATE_DAYS_AHEAD = int(os.getenv("TEMPLATE_DAYS_AHEAD", "7"))
+TEMPLATE_INTERVAL = int(os.getenv("TEMPLATE_INTERVAL", "3600"))
+
+# Допустимая разница времени выезда водителя и пассажира (мин) при подборе попутчиков
+MATCH_TIME_TOLERANCE = int(os.getenv("MATCH_TIME_TOLERANCE", "90"))
+# Сколько лучших водителей показывать пассажиру сразу после создания заявки
+MATCH_TOP_N = int(os.getenv("MATCH_TOP_N", "5"))
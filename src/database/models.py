@@ -1,7 +1,47 @@
-from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Date, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, Text, Boolean, DateTime, Date, Time, ForeignKey, Index, and_, event
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .session import Base
+from src.services.routes import route_graph
+
+
+class Stop(Base):
+    """Остановка сети маршрутов; aliases — другие написания через запятую (падежи, сокращения)"""
+    __tablename__ = "stops"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, unique=True, nullable=False)
+    aliases = Column(Text, nullable=True)
+
+    def __repr__(self):
+        return f"Stop(id={self.id}, name={self.name})"
+
+
+class RouteLine(Base):
+    """Маршрут (коридор или ветка): упорядоченный список остановок в route_stops, ездят в обе стороны"""
+    __tablename__ = "routes"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, unique=True, nullable=False)
+
+    def __repr__(self):
+        return f"RouteLine(id={self.id}, name={self.name})"
+
+
+class RouteStop(Base):
+    __tablename__ = "route_stops"
+
+    route_id = Column(Integer, ForeignKey("routes.id", ondelete="CASCADE"), primary_key=True)
+    position = Column(Integer, primary_key=True)
+    stop_id = Column(Integer, ForeignKey("stops.id"), nullable=False)
+
+    __table_args__ = (
+        # Пакетный матчинг: позиции остановки на маршруте
+        Index("ix_route_stops_stop", "stop_id", "route_id", "position"),
+    )
+
+    def __repr__(self):
+        return f"RouteStop(route_id={self.route_id}, position={self.position}, stop_id={self.stop_id})"
 
 
 class User(Base):
@@ -29,11 +69,36 @@ class Ride(Base):
     origin = Column(String, nullable=False)
     destination = Column(String, nullable=False)
     ride_date = Column(Date, nullable=False)  # ← DATE вместо String
-    start_time = Column(String, nullable=True)
+    start_time = Column(Time, nullable=True)  # NULL — время не указано
     initial_seats = Column(Integer, nullable=True)
     seats = Column(Integer, default=1)
     raw_text = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.now)
+
+    # Остановки сети маршрутов, определяются один раз при записи; NULL — остановка не распознана
+    origin_stop_id = Column(Integer, ForeignKey("stops.id"), nullable=True)
+    dest_stop_id = Column(Integer, ForeignKey("stops.id"), nullable=True)
+
+    # Шаблон, из которого поездка создана автоматически (см. RideTemplate)
+    template_id = Column(Integer, ForeignKey("ride_templates.id", ondelete="SET NULL"), nullable=True)
+
+    __table_args__ = (
+        # Матчинг: ride_date == X AND role == ... AND (origin_stop_id, dest_stop_id) IN (...)
+        Index("ix_rides_stop_pair", "ride_date", "role", "origin_stop_id", "dest_stop_id"),
+        # find_rides: только водители со свободными местами, от сегодня, в порядке выдачи
+        Index(
+            "ix_rides_open_drivers", ride_date, created_at.desc(),
+            postgresql_where=and_(role == "driver", seats > 0),
+            sqlite_where=and_(role == "driver", seats > 0)
+        ),
+        # list_rides и поиск последней роли пользователя
+        Index("ix_rides_user_date", "user_id", "ride_date"),
+        Index("ix_rides_user_created", "user_id", "created_at"),
+        # Фоновая очистка
+        Index("ix_rides_created_at", "created_at"),
+        # Одна поездка шаблона на дату: повторная материализация (или другая реплика) не создаст дублей
+        Index("uq_rides_template_date", "template_id", "ride_date", unique=True),
+    )
     
     # Relationships
     user = relationship("User", back_populates="rides")
@@ -44,14 +109,55 @@ class Ride(Base):
         return f"Ride(id={self.id}, role={self.role}, {self.origin}->{self.destination})"
 
 
+@event.listens_for(Ride, "before_insert")
+def _fill_route_stops(mapper, connection, ride):
+    if ride.origin_stop_id is None:
+        ride.origin_stop_id, ride.dest_stop_id = route_graph.resolve_pair(ride.origin, ride.destination)
+
+
+class RideTemplate(Base):
+    """Регулярная поездка: по дням недели из weekday_mask поездки создаются заранее (src/services/templates.py)"""
+    __tablename__ = "ride_templates"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    role = Column(String, nullable=False)
+    origin = Column(String, nullable=False)
+    destination = Column(String, nullable=False)
+    weekday_mask = Column(Integer, nullable=False)  # бит 0 — понедельник, ..., бит 6 — воскресенье
+    start_time = Column(Time, nullable=True)
+    seats = Column(Integer, nullable=False, default=1)
+    origin_stop_id = Column(Integer, ForeignKey("stops.id"), nullable=True)
+    dest_stop_id = Column(Integer, ForeignKey("stops.id"), nullable=True)
+    active = Column(Boolean, default=True, index=True)
+    materialized_until = Column(Date, nullable=True)  # поездки по эту дату включительно уже созданы
+    created_at = Column(DateTime, default=datetime.now)
+
+    user = relationship("User")
+
+    def __repr__(self):
+        return f"RideTemplate(id={self.id}, role={self.role}, {self.origin}->{self.destination}, mask={self.weekday_mask:07b})"
+
+
+@event.listens_for(RideTemplate, "before_insert")
+def _fill_template_stops(mapper, connection, template):
+    if template.origin_stop_id is None:
+        template.origin_stop_id, template.dest_stop_id = route_graph.resolve_pair(template.origin, template.destination)
+
+
 class Booking(Base):
     __tablename__ = "bookings"
     
     id = Column(Integer, primary_key=True, index=True)
-    driver_ride_id = Column(Integer, ForeignKey("rides.id"), nullable=False)
-    passenger_ride_id = Column(Integer, ForeignKey("rides.id"), nullable=False)
+    driver_ride_id = Column(Integer, ForeignKey("rides.id", ondelete="CASCADE"), nullable=False)  # индекс — префикс uq_bookings_pair
+    passenger_ride_id = Column(Integer, ForeignKey("rides.id", ondelete="CASCADE"), nullable=False, index=True)
     status = Column(String, default='pending')  # pending, confirmed, rejected
-    created_at = Column(DateTime, default=datetime.now)
+    created_at = Column(DateTime, default=datetime.now, index=True)
+
+    __table_args__ = (
+        # Один отклик водителя на одного пассажира: повторное "Взять пассажира" не плодит брони
+        Index("uq_bookings_pair", "driver_ride_id", "passenger_ride_id", unique=True),
+    )
     
     # Relationships
     driver_ride = relationship("Ride", foreign_keys=[driver_ride_id], back_populates="driver_bookings")
@@ -59,3 +165,38 @@ class Booking(Base):
     
     def __repr__(self):
         return f"Booking(id={self.id}, driver_ride_id={self.driver_ride_id}, status={self.status})"
+
+
+class RideArchive(Base):
+    """История поездок, убранных фоновой очисткой (если включён CLEANUP_ARCHIVE)"""
+    __tablename__ = "rides_archive"
+
+    id = Column(Integer, primary_key=True)
+    # id из rides: SQLite переиспользует id удалённых поездок, поэтому это не ключ архива
+    ride_id = Column(Integer, nullable=False, index=True)
+    user_id = Column(Integer, nullable=False, index=True)
+    role = Column(String, nullable=False)
+    origin = Column(String, nullable=False)
+    destination = Column(String, nullable=False)
+    ride_date = Column(Date, nullable=False, index=True)
+    start_time = Column(Time, nullable=True)
+    initial_seats = Column(Integer, nullable=True)
+    seats = Column(Integer, nullable=True)
+    created_at = Column(DateTime, nullable=True)
+    archived_at = Column(DateTime, default=datetime.now)
+
+    def __repr__(self):
+        return f"RideArchive(id={self.id}, ride_id={self.ride_id}, role={self.role}, {self.origin}->{self.destination})"
+
+
+class FSMRecord(Base):
+    """Состояние и данные FSM aiogram (см. src/bot/storage.py)"""
+    __tablename__ = "fsm_states"
+
+    key = Column(String, primary_key=True)  # bot:chat:user:thread:destiny
+    state = Column(String, nullable=True)
+    data = Column(Text, nullable=True)  # JSON
+    updated_at = Column(DateTime, default=datetime.now, index=True)
+
+    def __repr__(self):
+        return f"FSMRecord(key={self.key}, state={self.state})"
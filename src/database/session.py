@@ -1,7 +1,16 @@
+import asyncio
 import os
+from sqlalchemy import Time, inspect, select, text, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import declarative_base
 
+from src.config import (
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING,
+    DB_STATEMENT_CACHE_SIZE, DB_PREPARED_STATEMENT_CACHE_SIZE, DB_POOL_WARM
+)
+
 # Создаём Base для моделей
 Base = declarative_base()
 
@@ -17,7 +26,21 @@ if DATABASE_URL:
         DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
     
     print(f"DEBUG: Connecting to DB with scheme: {DATABASE_URL.split(':')[0]}")
-    engine = create_async_engine(DATABASE_URL, echo=False)
+    engine = create_async_engine(
+        DATABASE_URL,
+        echo=False,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        # Render закрывает простаивающие соединения: пересоздаём их заранее и проверяем перед выдачей
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        connect_args={
+            # Кэш asyncpg и кэш подготовленных выражений SQLAlchemy; за pgbouncer оба ставят в 0
+            "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+            "prepared_statement_cache_size": DB_PREPARED_STATEMENT_CACHE_SIZE,
+        }
+    )
 else:
     # Fallback на SQLite для локальной разработки
     print("DEBUG: Using SQLite database")
@@ -32,8 +55,216 @@ async_session = async_sessionmaker(
 )
 
 
+def dialect_insert(session):
+    """insert() текущего диалекта — для on_conflict_do_update / on_conflict_do_nothing"""
+    return pg_insert if session.bind.dialect.name == "postgresql" else sqlite_insert
+
+
+def _dedupe_bookings(sync_conn):
+    """Перед уникальным индексом на (driver_ride_id, passenger_ride_id) убираем дубли откликов"""
+    sync_conn.execute(text(
+        "DELETE FROM bookings WHERE id NOT IN "
+        "(SELECT MIN(id) FROM bookings GROUP BY driver_ride_id, passenger_ride_id)"
+    ))
+
+
+# Подготовка данных перед созданием индекса, который на старых данных может не создаться
+_INDEX_FIXUPS = {
+    "uq_bookings_pair": _dedupe_bookings,
+}
+
+
+# Индексы, которые больше не нужны моделям: на старых базах удаляются, чтобы не тормозить запись
+_OBSOLETE_INDEXES = {
+    "rides": ["ix_rides_route_segment"],
+}
+
+# Колонки, убранные из моделей: флаг time_flexible дублировал start_time IS NULL
+_OBSOLETE_COLUMNS = {
+    "rides": ["time_flexible"],
+    "rides_archive": ["time_flexible"],
+}
+
+
+def _upgrade_schema(sync_conn) -> set:
+    """
+    Доводит существующие таблицы до моделей: добавляет недостающие колонки и индексы.
+    create_all создаёт только новые таблицы, поэтому старые деплои обновляются здесь.
+    Возвращает множество добавленных колонок вида "table.column".
+    """
+    inspector = inspect(sync_conn)
+    added = set()
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        for name in _OBSOLETE_COLUMNS.get(table.name, []):
+            if name in existing:
+                sync_conn.execute(text(f"ALTER TABLE {table.name} DROP COLUMN {name}"))
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            col_type = column.type.compile(dialect=sync_conn.dialect)
+            sync_conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}"))
+            added.add(f"{table.name}.{column.name}")
+        existing_indexes = {i["name"] for i in inspector.get_indexes(table.name)}
+        for name in _OBSOLETE_INDEXES.get(table.name, []):
+            if name in existing_indexes:
+                sync_conn.execute(text(f"DROP INDEX {name}"))
+        for index in table.indexes:
+            if index.name in existing_indexes:
+                continue
+            if index.name in _INDEX_FIXUPS:
+                _INDEX_FIXUPS[index.name](sync_conn)
+            index.create(sync_conn)
+    return added
+
+
+def _load_route_network(sync_conn):
+    """
+    Заполняет stops / routes / route_stops начальной сетью, если они пустые,
+    и загружает сеть в route_graph (один раз при старте).
+    """
+    from src.services.routes import DEFAULT_STOPS, DEFAULT_ROUTES, route_graph
+
+    stops = Base.metadata.tables["stops"]
+    routes = Base.metadata.tables["routes"]
+    route_stops = Base.metadata.tables["route_stops"]
+
+    if sync_conn.execute(select(stops.c.id).limit(1)).first() is None:
+        sync_conn.execute(stops.insert(), [
+            {"name": name, "aliases": ",".join(aliases)} for name, aliases in DEFAULT_STOPS.items()
+        ])
+        stop_ids = dict(sync_conn.execute(select(stops.c.name, stops.c.id)).all())
+        for name, seq in DEFAULT_ROUTES.items():
+            route_id = sync_conn.execute(routes.insert().values(name=name)).inserted_primary_key[0]
+            sync_conn.execute(route_stops.insert(), [
+                {"route_id": route_id, "position": pos, "stop_id": stop_ids[stop]} for pos, stop in enumerate(seq)
+            ])
+        print(f"✅ Route network seeded: {len(DEFAULT_STOPS)} stops, {len(DEFAULT_ROUTES)} routes")
+
+    route_graph.load(
+        [
+            (stop_id, name, [a for a in (aliases or "").split(",") if a.strip()])
+            for stop_id, name, aliases in sync_conn.execute(select(stops.c.id, stops.c.name, stops.c.aliases)).all()
+        ],
+        sync_conn.execute(select(route_stops.c.route_id, route_stops.c.stop_id, route_stops.c.position)).all()
+    )
+    print(f"✅ Route graph loaded: {len(route_graph.names)} stops, {len(route_graph.routes)} routes")
+
+
+def _backfill_stop_ids(sync_conn):
+    """Заполняет origin_stop_id/dest_stop_id у поездок и шаблонов, созданных до появления сети маршрутов"""
+    from src.services.routes import route_graph
+
+    for table_name in ("rides", "ride_templates"):
+        table = Base.metadata.tables[table_name]
+        pairs = sync_conn.execute(
+            select(table.c.origin, table.c.destination).where(table.c.origin_stop_id.is_(None)).distinct()
+        ).all()
+        # Одно UPDATE на уникальный маршрут, а не на поездку
+        for origin, destination in pairs:
+            origin_id, dest_id = route_graph.resolve_pair(origin, destination)
+            if origin_id is None:
+                continue
+            sync_conn.execute(
+                update(table)
+                .where(table.c.origin == origin, table.c.destination == destination, table.c.origin_stop_id.is_(None))
+                .values(origin_stop_id=origin_id, dest_stop_id=dest_id)
+            )
+    print("✅ Stop ids backfilled")
+
+
+def _migrate_archive_ids(sync_conn):
+    """
+    rides_archive.id раньше был id поездки. Переносим его в ride_id, а id остаётся суррогатным ключом;
+    в Postgres сдвигаем его последовательность, которую явные id не продвигали.
+    """
+    sync_conn.execute(text("UPDATE rides_archive SET ride_id = id WHERE ride_id IS NULL"))
+    if sync_conn.dialect.name == "postgresql":
+        sync_conn.execute(text(
+            "SELECT setval(pg_get_serial_sequence('rides_archive', 'id'), "
+            "COALESCE((SELECT MAX(id) FROM rides_archive), 0) + 1, false)"
+        ))
+    print("✅ rides_archive.ride_id backfilled")
+
+
+def _start_time_is_legacy(sync_conn) -> bool:
+    """Есть ли в rides.start_time значения старого строкового формата"""
+    column = next(c for c in inspect(sync_conn).get_columns("rides") if c["name"] == "start_time")
+    if isinstance(column["type"], Time):
+        return False
+    if sync_conn.dialect.name == "postgresql":
+        return True
+    # SQLite тип колонки не меняет: после миграции в ней строки "HH:MM:SS.ffffff"
+    return sync_conn.execute(text(
+        "SELECT 1 FROM rides WHERE start_time IS NOT NULL "
+        "AND start_time NOT GLOB '[0-9][0-9]\\:[0-9][0-9]\\:[0-9][0-9]*' LIMIT 1"
+    )).first() is not None
+
+
+def _migrate_start_time(sync_conn):
+    """
+    rides.start_time раньше был строкой ("18:00" или "По договоренности").
+    Переводим его в TIME, а "По договоренности" и мусор — в NULL.
+    """
+    if sync_conn.dialect.name == "postgresql":
+        sync_conn.execute(text(
+            "ALTER TABLE rides ALTER COLUMN start_time TYPE TIME USING "
+            "(CASE WHEN start_time ~ '^[0-9]{1,2}:[0-9]{2}$' THEN start_time::time END)"
+        ))
+    else:
+        # SQLite не меняет тип колонки, но SQLAlchemy читает TIME из строки "HH:MM:SS.ffffff";
+        # "\:" — литеральное двоеточие, иначе text() примет ":00" за параметр
+        sync_conn.execute(text(
+            "UPDATE rides SET start_time = CASE "
+            "WHEN start_time GLOB '[0-9]:[0-9][0-9]' THEN '0' || start_time || '\\:00.000000' "
+            "WHEN start_time GLOB '[0-9][0-9]:[0-9][0-9]' THEN start_time || '\\:00.000000' "
+            "END "
+            "WHERE start_time NOT GLOB '[0-9][0-9]\\:[0-9][0-9]\\:[0-9][0-9]*'"
+        ))
+    print("✅ rides.start_time migrated to TIME")
+
+
+def pool_stats() -> dict:
+    """Загрузка пула соединений (для /metrics)"""
+    pool = engine.pool
+    if not hasattr(pool, "checkedout"):
+        return {}
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+    }
+
+
+async def warm_pool(connections: int = DB_POOL_WARM):
+    """Открывает соединения заранее, чтобы первые апдейты после старта не ждали подключения"""
+    pool = engine.pool
+    # Греть имеет смысл только пул с очередью (Postgres, файловая SQLite), не StaticPool/NullPool
+    if connections <= 0 or not hasattr(pool, "checkedout"):
+        return
+
+    async def _touch():
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    # Соединения держатся одновременно, иначе пул отдавал бы одно и то же
+    await asyncio.gather(*(_touch() for _ in range(min(connections, pool.size()))))
+    print(f"✅ DB pool warmed: {pool_stats()}")
+
+
 async def init_models():
     """Создание таблиц в базе данных"""
     async with engine.begin() as conn:
+        added = await conn.run_sync(_upgrade_schema)
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_load_route_network)
+        if "rides.origin_stop_id" in added:
+            await conn.run_sync(_backfill_stop_ids)
+        if "rides_archive.ride_id" in added:
+            await conn.run_sync(_migrate_archive_ids)
+        if await conn.run_sync(_start_time_is_legacy):
+            await conn.run_sync(_migrate_start_time)
     print("✅ Database tables created/verified")
@@ -0,0 +1,239 @@
+import csv
+import io
+import logging
+from datetime import date, datetime
+
+from sqlalchemy import and_, exists, or_, select
+from sqlalchemy.orm import aliased
+
+from src.config import BULK_MAX_ROWS, BULK_INSERT_CHUNK
+from src.database.models import User, Ride, RouteStop
+from src.database.session import dialect_insert
+from src.services.routes import route_graph
+from src.services.matching import time_compatible
+
+logger = logging.getLogger(__name__)
+
+# --- ЗАГОЛОВКИ ФАЙЛА ---
+# Колонка -> допустимые названия в первой строке файла
+COLUMNS = {
+    "role": ("role", "роль"),
+    "origin": ("origin", "откуда"),
+    "destination": ("destination", "куда"),
+    "date": ("date", "дата"),
+    "time": ("time", "start_time", "время"),
+    "seats": ("seats", "места", "мест"),
+}
+REQUIRED_COLUMNS = ("origin", "destination", "date")
+
+ROLES = {
+    "driver": "driver", "водитель": "driver",
+    "passenger": "passenger", "пассажир": "passenger",
+}
+
+_DATE_FORMATS = ("%d.%m.%Y", "%d.%m.%y", "%Y-%m-%d")
+
+
+class BulkFileError(ValueError):
+    """Файл целиком непригоден: кодировка, заголовок, размер"""
+
+
+def _decode(content: bytes) -> str:
+    for encoding in ("utf-8-sig", "cp1251"):
+        try:
+            return content.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    raise BulkFileError("не удалось прочитать файл: сохраните его в UTF-8")
+
+
+def _map_header(header: list) -> dict:
+    """Название колонки -> её номер в строке"""
+    positions = {}
+    for i, raw in enumerate(header):
+        name = raw.strip().lower()
+        for column, aliases in COLUMNS.items():
+            if name in aliases:
+                positions[column] = i
+    missing = [c for c in REQUIRED_COLUMNS if c not in positions]
+    if missing:
+        raise BulkFileError(f"в заголовке нет колонок: {', '.join(missing)}")
+    return positions
+
+
+def _parse_date(raw: str):
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(raw, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _parse_row(cells: list, positions: dict, today: date):
+    """Строка файла -> (значения для INSERT, None) или (None, текст ошибки)"""
+    def cell(column):
+        i = positions.get(column)
+        return cells[i].strip() if i is not None and i < len(cells) else ""
+
+    role = ROLES.get(cell("role").lower() or "driver")
+    if not role:
+        return None, f"роль «{cell('role')}» — нужно водитель или пассажир"
+
+    origin, destination = cell("origin"), cell("destination")
+    origin_id, dest_id = route_graph.resolve_pair(origin, destination)
+    if origin_id is None:
+        return None, f"маршрут «{origin} — {destination}» не найден в сети маршрутов"
+
+    ride_date = _parse_date(cell("date"))
+    if not ride_date:
+        return None, f"дата «{cell('date')}» — нужен формат ДД.ММ.ГГГГ"
+    if ride_date < today:
+        return None, f"дата {ride_date:%d.%m.%Y} уже прошла"
+
+    start_time = None
+    if cell("time"):
+        try:
+            start_time = datetime.strptime(cell("time"), "%H:%M").time()
+        except ValueError:
+            return None, f"время «{cell('time')}» — нужен формат ЧЧ:ММ"
+    elif role == "driver":
+        return None, "для водителя нужно время выезда"
+
+    raw_seats = cell("seats") or "1"
+    if not raw_seats.isdigit() or not 0 < int(raw_seats) <= 8:
+        return None, f"места «{raw_seats}» — нужно число от 1 до 8"
+    seats = int(raw_seats)
+
+    return {
+        "role": role,
+        "origin": route_graph.names[origin_id],
+        "destination": route_graph.names[dest_id],
+        "ride_date": ride_date,
+        "start_time": start_time,
+        "initial_seats": seats,
+        "seats": seats,
+        # Core INSERT не вызывает before_insert модели, поэтому остановки проставляем здесь
+        "origin_stop_id": origin_id,
+        "dest_stop_id": dest_id,
+    }, None
+
+
+def parse_bulk_file(content: bytes, today: date = None, max_rows: int = BULK_MAX_ROWS):
+    """
+    CSV/TSV с заголовком -> (строки для INSERT, [(номер строки, ошибка), ...]).
+    Разделитель (запятая, точка с запятой или табуляция) определяется по первой строке.
+    """
+    today = today or date.today()
+    text = _decode(content)
+    first_line = text.split("\n", 1)[0]
+    delimiter = max(("\t", ";", ","), key=first_line.count)
+    reader = csv.reader(io.StringIO(text), delimiter=delimiter)
+
+    header = next(reader, None)
+    if not header:
+        raise BulkFileError("файл пустой")
+    positions = _map_header(header)
+
+    rows, errors = [], []
+    for line_no, cells in enumerate(reader, start=2):
+        if not any(c.strip() for c in cells):
+            continue
+        if len(rows) + len(errors) >= max_rows:
+            raise BulkFileError(f"больше {max_rows} строк")
+        values, error = _parse_row(cells, positions, today)
+        if error:
+            errors.append((line_no, error))
+        else:
+            rows.append(values)
+    return rows, errors
+
+
+async def insert_rides(session, rows: list, user_id: int = None, chunk: int = BULK_INSERT_CHUNK):
+    """
+    Многострочный INSERT пачками по chunk строк (лимит параметров драйвера).
+    user_id задаёт владельца всем строкам, иначе он берётся из самих строк.
+    Строки, нарушающие уникальность (поездка шаблона на эту дату уже есть), пропускаются.
+    Возвращает метку created_at, общую для всей пачки, и [(id, дата, роль, origin_stop_id, dest_stop_id, время), ...]
+    вставленных поездок — в формате SegmentIndex.add_rows.
+    """
+    created_at = datetime.now()
+    inserted = []
+    for start in range(0, len(rows), chunk):
+        part = rows[start:start + chunk]
+        values = [dict(row, created_at=created_at, **({"user_id": user_id} if user_id else {})) for row in part]
+        stmt = dialect_insert(session)(Ride).values(values).on_conflict_do_nothing()
+        result = await session.execute(stmt.returning(
+            Ride.id, Ride.ride_date, Ride.role, Ride.origin_stop_id, Ride.dest_stop_id, Ride.start_time
+        ))
+        inserted.extend(tuple(row) for row in result.all())
+    return created_at, inserted
+
+
+def _inside(outer_from, outer_to, inner_from, inner_to):
+    """Отрезок inner лежит внутри outer на одном маршруте и в том же направлении (позиции route_stops)"""
+    return or_(
+        and_(
+            outer_from.position <= inner_from.position,
+            inner_from.position < inner_to.position,
+            inner_to.position <= outer_to.position
+        ),
+        and_(
+            outer_from.position >= inner_from.position,
+            inner_from.position > inner_to.position,
+            inner_to.position >= outer_to.position
+        )
+    )
+
+
+async def match_batch(session, created_at: datetime, user_id: int = None) -> list:
+    """
+    Попутчики для всей пачки одним запросом: новые поездки (общая метка created_at) соединяются
+    с поездками противоположной роли на ту же дату, а вложенность отрезков проверяется по позициям
+    остановок в route_stops — на любом общем маршруте сети. Окно по времени выезда
+    (MATCH_TIME_TOLERANCE) проверяется по результату, без SQL-арифметики над временем.
+    Возвращает [(новая поездка, её владелец, попутная поездка, её владелец), ...].
+    """
+    new = aliased(Ride)
+    other = aliased(Ride)
+    new_user = aliased(User)
+    other_user = aliased(User)
+    new_from, new_to, other_from, other_to = (aliased(RouteStop) for _ in range(4))
+
+    on_common_route = (
+        select(1)
+        .select_from(new_from)
+        .join(new_to, and_(new_to.route_id == new_from.route_id, new_to.stop_id == new.dest_stop_id))
+        .join(other_from, and_(other_from.route_id == new_from.route_id, other_from.stop_id == other.origin_stop_id))
+        .join(other_to, and_(other_to.route_id == new_from.route_id, other_to.stop_id == other.dest_stop_id))
+        .where(
+            new_from.stop_id == new.origin_stop_id,
+            or_(
+                # Новый водитель: пассажир внутри его маршрута
+                and_(new.role == "driver", _inside(new_from, new_to, other_from, other_to)),
+                # Новый пассажир: маршрут водителя накрывает его отрезок
+                and_(new.role == "passenger", _inside(other_from, other_to, new_from, new_to))
+            )
+        )
+    )
+    stmt = (
+        select(new, new_user, other, other_user)
+        .join(new_user, new_user.id == new.user_id)
+        .join(other, and_(
+            other.ride_date == new.ride_date,
+            other.role != new.role,
+            other.user_id != new.user_id,
+            other.origin_stop_id.is_not(None)
+        ))
+        .join(other_user, other_user.id == other.user_id)
+        .where(
+            new.created_at == created_at,
+            or_(new.role == "driver", other.seats > 0),
+            exists(on_common_route)
+        )
+        .order_by(new.id, other.id)
+    )
+    if user_id:
+        stmt = stmt.where(new.user_id == user_id)
+    rows = (await session.execute(stmt)).all()
+    return [row for row in rows if time_compatible(row[0].start_time, row[2].start_time)]
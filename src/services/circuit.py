@@ -0,0 +1,149 @@
+import logging
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class Permit:
+    """Разрешение на один вызов: помнит, пробный ли он и в какой фазе предохранителя выдан"""
+    __slots__ = ("probe", "generation", "settled")
+
+    def __init__(self, probe: bool, generation: int):
+        self.probe = probe
+        self.generation = generation
+        self.settled = False
+
+
+class CircuitBreaker:
+    """
+    Предохранитель внешней зависимости по скользящему окну window секунд.
+    Размыкается, когда в окне не меньше min_calls вызовов и доля ошибок или медленных
+    (дольше slow_call секунд) вызовов достигает порога. Через reset_timeout секунд пропускает
+    half_open_probes пробных запросов: все успешны — замыкается, любой неудачен — снова open.
+    Каждый вызов идёт по Permit из acquire(); release(permit) в finally освобождает место
+    пробного запроса, даже если ответа не было (отмена, ошибка до отправки).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window: float,
+        min_calls: int,
+        error_rate: float,
+        slow_call: float,
+        slow_rate: float,
+        reset_timeout: float,
+        half_open_probes: int = 1
+    ):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call = slow_call
+        self.slow_rate = slow_rate
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+        self.opened_at = None
+        self.times_opened = 0
+        self._calls = deque()  # (monotonic-время, успех, медленный)
+        self._generation = 0  # растёт при каждом размыкании и замыкании
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return HALF_OPEN
+        return OPEN
+
+    def acquire(self):
+        """Permit, если сейчас можно отправить запрос, иначе None; в half_open — не больше half_open_probes одновременно"""
+        state = self.state
+        if state == CLOSED:
+            return Permit(False, self._generation)
+        if state == HALF_OPEN and self._probes_in_flight + self._probe_successes < self.half_open_probes:
+            self._probes_in_flight += 1
+            return Permit(True, self._generation)
+        return None
+
+    def record(self, permit: Permit, ok: bool, latency: float):
+        if permit.generation != self._generation:
+            # Ответ на запрос, отправленный до смены фазы, — не про текущее состояние сервиса
+            return
+        now = time.monotonic()
+        slow = latency >= self.slow_call
+        if permit.probe:
+            if permit.settled:
+                return
+            permit.settled = True
+            self._probes_in_flight -= 1
+            if ok and not slow:
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_probes:
+                    self._close()
+            else:
+                self._open(now, "probe failed")
+            return
+
+        self._calls.append((now, ok, slow))
+        self._trim(now)
+        calls, errors, slow_share = self.rates()
+        if calls < self.min_calls:
+            return
+        if errors >= self.error_rate:
+            self._open(now, f"error rate {errors:.0%} over {calls} calls")
+        elif slow_share >= self.slow_rate:
+            self._open(now, f"{slow_share:.0%} of {calls} calls slower than {self.slow_call}s")
+
+    def release(self, permit: Permit):
+        """Пробный запрос завершился без результата (отмена, исключение до отправки) — освобождаем его место"""
+        if permit.probe and not permit.settled and permit.generation == self._generation:
+            permit.settled = True
+            self._probes_in_flight -= 1
+
+    def _trim(self, now: float):
+        while self._calls and now - self._calls[0][0] > self.window:
+            self._calls.popleft()
+
+    def rates(self):
+        """(вызовов в окне, доля ошибок, доля медленных)"""
+        self._trim(time.monotonic())
+        calls = len(self._calls)
+        if not calls:
+            return 0, 0.0, 0.0
+        errors = sum(1 for _, ok, _ in self._calls if not ok)
+        slow = sum(1 for _, _, is_slow in self._calls if is_slow)
+        return calls, errors / calls, slow / calls
+
+    def _open(self, now: float, reason: str):
+        logger.warning(f"⚠️ Circuit {self.name} opened: {reason}")
+        self.opened_at = now
+        self.times_opened += 1
+        self._generation += 1
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+
+    def _close(self):
+        logger.info(f"✅ Circuit {self.name} closed")
+        self.opened_at = None
+        self._generation += 1
+        self._calls.clear()
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+
+    def snapshot(self) -> dict:
+        calls, errors, slow = self.rates()
+        return {
+            "state": self.state,
+            "calls": calls,
+            "error_rate": round(errors, 3),
+            "slow_rate": round(slow, 3),
+            "times_opened": self.times_opened,
+        }
@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import delete, insert, or_, select
+
+from src.config import (
+    CLEANUP_INTERVAL, CLEANUP_BATCH_SIZE, CLEANUP_BATCH_PAUSE, CLEANUP_KEEP_DAYS, CLEANUP_ARCHIVE
+)
+from src.database.session import async_session
+from src.database.models import Ride, Booking, RideArchive
+from src.services.matching import segment_index
+from src.services.metrics import CLEANUP_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Колонка архива -> колонка rides; свой id у архива — суррогатный
+_ARCHIVE_COLUMNS = {
+    "ride_id": "id", "user_id": "user_id", "role": "role", "origin": "origin", "destination": "destination",
+    "ride_date": "ride_date", "start_time": "start_time", "initial_seats": "initial_seats",
+    "seats": "seats", "created_at": "created_at",
+}
+
+# Результат последнего прогона (для логов и метрик)
+last_run = {}
+
+
+async def _delete_batch(ride_ids: list, archive: bool):
+    """Одна короткая транзакция: архив (опционально) -> брони -> поездки"""
+    async with async_session() as s:
+        if archive:
+            await s.execute(
+                insert(RideArchive).from_select(
+                    list(_ARCHIVE_COLUMNS),
+                    select(*[getattr(Ride, c) for c in _ARCHIVE_COLUMNS.values()]).where(Ride.id.in_(ride_ids))
+                )
+            )
+        await s.execute(delete(Booking).where(or_(
+            Booking.driver_ride_id.in_(ride_ids),
+            Booking.passenger_ride_id.in_(ride_ids)
+        )))
+        await s.execute(delete(Ride).where(Ride.id.in_(ride_ids)))
+        await s.commit()
+
+
+async def clean_old_rides(
+    keep_days: int = CLEANUP_KEEP_DAYS,
+    batch_size: int = CLEANUP_BATCH_SIZE,
+    archive: bool = CLEANUP_ARCHIVE
+) -> dict:
+    """
+    Удаляет поездки, чья дата (ride_date, а не created_at) прошла больше keep_days дней назад.
+    Работает пачками: каждая пачка — отдельная транзакция, между пачками цикл событий свободен.
+    """
+    cutoff = date.today() - timedelta(days=keep_days)
+    started = time.perf_counter()
+    deleted = 0
+    batches = 0
+    lock_time = 0.0
+
+    while True:
+        async with async_session() as s:
+            ids_stmt = await s.execute(
+                select(Ride.id).where(Ride.ride_date < cutoff).order_by(Ride.id).limit(batch_size)
+            )
+            ride_ids = ids_stmt.scalars().all()
+        if not ride_ids:
+            break
+
+        batch_started = time.perf_counter()
+        await _delete_batch(ride_ids, archive)
+        lock_time += time.perf_counter() - batch_started
+
+        for ride_id in ride_ids:
+            segment_index.discard(ride_id)
+        deleted += len(ride_ids)
+        batches += 1
+        await asyncio.sleep(CLEANUP_BATCH_PAUSE)
+
+    duration = time.perf_counter() - started
+    CLEANUP_SECONDS.observe(duration)
+    last_run.update({
+        "deleted": deleted,
+        "batches": batches,
+        "duration": duration,
+        "lock_time": lock_time,
+        "rows_per_sec": deleted / duration if duration else 0.0,
+    })
+    return dict(last_run)
+
+
+async def auto_clean_old_rides():
+    while True:
+        try:
+            stats = await clean_old_rides()
+            logger.info(
+                f"Фоновая очистка базы завершена успешно: удалено {stats['deleted']} поездок "
+                f"за {stats['batches']} пачек, {stats['rows_per_sec']:.0f} строк/с, "
+                f"в транзакциях {stats['lock_time']:.2f} с."
+            )
+            await asyncio.sleep(CLEANUP_INTERVAL)
+        except Exception as e:
+            logger.error(f"Ошибка фоновой очистки: {e}")
+            await asyncio.sleep(3600)
@@ -0,0 +1,246 @@
+import re
+from datetime import date, datetime, timedelta
+
+# --- СПРАВОЧНИК ГОРОДОВ С ПАДЕЖНЫМИ ФОРМАМИ ---
+# Порядок важен: составные названия (вокзал, аэропорт) проверяются раньше "Краснодара"
+CITY_PATTERNS = [
+    ("Ж/д вокзал Краснодар", r"(?:ж\.?\s*/?\s*д\.?\s*)?вокзал\w*(?:\s+краснодар\w*)?"),
+    ("Аэропорт Краснодар", r"аэропорт\w*(?:\s+краснодар\w*)?"),
+    ("Сказочный край", r"сказочн\w*(?:\s+кра(?:й|я|ю|ем|е)\b)?"),
+    ("Живой дом", r"жив\w*\s+дом\w*"),
+    ("Здравое", r"здрав(?:ое|ого|ому|ом)\b"),
+    ("Григорьевская", r"григорьевск\w*"),
+    ("Смоленская", r"смоленск\w*"),
+    ("Ставропольская", r"ставропольск\w*"),
+    ("Северская", r"северск\w*"),
+    ("Афипский", r"афипск\w*"),
+    ("Энем", r"энем\w*"),
+    ("Яблоновский", r"яблоновск\w*"),
+    ("Краснодар", r"краснодар\w*"),
+]
+
+_CITY_RE = re.compile(
+    r"(?:\b(?P<prep>из|от|с|со|в|во|до|на)\s+)?\b(?P<city>" + "|".join(f"(?P<c{i}>{p})" for i, (_, p) in enumerate(CITY_PATTERNS)) + ")",
+    re.IGNORECASE
+)
+_ORIGIN_PREPS = {"из", "от", "с", "со"}
+_DEST_PREPS = {"в", "во", "до", "на"}
+
+MONTHS = {
+    "января": 1, "февраля": 2, "марта": 3, "апреля": 4, "мая": 5, "июня": 6,
+    "июля": 7, "августа": 8, "сентября": 9, "октября": 10, "ноября": 11, "декабря": 12
+}
+
+NUMBER_WORDS = {
+    "один": 1, "одно": 1, "одна": 1, "два": 2, "две": 2, "три": 3, "четыре": 4,
+    "пять": 5, "шесть": 6, "семь": 7
+}
+
+_RELATIVE_DAYS_RE = re.compile(r"\b(сегодня|послезавтра|завтра)\b", re.IGNORECASE)
+_NUMERIC_DATE_RE = re.compile(r"\b(\d{1,2})[./](\d{1,2})(?:[./](\d{2,4}))?\b")
+_TEXT_DATE_RE = re.compile(r"\b(\d{1,2})\s+(" + "|".join(MONTHS) + r")\b", re.IGNORECASE)
+_CLOCK_RE = re.compile(r"\b([01]?\d|2[0-3]):([0-5]\d)\b")
+# "в 9.05" — время через точку; "9.05" без предлога остаётся датой
+_DOT_TIME_RE = re.compile(r"\bв\s+([01]?\d|2[0-3])\.([0-5]\d)\b(?![./]\d)", re.IGNORECASE)
+# "через 2 дня" — дата, а не "2 часа дня"
+_DAYS_LATER_RE = re.compile(
+    r"\bчерез\s+(\d{1,2}|" + "|".join(NUMBER_WORDS) + r")\s+(?:день|дня|дней)\b", re.IGNORECASE
+)
+_DAYPART_RE = re.compile(r"\b(\d{1,2})(?::([0-5]\d))?\s*(?:час\w*\s+)?(утра|дня|вечера|ночи)\b", re.IGNORECASE)
+_SEATS_RE = re.compile(
+    r"\b(\d{1,2}|" + "|".join(NUMBER_WORDS) + r")\s+(?:свободн\w+\s+)?(мест\w*|человек\w*|чел\b|пассажир\w*)",
+    re.IGNORECASE
+)
+_SINGLE_SEAT_RE = re.compile(r"\b(?:одно\s+)?место\b", re.IGNORECASE)
+
+
+def _find_cities(text: str):
+    """Возвращает список (каноническое название, предлог или None) в порядке упоминания"""
+    found = []
+    for match in _CITY_RE.finditer(text):
+        for i, (name, _) in enumerate(CITY_PATTERNS):
+            if match.group(f"c{i}"):
+                prep = (match.group("prep") or "").lower() or None
+                found.append((name, prep))
+                break
+    return found
+
+
+def _extract_route(text: str):
+    cities = _find_cities(text)
+    names = {name for name, _ in cities}
+    if len(cities) != 2 or len(names) != 2:
+        return None, None
+
+    origin = next((name for name, prep in cities if prep in _ORIGIN_PREPS), None)
+    destination = next((name for name, prep in cities if prep in _DEST_PREPS), None)
+    if origin and destination and origin != destination:
+        return origin, destination
+    if origin:
+        return origin, next(name for name, _ in cities if name != origin)
+    if destination:
+        return next(name for name, _ in cities if name != destination), destination
+    # "Краснодар - Здравое": без предлогов первый город — откуда
+    return cities[0][0], cities[1][0]
+
+
+def _find_dates(text: str, today: date):
+    """Все разные даты из сообщения по приоритету: "через 2 дня", "завтра", "25.12", "25 декабря"."""
+    # Время с двоеточием или "в 9.05" убираем, чтобы оно не разобралось как дата
+    text = _DOT_TIME_RE.sub(" ", _CLOCK_RE.sub(" ", text))
+    found = []
+
+    for later in _DAYS_LATER_RE.finditer(text):
+        raw = later.group(1).lower()
+        found.append(today + timedelta(days=int(raw) if raw.isdigit() else NUMBER_WORDS[raw]))
+    for relative in _RELATIVE_DAYS_RE.finditer(text):
+        offset = {"сегодня": 0, "завтра": 1, "послезавтра": 2}[relative.group(1).lower()]
+        found.append(today + timedelta(days=offset))
+
+    for numeric in _NUMERIC_DATE_RE.finditer(text):
+        day, month, year = int(numeric.group(1)), int(numeric.group(2)), numeric.group(3)
+        try:
+            if year:
+                found.append(date(int(year) + (2000 if len(year) == 2 else 0), month, day))
+            else:
+                found.append(_nearest_date(today, month, day))
+        except ValueError:
+            continue
+    for textual in _TEXT_DATE_RE.finditer(text):
+        try:
+            found.append(_nearest_date(today, MONTHS[textual.group(2).lower()], int(textual.group(1))))
+        except ValueError:
+            continue
+    return list(dict.fromkeys(found))
+
+
+def _nearest_date(today: date, month: int, day: int) -> date:
+    candidate = date(today.year, month, day)
+    # Дата без года, которая уже прошла, — это следующий год
+    if candidate < today:
+        candidate = candidate.replace(year=today.year + 1)
+    return candidate
+
+
+def _extract_date(text: str, today: date):
+    dates = _find_dates(text, today)
+    return dates[0] if dates else None
+
+
+def _find_times(text: str):
+    """Все разные времена из сообщения; "9 утра" разбирается раньше "9:00" и "в 9.05"."""
+    text = _DAYS_LATER_RE.sub(" ", text)
+    found = []
+    for daypart in _DAYPART_RE.finditer(text):
+        hour, minute = int(daypart.group(1)), int(daypart.group(2) or 0)
+        part = daypart.group(3).lower()
+        if hour > 12:
+            if hour < 24:
+                found.append(f"{hour:02d}:{minute:02d}")
+            continue
+        if part in ("вечера", "дня") and hour < 12:
+            hour += 12
+        elif part == "ночи" and hour == 12:
+            hour = 0
+        found.append(f"{hour:02d}:{minute:02d}")
+
+    # "8:30 вечера" уже разобрано выше — иначе двоеточие даст второе, утреннее время
+    text = _DAYPART_RE.sub(" ", text)
+    for clock in [*_CLOCK_RE.finditer(text), *_DOT_TIME_RE.finditer(text)]:
+        found.append(f"{int(clock.group(1)):02d}:{clock.group(2)}")
+    return list(dict.fromkeys(found))
+
+
+def _extract_seats(text: str):
+    match = _SEATS_RE.search(text)
+    if match:
+        raw = match.group(1).lower()
+        seats = int(raw) if raw.isdigit() else NUMBER_WORDS[raw]
+        return seats if 0 < seats <= 8 else None
+    if _SINGLE_SEAT_RE.search(text):
+        return 1
+    return None
+
+
+def is_self_contained(text: str, today: date = None) -> bool:
+    """Есть ли в самом тексте маршрут и дата — то есть ответ LLM не зависит от истории диалога"""
+    origin, destination = _extract_route(text or "")
+    return bool(origin and destination and _extract_date(text, today or datetime.now().date()))
+
+
+def parse_ride_message(text: str, role: str = None, today: date = None, now: datetime = None) -> dict:
+    """
+    Локальный разбор хорошо сформулированного сообщения о поездке без обращения к LLM.
+    Возвращает данные в том же формате, что NLUProcessor.parse_intent, только если
+    уверенно найдены откуда, куда, дата, число мест и (для водителя) время. Иначе {}:
+    в том числе когда дат или времён несколько ("нет, в 10:00", "обратно послезавтра")
+    или время сегодняшней поездки уже прошло — такие сообщения разбирает LLM.
+    """
+    if not text or "?" in text:
+        return {}
+    now = now or datetime.now()
+    today = today or now.date()
+
+    origin, destination = _extract_route(text)
+    times = _find_times(text)
+    dates = _find_dates(text, today)
+    seats = _extract_seats(text)
+
+    if len(times) > 1 or len(dates) > 1:
+        return {}
+    start_time = times[0] if times else None
+    ride_date = dates[0] if dates else None
+
+    if not (origin and destination and ride_date and seats):
+        return {}
+    if ride_date < today:
+        return {}
+    if ride_date == today and start_time and start_time < now.strftime("%H:%M"):
+        return {}
+    if role == "driver" and not start_time:
+        return {}
+
+    return {
+        "origin": origin,
+        "destination": destination,
+        "date": ride_date.strftime("%d.%m.%Y"),
+        "start_time": start_time,
+        "seats": seats,
+        "raw_text": "Отлично, я сохраняю вашу поездку! Сейчас поищу попутчиков..."
+    }
+
+
+def extract_ride_fields(text: str, today: date = None) -> dict:
+    """
+    Всё, что удалось найти в сообщении, без требования полноты — для пошаговой анкеты,
+    когда pro-talk недоступен. Одиночный город без предлога возвращается как "city".
+    """
+    text = text or ""
+    today = today or datetime.now().date()
+    fields = {}
+
+    origin, destination = _extract_route(text)
+    if origin:
+        fields["origin"], fields["destination"] = origin, destination
+    else:
+        cities = _find_cities(text)
+        if len(cities) == 1:
+            name, prep = cities[0]
+            if prep in _ORIGIN_PREPS:
+                fields["origin"] = name
+            elif prep in _DEST_PREPS:
+                fields["destination"] = name
+            else:
+                fields["city"] = name
+
+    # Несколько дат или времён — неясно, какое верное: пусть анкета спросит заново
+    dates = _find_dates(text, today)
+    if len(dates) == 1 and dates[0] >= today:
+        fields["date"] = dates[0].strftime("%d.%m.%Y")
+    times = _find_times(text)
+    if len(times) == 1:
+        fields["start_time"] = times[0]
+    seats = _extract_seats(text)
+    if seats:
+        fields["seats"] = seats
+    return fields
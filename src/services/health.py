@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import time
+
+from sqlalchemy import text
+
+from src.config import (
+    HEALTH_CACHE_TTL, HEALTH_DB_TIMEOUT, HEALTH_MAX_UPDATE_AGE, HEALTH_MAX_POLL_AGE, HEALTH_REQUIRE_NLU
+)
+from src.services.circuit import OPEN
+
+logger = logging.getLogger(__name__)
+
+
+class HealthMonitor:
+    """
+    Проверки готовности для /readyz: SELECT 1 в БД, возраст последнего обработанного апдейта,
+    живость long polling и состояние предохранителя NLU.
+    Результат кэшируется на HEALTH_CACHE_TTL секунд, частый опрос не нагружает БД.
+    """
+
+    def __init__(
+        self,
+        cache_ttl: float = HEALTH_CACHE_TTL,
+        db_timeout: float = HEALTH_DB_TIMEOUT,
+        max_update_age: int = HEALTH_MAX_UPDATE_AGE,
+        max_poll_age: int = HEALTH_MAX_POLL_AGE
+    ):
+        self.cache_ttl = cache_ttl
+        self.db_timeout = db_timeout
+        self.max_update_age = max_update_age
+        self.max_poll_age = max_poll_age
+        self.started_at = time.monotonic()
+        self.last_update_at = None
+        self.last_poll_at = None
+        self.polling_task = None
+        self.session_factory = None
+        self.breaker = None
+        self._cached = None
+        self._cached_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def configure(self, session_factory, breaker=None, polling_task=None):
+        self.session_factory = session_factory
+        self.breaker = breaker
+        self.polling_task = polling_task
+
+    def mark_update(self):
+        self.last_update_at = time.monotonic()
+
+    def mark_poll(self):
+        self.last_poll_at = time.monotonic()
+
+    @staticmethod
+    def _age(moment, now):
+        return round(now - moment, 1) if moment is not None else None
+
+    async def _check_db(self) -> dict:
+        started = time.perf_counter()
+        try:
+            async with self.session_factory() as s:
+                await asyncio.wait_for(s.execute(text("SELECT 1")), self.db_timeout)
+        except Exception as e:
+            logger.warning(f"⚠️ Readiness DB probe failed: {e!r}")
+            return {"ok": False, "error": type(e).__name__}
+        return {"ok": True, "latency": round(time.perf_counter() - started, 4)}
+
+    def _check_updates(self, now: float) -> dict:
+        # Отсчёт от старта процесса, пока не пришёл ни один апдейт
+        age = now - (self.last_update_at or self.started_at)
+        ok = not self.max_update_age or age <= self.max_update_age
+        return {"ok": ok, "age": self._age(self.last_update_at, now)}
+
+    def _check_polling(self, now: float) -> dict:
+        if self.polling_task is None:
+            return {"ok": True, "mode": "webhook"}
+        if self.polling_task.done():
+            return {"ok": False, "mode": "polling", "error": "polling task finished"}
+        age = now - (self.last_poll_at or self.started_at)
+        ok = not self.max_poll_age or age <= self.max_poll_age
+        return {"ok": ok, "mode": "polling", "last_poll_age": self._age(self.last_poll_at, now)}
+
+    def _check_nlu(self) -> dict:
+        if self.breaker is None:
+            return {"ok": True}
+        snapshot = self.breaker.snapshot()
+        # Открытый предохранитель — деградация, а не отказ: заявки создаются и без pro-talk
+        snapshot["ok"] = not (HEALTH_REQUIRE_NLU and snapshot["state"] == OPEN)
+        return snapshot
+
+    async def readiness(self) -> dict:
+        """{"ready": bool, "status": ..., "checks": {...}} — из кэша, если он свежий"""
+        if self._cached and time.monotonic() - self._cached_at < self.cache_ttl:
+            return self._cached
+        async with self._lock:
+            # Пока ждали блокировку, результат мог обновить другой запрос
+            if self._cached and time.monotonic() - self._cached_at < self.cache_ttl:
+                return self._cached
+            checks = {"db": await self._check_db()}
+            now = time.monotonic()
+            checks["updates"] = self._check_updates(now)
+            checks["polling"] = self._check_polling(now)
+            checks["nlu"] = self._check_nlu()
+
+            ready = all(check["ok"] for check in checks.values())
+            if not ready:
+                status = "unavailable"
+            elif checks["nlu"].get("state", "closed") != "closed":
+                status = "degraded"
+            else:
+                status = "ok"
+            self._cached = {"ready": ready, "status": status, "checks": checks}
+            self._cached_at = time.monotonic()
+            return self._cached
+
+
+health = HealthMonitor()
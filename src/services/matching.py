@@ -0,0 +1,239 @@
+import asyncio
+import bisect
+import logging
+import time
+from datetime import date, time as dt_time, timedelta
+
+from sqlalchemy import or_, select, tuple_
+
+from src.config import MATCH_INDEX_DAYS, MATCH_INDEX_TTL, MATCH_TIME_TOLERANCE
+from src.database.models import User, Ride
+from src.services.routes import route_graph, is_route_compatible
+
+logger = logging.getLogger(__name__)
+
+
+def departure_minute(start_time):
+    """time -> минута суток; None — время не указано (по договоренности)"""
+    return start_time.hour * 60 + start_time.minute if start_time else None
+
+
+def time_compatible(a, b, tolerance: int = MATCH_TIME_TOLERANCE) -> bool:
+    """Времена выезда расходятся не больше чем на tolerance минут; без времени — подходит любое"""
+    if a is None or b is None:
+        return True
+    return abs(departure_minute(a) - departure_minute(b)) <= tolerance
+
+
+class _PairBucket:
+    """Поездки одной пары остановок: отсортированные (минута выезда, id) и поездки без времени"""
+    __slots__ = ("timed", "flexible")
+
+    def __init__(self):
+        self.timed = []
+        self.flexible = set()
+
+    def add(self, ride_id: int, minute):
+        if minute is None:
+            self.flexible.add(ride_id)
+        else:
+            bisect.insort(self.timed, (minute, ride_id))
+
+    def remove(self, ride_id: int, minute):
+        if minute is None:
+            self.flexible.discard(ride_id)
+            return
+        i = bisect.bisect_left(self.timed, (minute, ride_id))
+        if i < len(self.timed) and self.timed[i] == (minute, ride_id):
+            del self.timed[i]
+
+    def window(self, minute, tolerance: int):
+        """id с выездом в [minute - tolerance, minute + tolerance] и все без времени"""
+        if minute is None:
+            yield from (ride_id for _, ride_id in self.timed)
+        else:
+            lo = bisect.bisect_left(self.timed, (minute - tolerance, -1))
+            hi = bisect.bisect_right(self.timed, (minute + tolerance, float("inf")))
+            yield from (ride_id for _, ride_id in self.timed[lo:hi])
+        yield from self.flexible
+
+    def __bool__(self):
+        return bool(self.timed or self.flexible)
+
+
+class SegmentIndex:
+    """
+    In-memory индекс открытых поездок для горячего окна дат (сегодня + MATCH_INDEX_DAYS).
+    (дата, роль) -> {(origin_stop_id, dest_stop_id): поездки, отсортированные по минуте выезда}.
+    Ключей не больше, чем пар остановок, а окно по времени ищется бисекцией, поэтому поиск
+    попутных не зависит от числа поездок. Водители без свободных мест в индекс не попадают.
+    Дата перечитывается из БД раз в MATCH_INDEX_TTL секунд, чтобы видеть записи других реплик.
+    """
+
+    def __init__(self, days: int = MATCH_INDEX_DAYS, ttl: int = MATCH_INDEX_TTL):
+        self.days = days
+        self.ttl = ttl
+        self._loaded = {}    # дата -> monotonic-время загрузки
+        self._buckets = {}   # (дата, роль) -> {(origin_stop_id, dest_stop_id): _PairBucket}
+        self._unknown = {}   # (дата, роль) -> set(ride_id) с нераспознанными остановками
+        self._rides = {}     # ride_id -> (дата, роль, ключ или None, минута выезда)
+        self._lock = asyncio.Lock()
+
+    def _in_window(self, d: date) -> bool:
+        today = date.today()
+        return today <= d <= today + timedelta(days=self.days)
+
+    def _is_fresh(self, d: date) -> bool:
+        loaded_at = self._loaded.get(d)
+        return loaded_at is not None and time.monotonic() - loaded_at < self.ttl
+
+    async def ensure_loaded(self, session, d: date) -> bool:
+        """Загружает дату в индекс, если она в горячем окне. Возвращает True, если индексу можно верить."""
+        if not self._in_window(d):
+            return False
+        if self._is_fresh(d):
+            return True
+        async with self._lock:
+            if self._is_fresh(d):
+                return True
+            rows = await session.execute(
+                select(Ride.id, Ride.role, Ride.origin_stop_id, Ride.dest_stop_id, Ride.start_time)
+                .where(Ride.ride_date == d, or_(Ride.role != "driver", Ride.seats > 0))
+            )
+            self._drop_date(d)
+            for ride_id, role, origin_id, dest_id, start_time in rows.all():
+                self._put(ride_id, d, role, origin_id, dest_id, departure_minute(start_time))
+            self._loaded[d] = time.monotonic()
+            self._evict_expired()
+        return True
+
+    def add(self, ride: Ride):
+        """Добавляет (или обновляет) поездку, если её дата уже загружена"""
+        self.discard(ride.id)
+        if ride.ride_date in self._loaded and not (ride.role == "driver" and ride.seats <= 0):
+            self._put(
+                ride.id, ride.ride_date, ride.role, ride.origin_stop_id, ride.dest_stop_id,
+                departure_minute(ride.start_time)
+            )
+
+    def add_rows(self, rows):
+        """Пачка поездок [(id, дата, роль, origin_stop_id, dest_stop_id, start_time), ...] — для загруженных дат"""
+        for ride_id, d, role, origin_id, dest_id, start_time in rows:
+            if d in self._loaded:
+                self._put(ride_id, d, role, origin_id, dest_id, departure_minute(start_time))
+
+    def discard(self, ride_id: int):
+        entry = self._rides.pop(ride_id, None)
+        if not entry:
+            return
+        d, role, key, minute = entry
+        if key is None:
+            self._unknown.get((d, role), set()).discard(ride_id)
+            return
+        buckets = self._buckets.get((d, role), {})
+        bucket = buckets.get(key)
+        if bucket is not None:
+            bucket.remove(ride_id, minute)
+            if not bucket:
+                del buckets[key]
+
+    def candidates(self, d: date, role: str, pairs: frozenset, minute=None, tolerance: int = MATCH_TIME_TOLERANCE) -> set:
+        """
+        id поездок роли role на дату d, чья пара остановок входит в pairs
+        (см. RouteGraph.contained_pairs / containing_pairs), а выезд — в пределах tolerance минут
+        от minute. Поездки без времени подходят к любому времени.
+        Поездки с нераспознанными остановками возвращаются всегда — их проверяет вызывающий.
+        """
+        result = set(self._unknown.get((d, role), ()))
+        buckets = self._buckets.get((d, role), {})
+        # Обходим меньшее из двух множеств
+        keys = pairs if len(pairs) < len(buckets) else buckets.keys()
+        for key in keys:
+            if key in pairs and key in buckets:
+                result.update(buckets[key].window(minute, tolerance))
+        return result
+
+    def _put(self, ride_id, d, role, origin_id, dest_id, minute):
+        if origin_id is None:
+            self._unknown.setdefault((d, role), set()).add(ride_id)
+            self._rides[ride_id] = (d, role, None, minute)
+            return
+        key = (origin_id, dest_id)
+        self._buckets.setdefault((d, role), {}).setdefault(key, _PairBucket()).add(ride_id, minute)
+        self._rides[ride_id] = (d, role, key, minute)
+
+    def _drop_date(self, d: date):
+        self._loaded.pop(d, None)
+        for key in [k for k in self._buckets if k[0] == d]:
+            del self._buckets[key]
+        for key in [k for k in self._unknown if k[0] == d]:
+            del self._unknown[key]
+        for ride_id in [r for r, entry in self._rides.items() if entry[0] == d]:
+            del self._rides[ride_id]
+
+    def _evict_expired(self):
+        for d in [d for d in self._loaded if not self._in_window(d)]:
+            self._drop_date(d)
+
+
+segment_index = SegmentIndex()
+
+
+def _time_window(minute: int, tolerance: int = MATCH_TIME_TOLERANCE):
+    """Границы окна выезда в пределах тех же суток (поездки сравниваются только в одну дату)"""
+    lo = max(minute - tolerance, 0)
+    hi = min(minute + tolerance, 24 * 60 - 1)
+    return dt_time(lo // 60, lo % 60), dt_time(hi // 60, hi % 60)
+
+
+def _is_compatible(ride: Ride, other: Ride) -> bool:
+    if ride.origin_stop_id is not None and other.origin_stop_id is not None:
+        # Пара остановок уже проверена индексом или SQL-условием
+        return True
+    driver, passenger = (ride, other) if ride.role == "driver" else (other, ride)
+    return is_route_compatible(driver.origin, driver.destination, passenger.origin, passenger.destination)
+
+
+async def find_compatible_rides(session, ride: Ride, exclude_user_id: int) -> list:
+    """
+    Попутные поездки противоположной роли на ту же дату: список (Ride, User).
+    Для водителя — пассажиры, чей отрезок лежит внутри его маршрута; для пассажира — водители
+    со свободными местами, чей маршрут накрывает его отрезок. Допустимые пары остановок
+    заранее посчитаны в route_graph. Выезд должен отличаться не больше чем на
+    MATCH_TIME_TOLERANCE минут, если время указано у обоих.
+    """
+    target_role = "passenger" if ride.role == "driver" else "driver"
+
+    stmt = select(Ride, User).join(User).where(
+        Ride.ride_date == ride.ride_date,
+        Ride.role == target_role,
+        Ride.user_id != exclude_user_id
+    )
+    if target_role == "driver":
+        stmt = stmt.where(Ride.seats > 0)
+    minute = departure_minute(ride.start_time)
+
+    if ride.origin_stop_id is not None:
+        pair = (ride.origin_stop_id, ride.dest_stop_id)
+        if ride.role == "driver":
+            pairs = route_graph.contained_pairs(pair)
+        else:
+            pairs = route_graph.containing_pairs(pair)
+        if await segment_index.ensure_loaded(session, ride.ride_date):
+            ids = segment_index.candidates(ride.ride_date, target_role, pairs, minute)
+            if not ids:
+                return []
+            stmt = stmt.where(Ride.id.in_(ids))
+        else:
+            stmt = stmt.where(or_(
+                tuple_(Ride.origin_stop_id, Ride.dest_stop_id).in_(list(pairs)),
+                Ride.origin_stop_id.is_(None)
+            ))
+            if minute is not None:
+                stmt = stmt.where(or_(Ride.start_time.is_(None), Ride.start_time.between(*_time_window(minute))))
+
+    rows = await session.execute(stmt)
+    return [
+        (r, u) for r, u in rows.all()
+        if _is_compatible(ride, r) and time_compatible(ride.start_time, r.start_time)
+    ]
@@ -0,0 +1,191 @@
+import time
+from collections import deque
+
+
+class LatencyStats:
+    """Счётчики и скользящее окно задержек (секунды) для p50/p99 без внешних зависимостей"""
+
+    def __init__(self, window: int = 1000, histogram=None):
+        self.histogram = histogram
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self._samples = deque(maxlen=window)
+
+    def observe(self, seconds: float, ok: bool = True):
+        self.count += 1
+        self.total += seconds
+        self._samples.append(seconds)
+        if not ok:
+            self.errors += 1
+        if self.histogram:
+            self.histogram.observe(seconds)
+
+    def timer(self):
+        return _Timer(self)
+
+    def percentile(self, q: float) -> float:
+        if not self._samples:
+            return 0.0
+        ordered = sorted(self._samples)
+        idx = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+        return ordered[idx]
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "avg": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(0.5),
+            "p99": self.percentile(0.99),
+        }
+
+
+class _Timer:
+    def __init__(self, stats: LatencyStats):
+        self.stats = stats
+        self.ok = True
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stats.observe(time.perf_counter() - self._start, ok=self.ok and exc_type is None)
+        return False
+
+
+# --- ЭКСПОРТ В ФОРМАТЕ PROMETHEUS ---
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for k, v in sorted(labels.items()):
+        value = str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{k}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(dict(key))} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [counts по бакетам, sum, count]
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][i] += 1
+                break
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in self._series.items():
+            labels = dict(key)
+            cumulative = 0
+            for bound, c in zip(self.buckets, counts):
+                cumulative += c
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': bound})} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        metric = Counter(name, help_text)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help_text, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, name: str, help_text: str, collect, kind: str = "gauge"):
+        """collect() -> {labels_tuple_or_None: value}; значения читаются в момент скрейпа"""
+        self._collectors.append((name, help_text, collect, kind))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for name, help_text, collect, kind in self._collectors:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            try:
+                values = collect()
+            except Exception:
+                continue
+            for labels, value in values.items():
+                lines.append(f"{name}{_format_labels(dict(labels or ()))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HANDLER_SECONDS = registry.histogram("bot_handler_seconds", "Время обработки апдейта хендлером")
+NLU_REQUEST_SECONDS = registry.histogram("nlu_request_seconds", "Задержка запроса к pro-talk")
+NLU_RESPONSES = registry.counter("nlu_responses_total", "Ответы pro-talk по HTTP-статусу")
+NLU_PARSE = registry.counter("nlu_parse_total", "Результат parse_intent по источнику и полноте")
+DB_QUERY_SECONDS = registry.histogram("db_query_seconds", "Время выполнения SQL-запроса")
+CLEANUP_SECONDS = registry.histogram(
+    "cleanup_run_seconds", "Длительность прогона фоновой очистки", buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300)
+)
+
+
+def instrument_engine(engine):
+    """Замеряет каждый SQL-запрос через события SQLAlchemy на синхронном движке"""
+    from sqlalchemy import event
+
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        DB_QUERY_SECONDS.observe(time.perf_counter() - started, operation=operation)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(context):
+        if context.connection is not None:
+            stack = context.connection.info.get("query_started")
+            if stack:
+                stack.pop()
@@ -1,32 +1,29 @@
 import aiohttp
+import asyncio
 import logging
 import json
 import os
 import re
+import time
+from collections import OrderedDict
 from datetime import datetime
 
-logger = logging.getLogger(__name__)
+from src.config import (
+    NLU_POOL_SIZE, NLU_MAX_CONCURRENCY, NLU_DNS_TTL, NLU_CONNECT_TIMEOUT, NLU_READ_TIMEOUT,
+    NLU_INSTRUCTION_ONCE, NLU_CONVERSATION_TTL, NLU_CACHE_SIZE, NLU_CACHE_TTL, NLU_CACHE_SQLITE_PATH,
+    NLU_BREAKER_WINDOW, NLU_BREAKER_MIN_CALLS, NLU_BREAKER_ERROR_RATE, NLU_BREAKER_SLOW_CALL,
+    NLU_BREAKER_SLOW_RATE, NLU_BREAKER_RESET, NLU_BREAKER_PROBES, NLU_HEDGE_DELAY
+)
+from src.services.circuit import CircuitBreaker, CLOSED
+from src.services.metrics import LatencyStats, NLU_REQUEST_SECONDS, NLU_RESPONSES, NLU_PARSE
+from src.services.fast_parser import parse_ride_message, is_self_contained
+from src.services.nlu_cache import NLUCache, SQLiteCacheBackend
 
-class NLUProcessor:
-    def __init__(self):
-        # Используем переменные окружения PROTALK_*
-        self.api_token = os.getenv("PROTALK_TOKEN") 
-        self.bot_id = os.getenv("PROTALK_BOT_ID")
-        self.base_url = "https://api.pro-talk.ru/api/v1.0/ask"
-
-    async def parse_intent(self, text: str, user_id: int, role: str = None) -> dict:
-        """
-        Отправляет текст в API и пытается извлечь JSON с деталями поездки.
-        Аргумент role нужен для правильного контекста (водитель/пассажир).
-        """
-        if not self.api_token or not self.bot_id:
-             logger.error("❌ Tokens missing in Environment Variables")
-             return {}
+logger = logging.getLogger(__name__)
 
-        # --- 1. Формируем системный промпт с датой ---
-        current_date = datetime.now().strftime("%d.%m.%Y")
-        
-        system_instruction = f"""Ты — Везучий, умный помощник сервиса попутчиков. Твоя цель — помочь пользователю создать заявку на поездку (водитель или пассажир).
+def build_system_instruction(current_date: str) -> str:
+    """Системная инструкция для pro-talk; от дня к дню в ней меняется только дата"""
+    return f"""Ты — Везучий, умный помощник сервиса попутчиков. Твоя цель — помочь пользователю создать заявку на поездку (водитель или пассажир).
 
 Ты общаешься в естественном человечном стиле, вежливо и заботливо, обращаешься к пользователю на "вы", используешь обращение по имени, если оно указано в заметках к диалогу.
 
@@ -93,15 +90,240 @@ class NLUProcessor:
 
 Если данных для полноценной поездки (Откуда, Куда, Дата) еще не хватает, отвечай пользователю только текстом, задавай уточняющие вопросы. НЕ присылай JSON, пока не соберешь минимум необходимых данных (Откуда, Куда, Дата)."""
 
-        # --- 2. Добавляем контекст роли ---
-        context_prefix = ""
-        if role == "driver":
-            context_prefix = "\n[Роль пользователя: Водитель. Он хочет ОПУБЛИКОВАТЬ поездку. Извлеки JSON: origin, destination, date, time, seats.] "
-        elif role == "passenger":
-            context_prefix = "\n[Роль пользователя: Пассажир. Он хочет НАЙТИ машину. Извлеки JSON: origin, destination, date, time, seats.] "
-            
-        # Собираем всё вместе: Инструкция + Роль + Сообщение юзера
-        full_message = f"{system_instruction}\n{context_prefix}\nСообщение пользователя: {text}"
+
+ROLE_CONTEXT = {
+    "driver": "[Роль пользователя: Водитель. Он хочет ОПУБЛИКОВАТЬ поездку. Извлеки JSON: origin, destination, date, time, seats.] ",
+    "passenger": "[Роль пользователя: Пассажир. Он хочет НАЙТИ машину. Извлеки JSON: origin, destination, date, time, seats.] ",
+}
+
+
+class NLUProcessor:
+    def __init__(self):
+        # Используем переменные окружения PROTALK_*
+        self.api_token = os.getenv("PROTALK_TOKEN") 
+        self.bot_id = os.getenv("PROTALK_BOT_ID")
+        self.base_url = "https://api.pro-talk.ru/api/v1.0/ask"
+        self._session = None
+        self._semaphore = asyncio.Semaphore(NLU_MAX_CONCURRENCY)
+        self.latency = LatencyStats(histogram=NLU_REQUEST_SECONDS)
+        self.breaker = CircuitBreaker(
+            "pro-talk", NLU_BREAKER_WINDOW, NLU_BREAKER_MIN_CALLS, NLU_BREAKER_ERROR_RATE,
+            NLU_BREAKER_SLOW_CALL, NLU_BREAKER_SLOW_RATE, NLU_BREAKER_RESET, NLU_BREAKER_PROBES
+        )
+        self.hedges = {"sent": 0, "won": 0}
+        self.fast_path_hits = 0
+        self.fast_path_misses = 0
+        # chat_id -> (дата, роль, время последней реплики): кому инструкция уже отправлена
+        self._conversations = OrderedDict()
+        self.prompt_bytes = {"full": 0, "delta": 0}
+        self.prompt_turns = {"full": 0, "delta": 0}
+        self.cache = NLUCache(
+            NLU_CACHE_SIZE, NLU_CACHE_TTL,
+            backend=SQLiteCacheBackend(NLU_CACHE_SQLITE_PATH) if NLU_CACHE_SQLITE_PATH else None
+        )
+
+    def fast_path_stats(self) -> dict:
+        """Доля сообщений, разобранных локально, и оценка сэкономленного времени (по средней задержке API)"""
+        total = self.fast_path_hits + self.fast_path_misses
+        avg_latency = self.latency.snapshot()["avg"]
+        return {
+            "hits": self.fast_path_hits,
+            "misses": self.fast_path_misses,
+            "hit_rate": self.fast_path_hits / total if total else 0.0,
+            "saved_seconds": self.fast_path_hits * avg_latency,
+        }
+
+    def prompt_stats(self) -> dict:
+        """Средний размер сообщения (байт) для ходов с инструкцией и без неё"""
+        return {
+            kind: {
+                "turns": self.prompt_turns[kind],
+                "bytes_total": self.prompt_bytes[kind],
+                "bytes_per_turn": self.prompt_bytes[kind] / self.prompt_turns[kind] if self.prompt_turns[kind] else 0.0,
+            }
+            for kind in ("full", "delta")
+        }
+
+    def _record_prompt_bytes(self, size: int, full: bool):
+        kind = "full" if full else "delta"
+        self.prompt_turns[kind] += 1
+        self.prompt_bytes[kind] += size
+
+    def _evict_conversations(self):
+        deadline = time.monotonic() - NLU_CONVERSATION_TTL
+        while self._conversations:
+            chat_id, (_, _, last_seen) = next(iter(self._conversations.items()))
+            if last_seen >= deadline:
+                break
+            del self._conversations[chat_id]
+
+    def _needs_instruction(self, chat_id: int, role: str, current_date: str) -> bool:
+        """Инструкцию нужно отправить на первом ходе, при смене даты или роли, либо если режим выключен"""
+        if not NLU_INSTRUCTION_ONCE:
+            return True
+        self._evict_conversations()
+        known = self._conversations.get(chat_id)
+        return known is None or known[0] != current_date or known[1] != role
+
+    def _remember_conversation(self, chat_id: int, role: str, current_date: str):
+        self._conversations[chat_id] = (current_date, role, time.monotonic())
+        self._conversations.move_to_end(chat_id)
+
+    @staticmethod
+    def _is_complete(data: dict) -> bool:
+        return bool(data.get("origin") and data.get("destination") and data.get("date"))
+
+    def reset_conversation(self, chat_id: int):
+        """Следующий ход этого чата снова получит полную инструкцию"""
+        self._conversations.pop(chat_id, None)
+
+    async def start(self):
+        """Создаёт долгоживущую HTTP-сессию с keep-alive пулом к pro-talk"""
+        if self._session and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=NLU_POOL_SIZE,
+            limit_per_host=NLU_POOL_SIZE,
+            ttl_dns_cache=NLU_DNS_TTL,
+            keepalive_timeout=60
+        )
+        timeout = aiohttp.ClientTimeout(
+            total=NLU_CONNECT_TIMEOUT + NLU_READ_TIMEOUT,
+            connect=NLU_CONNECT_TIMEOUT,
+            sock_read=NLU_READ_TIMEOUT
+        )
+        self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        logger.info(f"🌐 NLU HTTP session started (pool={NLU_POOL_SIZE}, concurrency={NLU_MAX_CONCURRENCY})")
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+            logger.info(f"🌐 NLU HTTP session closed, latency: {self.latency.snapshot()}")
+        self._session = None
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        if not self._session or self._session.closed:
+            await self.start()
+        return self._session
+
+    async def _send(self, url: str, payload: dict):
+        """
+        Один HTTP-запрос к pro-talk: (status, text, задержка), при сетевой ошибке — (None, исключение, задержка).
+        В предохранитель не пишет: это делает вызывающий, ровно один раз на permit.
+        """
+        # Семафор ограничивает число одновременных запросов при всплеске сообщений.
+        # Задержка считается после него: ожидание своей очереди — не медленный pro-talk
+        async with self._semaphore:
+            started = time.perf_counter()
+            try:
+                session = await self._get_session()
+                with self.latency.timer() as timer:
+                    async with session.post(url, json=payload) as resp:
+                        resp_text = await resp.text()
+                        timer.ok = resp.status == 200
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                return None, e, time.perf_counter() - started
+            latency = time.perf_counter() - started
+        NLU_RESPONSES.inc(status=str(resp.status))
+        return resp.status, resp_text, latency
+
+    def _settle(self, permit, outcome):
+        """Записывает исход в предохранитель и возвращает (status, text) или поднимает ошибку запроса"""
+        status, result, latency = outcome
+        self.breaker.record(permit, status == 200, latency)
+        if status is None:
+            raise result
+        return status, result
+
+    async def _post(self, url: str, payload: dict, permit):
+        """Один запрос к pro-talk: (status, text). Результат и задержка идут в предохранитель по permit."""
+        return self._settle(permit, await self._send(url, payload))
+
+    async def _post_hedged(self, url: str, payload: dict, permit):
+        """
+        Если первичный запрос не ответил за NLU_HEDGE_DELAY, отправляет копию и берёт первый
+        успешный ответ; вторую попытку отменяет. Только для сообщений, ответ на которые не зависит
+        от истории диалога: лишняя реплика в истории pro-talk не меняет результат.
+        В предохранитель попадает один исход на permit — тот, что вернули вызывающему.
+        """
+        primary = asyncio.create_task(self._send(url, payload))
+        pending = {primary}
+        outcome = None
+        try:
+            done, _ = await asyncio.wait(pending, timeout=NLU_HEDGE_DELAY)
+            if not done:
+                self.hedges["sent"] += 1
+                pending.add(asyncio.create_task(self._send(url, payload)))
+            while pending and outcome is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.result()[0] == 200:
+                        outcome = task.result()
+                        if task is not primary:
+                            self.hedges["won"] += 1
+                        break
+        finally:
+            for task in pending:
+                task.cancel()
+            # Дожидаемся отменённых попыток, чтобы они не жили дольше вызова
+            await asyncio.gather(*pending, return_exceptions=True)
+        # Обе попытки неудачны — исход первичной
+        return self._settle(permit, outcome or primary.result())
+
+    async def parse_intent(self, text: str, user_id: int, role: str = None) -> dict:
+        """
+        Отправляет текст в API и пытается извлечь JSON с деталями поездки.
+        Аргумент role нужен для правильного контекста (водитель/пассажир).
+        Полные однозначные сообщения разбираются локально, без запроса к API.
+        """
+        fast_result = parse_ride_message(text, role)
+        if fast_result:
+            self.fast_path_hits += 1
+            NLU_PARSE.inc(source="fast_path", result="complete")
+            logger.info(f"⚡ Fast-path parse for user {user_id}: {fast_result}")
+            return fast_result
+        self.fast_path_misses += 1
+
+        if not self.api_token or not self.bot_id:
+             logger.error("❌ Tokens missing in Environment Variables")
+             return {}
+
+        current_date = datetime.now().strftime("%d.%m.%Y")
+
+        # Повторно присланный текст (после ошибки или копипаста) отвечаем из кэша
+        cache_key = self.cache.make_key(text, role, current_date)
+        cached = await self.cache.get(cache_key)
+        if cached:
+            logger.info(f"♻️ NLU cache hit for user {user_id}")
+            NLU_PARSE.inc(source="cache", result="complete")
+            return cached
+
+        # pro-talk недавно падал — не держим хендлер на заведомо долгом таймауте
+        permit = self.breaker.acquire()
+        if permit is None:
+            logger.warning(f"⚠️ NLU circuit open, skipping request for user {user_id}")
+            NLU_PARSE.inc(source="api", result="circuit_open")
+            return {}
+        try:
+            return await self._ask_api(text, user_id, role, current_date, cache_key, permit)
+        finally:
+            # Пробный запрос не должен занимать место навсегда, если ответа так и не было
+            self.breaker.release(permit)
+
+    async def _ask_api(self, text: str, user_id: int, role: str, current_date: str, cache_key: str, permit) -> dict:
+        """Запрос к pro-talk по разрешению предохранителя и разбор JSON из ответа"""
+        # --- 1. Формируем сообщение ---
+        send_instruction = self._needs_instruction(user_id, role, current_date)
+
+        if send_instruction:
+            # Инструкция + Роль + Сообщение юзера
+            context_prefix = f"\n{ROLE_CONTEXT[role]}" if role in ROLE_CONTEXT else ""
+            full_message = f"{build_system_instruction(current_date)}\n{context_prefix}\nСообщение пользователя: {text}"
+        else:
+            # Инструкция уже есть в истории диалога pro-talk — отправляем только реплику
+            full_message = f"Сообщение пользователя: {text}"
 
         url = f"{self.base_url}/{self.api_token}"
         payload = {
@@ -109,58 +331,74 @@ class NLUProcessor:
             "chat_id": str(user_id),
             "message": full_message
         }
+        self._record_prompt_bytes(len(full_message.encode("utf-8")), send_instruction)
+
+        hedge = bool(NLU_HEDGE_DELAY) and send_instruction and self.breaker.state == CLOSED and is_self_contained(text)
 
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, json=payload) as resp:
-                    resp_text = await resp.text()
-                    
-                    if resp.status != 200:
-                        logger.error(f"❌ API Error {resp.status}: {resp_text}")
-                        return {}
-
-                    try:
-                        api_response = json.loads(resp_text)
-                        bot_reply = api_response.get("done", "")
-                    except json.JSONDecodeError:
-                        logger.error("❌ Failed to decode API response")
-                        return {}
-
-                    # --- 3. Логика поиска и удаления JSON ---
-                    
-                    # Ищем JSON-объект {...}
-                    json_matches = list(re.finditer(r"\{.*?\}", bot_reply, re.DOTALL))
-                    
-                    result_data = {}
-                    clean_text = bot_reply
-                    
-                    if json_matches:
-                        # Берем последний найденный блок
-                        last_match = json_matches[-1]
-                        json_str = last_match.group(0)
-                        
-                        try:
-                            result_data = json.loads(json_str)
-                            
-                            # Если парсинг прошел успешно, ВЫРЕЗАЕМ этот кусок из текста
-                            clean_text = bot_reply.replace(json_str, "").strip()
-                            
-                        except json.JSONDecodeError:
-                            pass
-                    
-                    # --- 4. Финальная зачистка ---
-                    # Удаляем остатки Markdown-оберток
-                    clean_text = re.sub(r"```.*?```", "", clean_text, flags=re.DOTALL).strip()
-                    clean_text = clean_text.replace("```", "").strip()
-                    clean_text = re.sub(r"^\s*json\s*", "", clean_text, flags=re.MULTILINE).strip()
+            if hedge:
+                status, resp_text = await self._post_hedged(url, payload, permit)
+            else:
+                status, resp_text = await self._post(url, payload, permit)
+
+            if status != 200:
+                logger.error(f"❌ API Error {status}: {resp_text}")
+                NLU_PARSE.inc(source="api", result="failed")
+                return {}
+
+            # Продлеваем диалог: инструкция в его истории остаётся актуальной
+            self._remember_conversation(user_id, role, current_date)
+
+            try:
+                api_response = json.loads(resp_text)
+                bot_reply = api_response.get("done", "")
+            except json.JSONDecodeError:
+                logger.error("❌ Failed to decode API response")
+                NLU_PARSE.inc(source="api", result="failed")
+                return {}
+
+            # --- 3. Логика поиска и удаления JSON ---
+            
+            # Ищем JSON-объект {...}
+            json_matches = list(re.finditer(r"\{.*?\}", bot_reply, re.DOTALL))
+            
+            result_data = {}
+            clean_text = bot_reply
+            
+            if json_matches:
+                # Берем последний найденный блок
+                last_match = json_matches[-1]
+                json_str = last_match.group(0)
+                
+                try:
+                    result_data = json.loads(json_str)
                     
-                    # Возвращаем результат
-                    if result_data:
-                        result_data["raw_text"] = clean_text
-                        return result_data
+                    # Если парсинг прошел успешно, ВЫРЕЗАЕМ этот кусок из текста
+                    clean_text = bot_reply.replace(json_str, "").strip()
                     
-                    return {"raw_text": clean_text}
+                except json.JSONDecodeError:
+                    pass
+            
+            # --- 4. Финальная зачистка ---
+            # Удаляем остатки Markdown-оберток
+            clean_text = re.sub(r"```.*?```", "", clean_text, flags=re.DOTALL).strip()
+            clean_text = clean_text.replace("```", "").strip()
+            clean_text = re.sub(r"^\s*json\s*", "", clean_text, flags=re.MULTILINE).strip()
+            
+            # Возвращаем результат
+            if result_data:
+                result_data["raw_text"] = clean_text
+                NLU_PARSE.inc(source="api", result="complete" if self._is_complete(result_data) else "partial")
+                # Кэшируем только полные поездки, целиком описанные самим сообщением:
+                # иначе ответ зависит от истории диалога конкретного пользователя
+                if self._is_complete(result_data) and is_self_contained(text):
+                    await self.cache.set(cache_key, result_data)
+                return result_data
+            
+            NLU_PARSE.inc(source="api", result="text_only")
+            return {"raw_text": clean_text}
 
         except Exception as e:
             logger.error(f"❌ Exception in parse_intent: {e}")
+            NLU_PARSE.inc(source="api", result="failed")
             return {}
@@ -0,0 +1,132 @@
+import asyncio
+import json
+import logging
+import re
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from datetime import date
+
+from src.services.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """Нормализация для ключа кэша: регистр, ё/е, пунктуация и лишние пробелы не важны"""
+    text = text.lower().replace("ё", "е")
+    text = re.sub(r"[^\w:/.\s]", " ", text)
+    return re.sub(r"\s+", " ", text).strip(" .")
+
+
+class CacheBackend(ABC):
+    """Общее хранилище для нескольких реплик бота. Значения — сериализуемые в JSON dict."""
+
+    @abstractmethod
+    async def get(self, key: str):
+        """Значение или None, если ключа нет или срок истёк"""
+
+    @abstractmethod
+    async def set(self, key: str, value: dict, ttl: int):
+        """Сохраняет value на ttl секунд"""
+
+    @abstractmethod
+    async def clear(self):
+        """Удаляет все записи"""
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """Файловый бэкенд на sqlite3; запросы выполняются в отдельном потоке"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS nlu_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def _get(self, key: str):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value FROM nlu_cache WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _set(self, key: str, value: dict, ttl: int):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO nlu_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), time.time() + ttl)
+            )
+            conn.execute("DELETE FROM nlu_cache WHERE expires_at <= ?", (time.time(),))
+
+    def _clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM nlu_cache")
+
+    async def get(self, key: str):
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: dict, ttl: int):
+        await asyncio.to_thread(self._set, key, value, ttl)
+
+    async def clear(self):
+        await asyncio.to_thread(self._clear)
+
+
+class NLUCache:
+    """
+    LRU + TTL кэш результатов parse_intent.
+    Ключ — нормализованный текст, роль и текущая дата: относительные даты ("завтра") зависят от неё,
+    поэтому в полночь локальный кэш сбрасывается целиком.
+    """
+
+    def __init__(self, max_size: int, ttl: int, backend: CacheBackend = None):
+        self.ttl = ttl
+        self.backend = backend
+        self._items = TTLCache(max_size, ttl)
+        self._date = date.today()
+
+    @staticmethod
+    def make_key(text: str, role: str, current_date: str) -> str:
+        return f"{current_date}|{role or '-'}|{normalize_text(text)}"
+
+    def _check_midnight(self):
+        today = date.today()
+        if today != self._date:
+            self._items.clear()
+            self._date = today
+
+    async def get(self, key: str):
+        self._check_midnight()
+        # Промах локального кэша — ещё не промах, пока не спросили общий бэкенд
+        value = self._items.lookup(key)
+        if value is None and self.backend:
+            try:
+                value = await self.backend.get(key)
+            except Exception as e:
+                logger.error(f"❌ NLU cache backend get failed: {e}")
+                value = None
+            if value:
+                self._items.put(key, dict(value))
+
+        if not value:
+            self._items.misses += 1
+            return None
+        self._items.hits += 1
+        return dict(value)
+
+    async def set(self, key: str, value: dict):
+        self._check_midnight()
+        self._items.put(key, dict(value))
+        if self.backend:
+            try:
+                await self.backend.set(key, value, self.ttl)
+            except Exception as e:
+                logger.error(f"❌ NLU cache backend set failed: {e}")
+
+    def stats(self) -> dict:
+        return self._items.stats()
@@ -0,0 +1,180 @@
+import asyncio
+import hashlib
+import heapq
+import itertools
+import logging
+import time
+
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest
+
+from src.config import (
+    NOTIFY_GLOBAL_RATE, NOTIFY_CHAT_INTERVAL, NOTIFY_CONCURRENCY,
+    NOTIFY_MAX_RETRIES, NOTIFY_DEDUP_TTL, NOTIFY_QUEUE_SIZE
+)
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Token bucket с резервированием: reserve() сразу списывает токен и говорит, сколько ждать"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def reserve(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class NotificationDispatcher:
+    """
+    Фоновая рассылка уведомлений через Bot API.
+    Хендлеры кладут сообщение в очередь (enqueue) и сразу возвращаются; воркеры отправляют его,
+    соблюдая общий лимит и интервал на чат, повторяют при RetryAfter/сетевых ошибках
+    и пропускают одинаковые уведомления в один чат в течение NOTIFY_DEDUP_TTL.
+    Воркер не ждёт интервала одного чата: сообщение, чей слот ещё не наступил, откладывается
+    до этого времени, а воркер берёт следующее — пачка в один чат не держит остальные.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = NOTIFY_GLOBAL_RATE,
+        chat_interval: float = NOTIFY_CHAT_INTERVAL,
+        concurrency: int = NOTIFY_CONCURRENCY,
+        max_retries: int = NOTIFY_MAX_RETRIES,
+        dedup_ttl: int = NOTIFY_DEDUP_TTL,
+        queue_size: int = NOTIFY_QUEUE_SIZE
+    ):
+        self.bucket = TokenBucket(global_rate)
+        self.chat_interval = chat_interval
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.dedup_ttl = dedup_ttl
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.bot = None
+        self._workers = []
+        self._delayed = []  # куча (не раньше, номер, сообщение): ждут слота своего чата или повтора
+        self._delayed_seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._chat_next = {}  # chat_id -> monotonic-время, раньше которого в чат не пишем
+        self._recent = {}     # (chat_id, hash текста и клавиатуры) -> время истечения дедупликации
+        self.stats = {"queued": 0, "sent": 0, "failed": 0, "retried": 0, "deduplicated": 0, "dropped": 0}
+
+    def start(self, bot):
+        self.bot = bot
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+            self._workers.append(asyncio.create_task(self._scheduler()))
+            logger.info(f"📨 Notification dispatcher started ({self.concurrency} workers)")
+
+    async def stop(self, timeout: float = 10):
+        """Дожидается отправки очереди вместе с отложенными (не дольше timeout) и останавливает воркеров"""
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ Notification queue not drained, {self.pending()} left")
+        for task in self._workers:
+            task.cancel()
+        self._workers = []
+
+    def enqueue(self, chat_id: int, text: str, **kwargs) -> bool:
+        """Ставит уведомление в очередь. False — дубликат или очередь переполнена."""
+        now = time.monotonic()
+        fingerprint = f"{text}|{kwargs.get('reply_markup')!r}"
+        dedup_key = (chat_id, hashlib.sha1(fingerprint.encode("utf-8")).hexdigest())
+        if self._recent.get(dedup_key, 0) > now:
+            self.stats["deduplicated"] += 1
+            return False
+        try:
+            self.queue.put_nowait((chat_id, text, kwargs, 0))
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            logger.error(f"❌ Notification queue full, dropped message to {chat_id}")
+            return False
+        self._recent[dedup_key] = now + self.dedup_ttl
+        self.stats["queued"] += 1
+        if len(self._recent) > 10000:
+            self._recent = {k: exp for k, exp in self._recent.items() if exp > now}
+        return True
+
+    def pending(self) -> int:
+        """Сообщений в очереди и отложенных до слота своего чата"""
+        return self.queue.qsize() + len(self._delayed)
+
+    def _defer(self, not_before: float, item: tuple):
+        heapq.heappush(self._delayed, (not_before, next(self._delayed_seq), item))
+        self._wakeup.set()
+
+    async def _scheduler(self):
+        """Возвращает отложенные сообщения в очередь, когда наступает их время"""
+        while True:
+            wait = self._delayed[0][0] - time.monotonic() if self._delayed else None
+            if wait is None or wait > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            _, _, item = heapq.heappop(self._delayed)
+            await self.queue.put(item)
+            # Отложенное сообщение не закрывалось в очереди (join его ждёт) — закрываем
+            # прежнюю задачу теперь, когда оно снова в очереди
+            self.queue.task_done()
+
+    async def _worker(self):
+        while True:
+            chat_id, text, kwargs, attempt = await self.queue.get()
+            deferred = False
+            try:
+                deferred = await self._send(chat_id, text, kwargs, attempt)
+            except Exception as e:
+                self.stats["failed"] += 1
+                logger.error(f"Ошибка уведомления {chat_id}: {e}")
+            finally:
+                if not deferred:
+                    self.queue.task_done()
+
+    async def _send(self, chat_id: int, text: str, kwargs: dict, attempt: int) -> bool:
+        """Отправляет сообщение или откладывает его (True), если слот чата ещё не наступил или нужен повтор"""
+        now = time.monotonic()
+        chat_at = self._chat_next.get(chat_id, 0)
+        if chat_at > now:
+            self._defer(chat_at, (chat_id, text, kwargs, attempt))
+            return True
+
+        # Общий лимит одинаков для всех чатов, его можно ждать в воркере
+        delay = self.bucket.reserve()
+        self._chat_next[chat_id] = now + delay + self.chat_interval
+        if len(self._chat_next) > 10000:
+            self._chat_next = {c: t for c, t in self._chat_next.items() if t > now}
+        if delay:
+            await asyncio.sleep(delay)
+
+        try:
+            await self.bot.send_message(chat_id, text, **kwargs)
+            self.stats["sent"] += 1
+            return False
+        except TelegramRetryAfter as e:
+            if attempt == self.max_retries:
+                raise
+            self.stats["retried"] += 1
+            # Флуд-контроль: следующие сообщения в этот чат тоже ждут
+            self._chat_next[chat_id] = time.monotonic() + e.retry_after
+            self._defer(self._chat_next[chat_id], (chat_id, text, kwargs, attempt + 1))
+            return True
+        except (TelegramForbiddenError, TelegramBadRequest):
+            # Бот заблокирован или чат недоступен — повтор не поможет
+            raise
+        except Exception:
+            if attempt == self.max_retries:
+                raise
+            self.stats["retried"] += 1
+            self._defer(time.monotonic() + 2 ** attempt, (chat_id, text, kwargs, attempt + 1))
+            return True
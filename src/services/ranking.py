@@ -0,0 +1,45 @@
+import heapq
+
+from src.config import MATCH_TIME_TOLERANCE, MATCH_TOP_N
+from src.services.matching import departure_minute
+from src.services.routes import route_graph
+
+# Веса слагаемых оценки (меньше — лучше); каждое слагаемое нормировано в [0, 1]
+WEIGHT_SEATS = 4.0   # мест меньше, чем нужно пассажиру
+WEIGHT_TIME = 2.0    # разница времени выезда относительно допуска
+WEIGHT_ROUTE = 1.0   # доля маршрута водителя за пределами отрезка пассажира
+WEIGHT_SPARE = 0.2   # запас свободных мест (чем больше, тем чуть лучше)
+
+
+def rank_drivers(passenger_ride, candidates: list, limit: int = MATCH_TOP_N) -> list:
+    """
+    Лучшие водители для пассажира из результата find_compatible_rides: [(Ride, User), ...].
+    Оценка за один проход по кандидатам: хватает ли мест, близость времени выезда и насколько
+    маршрут водителя совпадает с отрезком пассажира. Отбор top-N — heapq, без полной сортировки.
+    """
+    needed = passenger_ride.initial_seats or 1
+    minute = departure_minute(passenger_ride.start_time)
+    passenger_span = route_graph.span((passenger_ride.origin_stop_id, passenger_ride.dest_stop_id))
+    span = route_graph.span
+
+    def score(row):
+        ride = row[0]
+        seats = ride.seats or 0
+        driver_minute = departure_minute(ride.start_time)
+        if minute is None or driver_minute is None:
+            time_gap = 0.5  # время не указано — нейтрально
+        else:
+            time_gap = min(abs(driver_minute - minute) / MATCH_TIME_TOLERANCE, 1.0)
+        driver_span = span((ride.origin_stop_id, ride.dest_stop_id))
+        if passenger_span and driver_span:
+            detour = 1.0 - passenger_span / driver_span
+        else:
+            detour = 0.5  # остановки не распознаны — нейтрально
+        return (
+            WEIGHT_SEATS * (seats < needed)
+            + WEIGHT_TIME * time_gap
+            + WEIGHT_ROUTE * detour
+            - WEIGHT_SPARE * min(seats - needed, 4) / 4
+        ), ride.id
+
+    return heapq.nsmallest(limit, candidates, key=score)
@@ -0,0 +1,225 @@
+from itertools import combinations
+
+# --- НАЧАЛЬНАЯ СЕТЬ МАРШРУТОВ ---
+# Записывается в таблицы stops / routes / route_stops при первом запуске (см. init_models),
+# дальше сеть правится в БД. Основной коридор — бывший единственный список остановок.
+ROUTE_ORDER = [
+    "Сказочный край",
+    "Живой дом",
+    "Здравое",
+    "Григорьевская",
+    "Смоленская",
+    "Афипский",
+    "Энем",
+    "Яблоновский",
+    "Краснодар"
+]
+
+# Остановка -> дополнительные написания (название само по себе тоже ищется)
+DEFAULT_STOPS = {
+    "Сказочный край": ["сказочный", "сказочного"],
+    "Живой дом": [],
+    "Здравое": ["здравого", "здравом"],
+    "Григорьевская": ["григорьевской"],
+    "Смоленская": ["смоленской"],
+    "Ставропольская": ["ставропольской"],
+    "Северская": ["северской"],
+    "Афипский": ["афипского", "афипс"],
+    "Энем": [],
+    "Яблоновский": ["яблоновского"],
+    "Краснодар": [],
+    "Ж/д вокзал Краснодар": ["жд вокзал", "ж/д вокзал", "вокзал"],
+    "Аэропорт Краснодар": ["аэропорт"],
+}
+
+DEFAULT_ROUTES = {
+    "Сказочный край — Ж/д вокзал": ROUTE_ORDER + ["Ж/д вокзал Краснодар"],
+    "Сказочный край — Аэропорт": ROUTE_ORDER + ["Аэропорт Краснодар"],
+    "Здравое — Краснодар через Северскую": [
+        "Сказочный край", "Живой дом", "Здравое", "Григорьевская", "Ставропольская",
+        "Северская", "Афипский", "Энем", "Яблоновский", "Краснодар"
+    ],
+}
+
+
+def normalize_stop(name: str) -> str:
+    return " ".join((name or "").lower().replace("ё", "е").split())
+
+
+class StopTrie:
+    """
+    Префиксное дерево по названиям и синонимам остановок для автодополнения.
+    В каждом узле хранятся id всех остановок поддерева, поэтому поиск по префиксу — O(длина префикса).
+    Кроме полного написания добавляется каждое слово с его позиции: "край" находит "Сказочный край".
+    """
+
+    def __init__(self, aliases: dict = None):
+        self._root = ({}, [])  # (дети: буква -> узел, id остановок поддерева)
+        aliases = aliases or {}
+        # Сначала написания целиком, потом слова внутри них: на "кра" Краснодар выше Сказочного края
+        for alias, stop_id in aliases.items():
+            self.insert(alias, stop_id)
+        for alias, stop_id in aliases.items():
+            words = alias.split()
+            for i in range(1, len(words)):
+                self.insert(" ".join(words[i:]), stop_id)
+
+    def insert(self, text: str, stop_id):
+        node = self._root
+        for char in text:
+            node = node[0].setdefault(char, ({}, []))
+            if stop_id not in node[1]:
+                node[1].append(stop_id)
+
+    def complete(self, prefix: str) -> list:
+        """id остановок, у которых название, синоним или одно из слов начинается с prefix"""
+        node = self._root
+        for char in normalize_stop(prefix):
+            node = node[0].get(char)
+            if node is None:
+                return []
+        return list(node[1])
+
+
+class RouteGraph:
+    """
+    Сеть маршрутов в памяти: остановки с синонимами и упорядоченные маршруты (оба направления).
+    Для каждой пары остановок заранее посчитано, на каких маршрутах и позициях она лежит,
+    поэтому проверка "отрезок пассажира внутри маршрута водителя" не зависит от размера сети.
+    """
+
+    def __init__(self):
+        self.load([], [])
+
+    @classmethod
+    def from_network(cls, stops: dict, routes: dict) -> "RouteGraph":
+        """Граф из словарей вида DEFAULT_STOPS / DEFAULT_ROUTES (id — порядковые номера)"""
+        ids = {name: i for i, name in enumerate(stops, start=1)}
+        graph = cls()
+        graph.load(
+            [(ids[name], name, aliases) for name, aliases in stops.items()],
+            [(r, ids[name], pos) for r, seq in enumerate(routes.values(), start=1) for pos, name in enumerate(seq)]
+        )
+        return graph
+
+    def load(self, stops: list, route_stops: list):
+        """
+        stops: [(id, название, [синонимы])], route_stops: [(route_id, stop_id, позиция)].
+        Перестраивает граф целиком; вызывается при старте после чтения таблиц.
+        """
+        self.names = {}
+        aliases = {}
+        for stop_id, name, extra in stops:
+            self.names[stop_id] = name
+            for alias in [name, *extra]:
+                aliases.setdefault(normalize_stop(alias), stop_id)
+        # Длинные написания проверяются первыми: "ж/д вокзал краснодар" раньше "краснодар"
+        self._aliases = aliases
+        self._aliases_by_length = sorted(aliases.items(), key=lambda item: -len(item[0]))
+        self.trie = StopTrie(aliases)
+
+        routes = {}
+        for route_id, stop_id, position in sorted(route_stops, key=lambda r: (r[0], r[2])):
+            routes.setdefault(route_id, []).append(stop_id)
+        self.routes = routes
+
+        # (a, b) -> {route_id: (позиция a, позиция b)} для всех пар остановок одного маршрута
+        self._segments = {}
+        for route_id, seq in routes.items():
+            for i, a in enumerate(seq):
+                for j, b in enumerate(seq):
+                    if i != j:
+                        self._segments.setdefault((a, b), {})[route_id] = (i, j)
+        self._contained = {}
+        self._containing = {}
+
+    def stop_names(self) -> list:
+        return list(self.names.values())
+
+    def destinations(self, origin_id) -> list:
+        """Остановки, до которых можно доехать из origin_id хотя бы по одному маршруту"""
+        return [stop_id for stop_id in self.names if (origin_id, stop_id) in self._segments]
+
+    def resolve(self, name: str):
+        """Название из текста -> id остановки или None"""
+        key = normalize_stop(name)
+        if not key:
+            return None
+        if key in self._aliases:
+            return self._aliases[key]
+        for alias, stop_id in self._aliases_by_length:
+            if alias in key:
+                return stop_id
+        return None
+
+    def resolve_pair(self, origin: str, destination: str):
+        """(id откуда, id куда), если обе остановки известны и лежат на общем маршруте, иначе (None, None)"""
+        pair = (self.resolve(origin), self.resolve(destination))
+        if pair in self._segments:
+            return pair
+        return None, None
+
+    def span(self, pair: tuple):
+        """Длина отрезка в перегонах (по самому короткому из маршрутов) или None, если пара не на сети"""
+        segments = self._segments.get(pair)
+        if not segments:
+            return None
+        return min(abs(b - a) for a, b in segments.values())
+
+    def contains(self, driver_pair: tuple, passenger_pair: tuple) -> bool:
+        """Лежит ли отрезок пассажира внутри маршрута водителя (в том же направлении)"""
+        driver = self._segments.get(driver_pair)
+        passenger = self._segments.get(passenger_pair)
+        if not driver or not passenger:
+            return False
+        for route_id, (d_from, d_to) in driver.items():
+            positions = passenger.get(route_id)
+            if not positions:
+                continue
+            p_from, p_to = positions
+            if d_from < d_to and d_from <= p_from < p_to <= d_to:
+                return True
+            if d_from > d_to and d_from >= p_from > p_to >= d_to:
+                return True
+        return False
+
+    def contained_pairs(self, driver_pair: tuple) -> frozenset:
+        """Все отрезки пассажиров, которые водитель driver_pair может взять по пути"""
+        cached = self._contained.get(driver_pair)
+        if cached is None:
+            pairs = set()
+            for route_id, (d_from, d_to) in self._segments.get(driver_pair, {}).items():
+                seq = self.routes[route_id]
+                path = seq[d_from:d_to + 1] if d_from < d_to else seq[d_to:d_from + 1][::-1]
+                pairs.update(combinations(path, 2))
+            cached = self._contained[driver_pair] = frozenset(pairs)
+        return cached
+
+    def containing_pairs(self, passenger_pair: tuple) -> frozenset:
+        """Все маршруты водителей, проходящие через отрезок пассажира в его направлении"""
+        cached = self._containing.get(passenger_pair)
+        if cached is None:
+            pairs = set()
+            for route_id, (p_from, p_to) in self._segments.get(passenger_pair, {}).items():
+                seq = self.routes[route_id]
+                if p_from < p_to:
+                    pairs.update((seq[i], seq[j]) for i in range(p_from + 1) for j in range(p_to, len(seq)))
+                else:
+                    pairs.update((seq[i], seq[j]) for i in range(p_from, len(seq)) for j in range(p_to + 1))
+            cached = self._containing[passenger_pair] = frozenset(pairs)
+        return cached
+
+
+# Граф по умолчанию до чтения таблиц; init_models перезагружает его из БД
+route_graph = RouteGraph.from_network(DEFAULT_STOPS, DEFAULT_ROUTES)
+
+
+def is_route_compatible(driver_origin, driver_dest, pass_origin, pass_dest):
+    driver_pair = route_graph.resolve_pair(driver_origin, driver_dest)
+    passenger_pair = route_graph.resolve_pair(pass_origin, pass_dest)
+
+    if None in driver_pair or None in passenger_pair:
+        return (pass_origin.lower() in driver_origin.lower()) and \
+               (pass_dest.lower() in driver_dest.lower())
+
+    return route_graph.contains(driver_pair, passenger_pair)
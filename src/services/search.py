@@ -0,0 +1,205 @@
+import re
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import and_, or_, select, tuple_
+
+from src.config import SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL, INLINE_CACHE_SIZE, INLINE_CACHE_TTL, INLINE_MAX_ROUTES
+from src.database.models import User, Ride
+from src.services.fast_parser import extract_ride_fields
+from src.services.routes import normalize_stop, route_graph
+from src.services.ttl_cache import TTLCache
+
+PAGE_SIZE = 20
+_EPOCH = datetime(1970, 1, 1)
+
+
+def upcoming_condition(now: datetime):
+    """Поездка ещё не уехала: дата в будущем, либо сегодня и время не указано или ещё не наступило"""
+    today = now.date()
+    return or_(
+        Ride.ride_date > today,
+        and_(
+            Ride.ride_date == today,
+            or_(Ride.start_time.is_(None), Ride.start_time > now.time())
+        )
+    )
+
+
+def encode_cursor(ride: Ride) -> str:
+    """Позиция поездки в выдаче (ride_date ASC, created_at DESC, id DESC) для callback_data"""
+    created_us = (ride.created_at - _EPOCH) // timedelta(microseconds=1)
+    return f"{ride.ride_date.toordinal()}_{created_us}_{ride.id}"
+
+
+def decode_cursor(raw: str):
+    ordinal, created_us, ride_id = raw.split("_")
+    return date.fromordinal(int(ordinal)), _EPOCH + timedelta(microseconds=int(created_us)), int(ride_id)
+
+
+def _after_cursor(cursor):
+    ride_date, created_at, ride_id = cursor
+    return or_(
+        Ride.ride_date > ride_date,
+        and_(
+            Ride.ride_date == ride_date,
+            or_(
+                Ride.created_at < created_at,
+                and_(Ride.created_at == created_at, Ride.id < ride_id)
+            )
+        )
+    )
+
+
+async def fetch_drivers(session, cursor: str = None, limit: int = PAGE_SIZE + 1) -> list:
+    """
+    Актуальные водители со свободными местами: [(Ride, User), ...] в порядке выдачи.
+    Keyset-пагинация: выдача начинается строго после строки cursor, без OFFSET.
+    """
+    now = datetime.now()
+    stmt = select(Ride, User).join(User).where(
+        Ride.role == 'driver',
+        Ride.seats > 0,
+        Ride.ride_date >= now.date(),
+        upcoming_condition(now)
+    )
+    if cursor:
+        stmt = stmt.where(_after_cursor(decode_cursor(cursor)))
+    stmt = stmt.order_by(Ride.ride_date.asc(), Ride.created_at.desc(), Ride.id.desc()).limit(limit)
+    return (await session.execute(stmt)).all()
+
+
+def encode_user_cursor(ride: Ride) -> str:
+    """Позиция в списке "Мои поездки" (ride_date DESC, id DESC)"""
+    return f"{ride.ride_date.toordinal()}_{ride.id}"
+
+
+async def fetch_user_rides(session, user_id: int, cursor: str = None, limit: int = PAGE_SIZE + 1) -> list:
+    stmt = select(Ride).where(Ride.user_id == user_id)
+    if cursor:
+        ordinal, ride_id = cursor.split("_")
+        ride_date = date.fromordinal(int(ordinal))
+        stmt = stmt.where(or_(
+            Ride.ride_date < ride_date,
+            and_(Ride.ride_date == ride_date, Ride.id < int(ride_id))
+        ))
+    stmt = stmt.order_by(Ride.ride_date.desc(), Ride.id.desc()).limit(limit)
+    return (await session.execute(stmt)).scalars().all()
+
+
+# --- ПОИСК ПО МАРШРУТУ ---
+
+def parse_find_query(text: str, today: date = None):
+    """
+    Аргументы /find -> ((id откуда, id куда), дата или None) либо None, если маршрут не распознан.
+    "Здравое Краснодар завтра", "из Краснодара в Здравое 25.12" — без обращения к LLM.
+    """
+    fields = extract_ride_fields(text, today)
+    if not fields.get("origin") or not fields.get("destination"):
+        return None
+    pair = route_graph.resolve_pair(fields["origin"], fields["destination"])
+    if None in pair:
+        return None
+    ride_date = datetime.strptime(fields["date"], "%d.%m.%Y").date() if fields.get("date") else None
+    return pair, ride_date
+
+
+async def fetch_route_drivers(session, pair: tuple, ride_date: date = None, limit: int = PAGE_SIZE + 1) -> list:
+    """
+    Водители со свободными местами, чей маршрут накрывает отрезок pair: [(Ride, User), ...].
+    Один запрос по ix_rides_stop_pair: пары остановок, проходящие через отрезок, заранее
+    посчитаны в route_graph, "ещё не уехал" проверяется в SQL.
+    """
+    pairs = route_graph.containing_pairs(pair)
+    if not pairs:
+        return []
+    now = datetime.now()
+    stmt = select(Ride, User).join(User).where(
+        Ride.role == 'driver',
+        Ride.seats > 0,
+        tuple_(Ride.origin_stop_id, Ride.dest_stop_id).in_(list(pairs)),
+        upcoming_condition(now)
+    )
+    if ride_date:
+        stmt = stmt.where(Ride.ride_date == ride_date)
+    else:
+        stmt = stmt.where(Ride.ride_date >= now.date())
+    stmt = stmt.order_by(Ride.ride_date.asc(), Ride.start_time.asc(), Ride.id.asc()).limit(limit)
+    return (await session.execute(stmt)).all()
+
+
+class RouteSearchCache(TTLCache):
+    """
+    Короткий кэш выдачи поиска: (пара остановок, дата или None) -> строки fetch_route_drivers.
+    Запись сбрасывается, когда меняется поездка водителя, проходящая через этот отрезок
+    на эту дату (создание, удаление, бронь, массовая загрузка, шаблоны), или по TTL.
+    """
+
+    def __init__(self, max_size: int = SEARCH_CACHE_SIZE, ttl: int = SEARCH_CACHE_TTL):
+        super().__init__(max_size, ttl)
+
+    def invalidate(self, ride_date: date, role: str, origin_stop_id, dest_stop_id):
+        """Поездка изменилась: сбрасываем поиски на её дату (и без даты) по отрезкам внутри её маршрута"""
+        if role != "driver" or origin_stop_id is None:
+            # В выдачу попадают только водители с известными остановками
+            return
+        # Ответы inline-режима живут секунды и собираются из этого же кэша — проще сбросить все
+        inline_cache.clear()
+        affected = route_graph.contained_pairs((origin_stop_id, dest_stop_id))
+        for pair, cached_date in self.keys():
+            if cached_date in (ride_date, None) and pair in affected:
+                self.pop((pair, cached_date))
+
+    def invalidate_rows(self, rows):
+        """То же для строк (id, дата, роль, origin_stop_id, dest_stop_id, время) из insert_rides"""
+        for _, ride_date, role, origin_stop_id, dest_stop_id, _ in rows:
+            self.invalidate(ride_date, role, origin_stop_id, dest_stop_id)
+
+
+route_search_cache = RouteSearchCache()
+
+
+# --- INLINE-РЕЖИМ ---
+_PREPOSITIONS = {"из", "от", "с", "со", "в", "во", "до", "на"}
+_DATE_WORD_RE = re.compile(r"^(?:сегодня|завтра|послезавтра|\d{1,2}[./]\d{1,2}(?:[./]\d{2,4})?)$")
+
+
+def _match_stops(text: str) -> list:
+    """Остановки по началу названия (набирается прямо сейчас) или по падежной форме целиком"""
+    found = route_graph.trie.complete(text)
+    if not found:
+        stop_id = route_graph.resolve(text)
+        found = [stop_id] if stop_id is not None else []
+    return found
+
+
+def suggest_routes(query: str, today: date = None, limit: int = INLINE_MAX_ROUTES):
+    """
+    Недописанный запрос "Здравое Кра" -> ([(id откуда, id куда), ...], дата или None) без обращения к БД.
+    Последнее слово может быть началом названия; одна остановка — все направления из неё.
+    """
+    words = normalize_stop(query).split()
+    date_words = " ".join(w for w in words if _DATE_WORD_RE.match(w))
+    ride_date = None
+    if date_words:
+        raw = extract_ride_fields(date_words, today).get("date")
+        ride_date = datetime.strptime(raw, "%d.%m.%Y").date() if raw else None
+    # Предлог в конце оставляем: "в" — ещё и начало "вокзала"
+    words = [
+        w for i, w in enumerate(words)
+        if not _DATE_WORD_RE.match(w) and (w not in _PREPOSITIONS or i == len(words) - 1)
+    ]
+    if not words:
+        return [], ride_date
+
+    pairs = []
+    for split in range(1, len(words)):
+        origins = _match_stops(" ".join(words[:split]))
+        destinations = _match_stops(" ".join(words[split:]))
+        pairs += [(o, d) for o in origins for d in destinations if route_graph.span((o, d))]
+    if not pairs:
+        pairs = [(o, d) for o in _match_stops(" ".join(words)) for d in route_graph.destinations(o)]
+    return list(dict.fromkeys(pairs))[:limit], ride_date
+
+
+# Готовые ответы на inline-запросы по нормализованному тексту (normalize_stop)
+inline_cache = TTLCache(INLINE_CACHE_SIZE, INLINE_CACHE_TTL)
@@ -0,0 +1,90 @@
+import asyncio
+import logging
+from datetime import date, timedelta
+
+from sqlalchemy import or_, select, update
+
+from src.config import TEMPLATE_DAYS_AHEAD, TEMPLATE_INTERVAL
+from src.database.session import async_session
+from src.database.models import RideTemplate
+from src.services.bulk import insert_rides, match_batch
+from src.services.matching import segment_index
+from src.services.search import route_search_cache
+
+logger = logging.getLogger(__name__)
+
+WEEKDAYS_MASK = 0b0011111  # пн–пт
+
+
+def template_dates(template: RideTemplate, horizon: date, today: date) -> list:
+    """Даты после materialized_until (но не раньше завтра) по horizon включительно, попадающие в маску"""
+    start = max(template.materialized_until or today, today) + timedelta(days=1)
+    dates = (start + timedelta(days=i) for i in range(max((horizon - start).days + 1, 0)))
+    return [d for d in dates if template.weekday_mask & (1 << d.weekday())]
+
+
+def _ride_row(template: RideTemplate, ride_date: date) -> dict:
+    return {
+        "user_id": template.user_id,
+        "template_id": template.id,
+        "role": template.role,
+        "origin": template.origin,
+        "destination": template.destination,
+        "ride_date": ride_date,
+        "start_time": template.start_time,
+        "initial_seats": template.seats,
+        "seats": template.seats,
+        "origin_stop_id": template.origin_stop_id,
+        "dest_stop_id": template.dest_stop_id,
+    }
+
+
+async def materialize_templates(days_ahead: int = TEMPLATE_DAYS_AHEAD, template_ids: list = None) -> list:
+    """
+    Создаёт поездки активных шаблонов на days_ahead дней вперёд одним пакетным INSERT
+    и сразу ищет для них попутчиков одним запросом. Возвращает результат match_batch.
+    """
+    today = date.today()
+    horizon = today + timedelta(days=days_ahead)
+
+    async with async_session() as s:
+        stmt = select(RideTemplate).where(
+            RideTemplate.active.is_(True),
+            or_(RideTemplate.materialized_until.is_(None), RideTemplate.materialized_until < horizon)
+        )
+        if template_ids:
+            stmt = stmt.where(RideTemplate.id.in_(template_ids))
+        templates = (await s.execute(stmt)).scalars().all()
+        if not templates:
+            return []
+
+        rows = [_ride_row(t, d) for t in templates for d in template_dates(t, horizon, today)]
+        created_at, inserted = await insert_rides(s, rows) if rows else (None, [])
+        # Даты, удалённые пользователем вручную, не пересоздаются: отметка двигается вперёд
+        await s.execute(
+            update(RideTemplate)
+            .where(RideTemplate.id.in_([t.id for t in templates]))
+            .values(materialized_until=horizon)
+        )
+        await s.commit()
+        if not inserted:
+            return []
+
+        segment_index.add_rows(inserted)
+        route_search_cache.invalidate_rows(inserted)
+        matches = await match_batch(s, created_at)
+
+    logger.info(f"🔁 Materialized {len(inserted)} rides from {len(templates)} templates, {len(matches)} matches")
+    return matches
+
+
+async def auto_materialize_templates(on_matches=None):
+    """Фоновая задача: раз в TEMPLATE_INTERVAL секунд досоздаёт поездки по шаблонам"""
+    while True:
+        try:
+            matches = await materialize_templates()
+            if matches and on_matches:
+                on_matches(matches)
+        except Exception as e:
+            logger.error(f"Ошибка создания поездок по шаблонам: {e}")
+        await asyncio.sleep(TEMPLATE_INTERVAL)
@@ -0,0 +1,63 @@
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Ограниченный LRU-кэш в памяти процесса: запись живёт ttl секунд, при переполнении
+    вытесняется самая давно использованная. get() считает попадания и промахи для /metrics.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()  # key -> (expires_at, value)
+
+    def lookup(self, key):
+        """Значение или None, без учёта в статистике; просроченная запись удаляется"""
+        item = self._items.get(key)
+        if item is None:
+            return None
+        if item[0] <= time.monotonic():
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return item[1]
+
+    def get(self, key):
+        value = self.lookup(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self._items[key] = (time.monotonic() + self.ttl, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def pop(self, key):
+        item = self._items.pop(key, None)
+        return item[1] if item else None
+
+    def keys(self) -> list:
+        return list(self._items)
+
+    def clear(self):
+        self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._items),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
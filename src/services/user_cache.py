@@ -0,0 +1,79 @@
+import logging
+from typing import NamedTuple, Optional
+
+from sqlalchemy import select, update
+
+from src.config import USER_CACHE_SIZE, USER_CACHE_TTL
+from src.database.models import User, Ride
+from src.services.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+_UNSET = object()
+
+
+class CachedUser(NamedTuple):
+    id: int
+    telegram_id: int
+    username: Optional[str]
+
+
+class UserCache:
+    """
+    Ограниченный LRU-кэш telegram_id -> (User.id, telegram_id, username) с TTL.
+    Заполняется в /start и при промахах; если в апдейте пришёл другой username,
+    запись обновляется в БД и в кэше.
+    """
+
+    def __init__(self, max_size: int = USER_CACHE_SIZE, ttl: int = USER_CACHE_TTL):
+        self._items = TTLCache(max_size, ttl)  # telegram_id -> CachedUser
+
+    def put(self, user) -> CachedUser:
+        cached = CachedUser(user.id, user.telegram_id, user.username)
+        self._items.put(cached.telegram_id, cached)
+        return cached
+
+    def invalidate(self, telegram_id: int):
+        self._items.pop(telegram_id)
+
+    async def get(self, session, telegram_id: int, username=_UNSET) -> Optional[CachedUser]:
+        """
+        Пользователь по telegram_id или None, если он ещё не нажимал /start.
+        username из апдейта (может быть None) сверяется с сохранённым.
+        """
+        cached = self._items.get(telegram_id)
+        if not cached:
+            result = await session.execute(
+                select(User.id, User.telegram_id, User.username).where(User.telegram_id == telegram_id)
+            )
+            row = result.first()
+            if not row:
+                return None
+            cached = self.put(CachedUser(*row))
+
+        if username is not _UNSET and username != cached.username:
+            await session.execute(update(User).where(User.id == cached.id).values(username=username))
+            await session.commit()
+            cached = self.put(cached._replace(username=username))
+        return cached
+
+    async def telegram_id_for_ride(self, session, ride_id: int) -> Optional[int]:
+        """
+        telegram_id владельца поездки (take/confirm) одним запросом Ride JOIN User; заодно прогревает кэш.
+        Рассылке по совпадениям он не нужен: запросы матчинга уже возвращают User.
+        """
+        result = await session.execute(
+            select(User.id, User.telegram_id, User.username)
+            .join(Ride, Ride.user_id == User.id)
+            .where(Ride.id == ride_id)
+        )
+        row = result.first()
+        if not row:
+            return None
+        return self.put(CachedUser(*row)).telegram_id
+
+    def stats(self) -> dict:
+        return self._items.stats()
+
+
+user_cache = UserCache()
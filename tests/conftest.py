@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from src.database import session as db
+from src.database.session import Base
+import src.database.models  # noqa: F401 — регистрирует таблицы в Base.metadata
+from src.services.nlu import NLUProcessor
+
+
+@pytest.fixture
+async def engine(tmp_path, monkeypatch):
+    """Отдельная SQLite-база на тест; подменяет engine и async_session во всех модулях, которые их импортировали"""
+    # timeout: параллельные транзакции в тестах ждут блокировку SQLite, а не падают сразу
+    test_engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'bot.db'}", connect_args={"timeout": 30})
+    factory = async_sessionmaker(test_engine, class_=AsyncSession, expire_on_commit=False)
+    monkeypatch.setattr(db, "engine", test_engine)
+    monkeypatch.setattr(db, "async_session", factory)
+    for module in ("src.bot.handlers", "src.services.templates", "src.services.cleanup"):
+        monkeypatch.setattr(f"{module}.async_session", factory)
+    yield test_engine
+    await test_engine.dispose()
+
+
+@pytest.fixture
+async def session_factory(engine):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(db._load_route_network)
+    return db.async_session
+
+
+class ProtalkStub:
+    """Локальная заглушка pro-talk: задержка, код ответа и обрывы соединения задаются из теста"""
+
+    def __init__(self):
+        self.base_url = None
+        self.delay = 0.0
+        self.delays = []  # задержки следующих запросов по очереди; когда кончатся — delay
+        self.status = 200
+        self.reply = "Здравствуйте! Откуда и куда поедете?"
+        self.drop_next = 0  # сколько следующих запросов оборвать без ответа
+        self.requests = 0
+        self.messages = []  # поле "message" каждого запроса
+        self.peers = set()  # клиентские порты: сколько TCP-соединений открыл клиент
+
+    async def handle(self, request):
+        self.requests += 1
+        self.peers.add(request.transport.get_extra_info("peername")[1])
+        self.messages.append((await request.json())["message"])
+        if self.drop_next:
+            self.drop_next -= 1
+            request.transport.close()
+            return web.Response()
+        delay = self.delays.pop(0) if self.delays else self.delay
+        if delay:
+            await asyncio.sleep(delay)
+        if self.status != 200:
+            return web.Response(status=self.status, text="upstream error")
+        return web.json_response({"done": self.reply})
+
+
+@pytest.fixture
+async def protalk_stub():
+    stub = ProtalkStub()
+    app = web.Application()
+    app.router.add_post("/ask/{token}", stub.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    stub.base_url = f"http://127.0.0.1:{port}/ask"
+    yield stub
+    await runner.cleanup()
+
+
+@pytest.fixture
+async def stub_nlu(protalk_stub, monkeypatch):
+    """NLUProcessor, который ходит в заглушку; локальный разбор выключен, чтобы каждый вызов шёл в HTTP"""
+    monkeypatch.setattr("src.services.nlu.parse_ride_message", lambda *a, **k: {})
+    processor = NLUProcessor()
+    processor.api_token, processor.bot_id = "token", "1"
+    processor.base_url = protalk_stub.base_url
+    yield processor
+    await processor.close()
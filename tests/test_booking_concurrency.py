@@ -0,0 +1,102 @@
+import asyncio
+from datetime import date, time, timedelta
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+from sqlalchemy import func, select
+
+from src.bot.handlers import confirm_booking, take_passenger
+from src.database.models import Booking, Ride, User
+
+RIDE_DATE = date.today() + timedelta(days=1)
+PARALLEL = 200
+
+
+def callback(data: str, user_id: int = 1):
+    return SimpleNamespace(
+        data=data,
+        from_user=SimpleNamespace(id=user_id, username="driver"),
+        answer=AsyncMock(),
+        message=SimpleNamespace(text="карточка", edit_text=AsyncMock()),
+        bot=SimpleNamespace(send_message=AsyncMock()),
+    )
+
+
+def ride(user, role, seats):
+    return Ride(
+        user=user, role=role, origin="Здравое", destination="Краснодар", ride_date=RIDE_DATE,
+        start_time=time(9, 0), initial_seats=seats, seats=seats
+    )
+
+
+async def seed(session_factory, passengers: int, driver_seats: int):
+    """Водитель с driver_seats местами и passengers пассажиров по одному месту; id поездок"""
+    async with session_factory() as s:
+        driver = User(telegram_id=1, username="driver")
+        driver_ride = ride(driver, "driver", driver_seats)
+        passenger_rides = [ride(User(telegram_id=1000 + i), "passenger", 1) for i in range(passengers)]
+        s.add_all([driver_ride, *passenger_rides])
+        await s.commit()
+        return driver_ride.id, [r.id for r in passenger_rides]
+
+
+async def add_bookings(session_factory, driver_ride_id, passenger_ride_ids) -> list:
+    async with session_factory() as s:
+        bookings = [Booking(driver_ride_id=driver_ride_id, passenger_ride_id=p, status="pending") for p in passenger_ride_ids]
+        s.add_all(bookings)
+        await s.commit()
+        return [b.id for b in bookings]
+
+
+async def driver_seats(session_factory, ride_id) -> int:
+    async with session_factory() as s:
+        return (await s.execute(select(Ride.seats).where(Ride.id == ride_id))).scalar_one()
+
+
+async def statuses(session_factory) -> dict:
+    async with session_factory() as s:
+        rows = await s.execute(select(Booking.status, func.count()).group_by(Booking.status))
+        return dict(rows.all())
+
+
+async def test_parallel_confirms_never_oversell(session_factory):
+    seats = 3
+    driver_ride_id, passenger_ride_ids = await seed(session_factory, PARALLEL, seats)
+    booking_ids = await add_bookings(session_factory, driver_ride_id, passenger_ride_ids)
+
+    await asyncio.gather(*(confirm_booking(callback(f"confirm_{b}")) for b in booking_ids))
+
+    assert await driver_seats(session_factory, driver_ride_id) == 0
+    result = await statuses(session_factory)
+    assert result.get("confirmed") == seats
+    assert result.get("rejected") == PARALLEL - seats
+    assert "pending" not in result
+
+
+async def test_same_booking_confirmed_once(session_factory):
+    driver_ride_id, passenger_ride_ids = await seed(session_factory, 1, 3)
+    (booking_id,) = await add_bookings(session_factory, driver_ride_id, passenger_ride_ids)
+
+    callbacks = [callback(f"confirm_{booking_id}") for _ in range(PARALLEL)]
+    await asyncio.gather(*(confirm_booking(cb) for cb in callbacks))
+
+    assert await driver_seats(session_factory, driver_ride_id) == 2
+    assert await statuses(session_factory) == {"confirmed": 1}
+    confirmed = [cb for cb in callbacks if cb.answer.await_args.args == ("Поездка подтверждена!",)]
+    assert len(confirmed) == 1
+
+
+async def test_parallel_takes_create_one_booking(session_factory):
+    driver_ride_id, (passenger_ride_id,) = await seed(session_factory, 1, 3)
+
+    callbacks = [callback(f"take_{passenger_ride_id}_{driver_ride_id}") for _ in range(PARALLEL)]
+    await asyncio.gather(*(take_passenger(cb) for cb in callbacks))
+
+    async with session_factory() as s:
+        count = (await s.execute(select(func.count()).select_from(Booking))).scalar_one()
+    assert count == 1
+    assert await driver_seats(session_factory, driver_ride_id) == 3
+    # Пассажир получает одно уведомление, остальным нажатиям — "уже откликались"
+    assert sum(cb.bot.send_message.await_count for cb in callbacks) == 1
+    repeated = [cb for cb in callbacks if cb.answer.await_args.args == ("Вы уже откликались на этого пассажира",)]
+    assert len(repeated) == PARALLEL - 1
@@ -0,0 +1,135 @@
+import io
+import time
+from collections import Counter
+from datetime import date, time as dtime, timedelta
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+from sqlalchemy import func, select
+
+from src.bot.handlers import BULK_FORBIDDEN, bulk_import, bulk_start, notify_batch_matches
+from src.config import BULK_NOTIFY_LIMIT
+from src.database.models import Ride, User
+from src.services.user_cache import UserCache
+
+UPLOADER = 1
+BULK_ROWS = 10_000
+DAYS = 10
+START = date.today() + timedelta(days=1)
+# (откуда, куда) на маршруте "Здравое — Краснодар через Северскую"
+PAIRS = [("Здравое", "Краснодар"), ("Сказочный край", "Северская"), ("Григорьевская", "Энем")]
+
+
+class Recorder:
+    """Вместо очереди уведомлений: кому сколько карточек поставлено"""
+
+    def __init__(self):
+        self.per_chat = Counter()
+
+    def enqueue(self, chat_id, text, **kwargs):
+        self.per_chat[chat_id] += 1
+        return True
+
+
+@pytest.fixture
+def bulk_env(monkeypatch):
+    recorder = Recorder()
+    monkeypatch.setattr("src.bot.handlers.notifier", recorder)
+    monkeypatch.setattr("src.bot.handlers.user_cache", UserCache())
+    monkeypatch.setattr("src.bot.handlers.BULK_ALLOWED_IDS", {UPLOADER})
+    return recorder
+
+
+def message(user_id: int = UPLOADER, content: bytes = b""):
+    return SimpleNamespace(
+        from_user=SimpleNamespace(id=user_id, username="carrier"),
+        document=SimpleNamespace(file_size=len(content)),
+        bot=SimpleNamespace(download=AsyncMock(return_value=io.BytesIO(content))),
+        answer=AsyncMock(),
+    )
+
+
+def bulk_csv(rows: int) -> bytes:
+    lines = ["роль;откуда;куда;дата;время;места"]
+    for i in range(rows):
+        role = "водитель" if i % 2 else "пассажир"
+        origin, dest = PAIRS[i % len(PAIRS)]
+        ride_date = START + timedelta(days=i % DAYS)
+        lines.append(f"{role};{origin};{dest};{ride_date:%d.%m.%Y};{7 + i % 3:02d}:00;{1 + i % 3}")
+    return "\n".join(lines).encode()
+
+
+async def seed_others(session_factory, per_day: int = 3):
+    """Поездки других пользователей на весь маршрут: по per_day водителей и пассажиров в день"""
+    async with session_factory() as s:
+        for n in range(per_day):
+            driver, passenger = User(telegram_id=100 + n), User(telegram_id=200 + n)
+            for day in range(DAYS):
+                for user, role in ((driver, "driver"), (passenger, "passenger")):
+                    s.add(Ride(
+                        user=user, role=role, origin="Сказочный край", destination="Краснодар",
+                        ride_date=START + timedelta(days=day), start_time=dtime(8, 0), initial_seats=3, seats=3
+                    ))
+        await s.commit()
+
+
+async def test_bulk_is_limited_to_allowed_ids(bulk_env, session_factory):
+    state = AsyncMock()
+    stranger = message(user_id=2)
+    await bulk_start(stranger, state)
+    stranger.answer.assert_awaited_once_with(BULK_FORBIDDEN)
+    state.set_state.assert_not_awaited()
+
+    # Файл от того, кому доступ не выдан (или его отозвали), не загружается
+    stranger = message(user_id=2, content=bulk_csv(3))
+    await bulk_import(stranger, state)
+    stranger.answer.assert_awaited_once_with(BULK_FORBIDDEN)
+    stranger.bot.download.assert_not_awaited()
+
+    carrier = message()
+    await bulk_start(carrier, state)
+    state.set_state.assert_awaited_once()
+
+
+def test_fan_out_is_capped_per_recipient(bulk_env):
+    driver = User(id=1, telegram_id=100)
+    passengers = [User(id=10 + i, telegram_id=1000 + i) for i in range(50)]
+    ride = SimpleNamespace(
+        id=1, role="driver", origin="Здравое", destination="Краснодар", ride_date=START,
+        start_time=dtime(8, 0), initial_seats=1
+    )
+    passenger_ride = SimpleNamespace(**{**vars(ride), "role": "passenger"})
+    # 50 новых пассажиров одному водителю и 50 попутчиков одному новому водителю
+    matches = [(passenger_ride, p, ride, driver) for p in passengers]
+    matches += [(ride, User(id=2, telegram_id=200), passenger_ride, p) for p in passengers]
+
+    skipped = notify_batch_matches(matches, limit=10)
+
+    assert bulk_env.per_chat == {100: 10, 200: 10}
+    assert skipped == 80
+
+
+async def test_bulk_import_10k_rows(bulk_env, session_factory):
+    await seed_others(session_factory)
+    content = bulk_csv(BULK_ROWS)
+    m = message(content=content)
+
+    started = time.perf_counter()
+    await bulk_import(m, AsyncMock())
+    elapsed = time.perf_counter() - started
+
+    async with session_factory() as s:
+        uploaded = (await s.execute(
+            select(func.count()).select_from(Ride).join(User).where(User.telegram_id == UPLOADER)
+        )).scalar_one()
+    summary = m.answer.await_args.args[0]
+    print(f"\nbulk import: {BULK_ROWS} rows in {elapsed:.2f}s ({BULK_ROWS / elapsed:.0f} rows/s)\n{summary}")
+
+    assert uploaded == BULK_ROWS
+    assert summary.startswith(f"✅ Загружено поездок: {BULK_ROWS}")
+    # Каждый получатель — и сам перевозчик, и чужие водители — получил не больше лимита карточек
+    assert bulk_env.per_chat and max(bulk_env.per_chat.values()) <= BULK_NOTIFY_LIMIT
+    assert {100, 101, 102} <= set(bulk_env.per_chat)
+    # Порог с большим запасом: локально ~1600 строк/с вместе с подбором попутчиков
+    assert BULK_ROWS / elapsed > 300
@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+from src.services.circuit import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from src.services.nlu import NLUProcessor
+
+
+def make_breaker(**overrides):
+    params = dict(
+        name="test", window=60, min_calls=2, error_rate=0.5, slow_call=10,
+        slow_rate=1.0, reset_timeout=0, half_open_probes=1
+    )
+    params.update(overrides)
+    return CircuitBreaker(**params)
+
+
+def trip(breaker):
+    for _ in range(breaker.min_calls):
+        breaker.record(breaker.acquire(), False, 0.1)
+
+
+def test_opens_on_error_rate():
+    breaker = make_breaker(reset_timeout=60)
+    trip(breaker)
+    assert breaker.state == OPEN
+    assert breaker.acquire() is None
+
+
+def test_probe_success_closes():
+    breaker = make_breaker()
+    trip(breaker)
+    probe = breaker.acquire()
+    assert probe.probe and breaker.state == HALF_OPEN
+    assert breaker.acquire() is None  # единственное место пробного запроса занято
+    breaker.record(probe, True, 0.1)
+    assert breaker.state == CLOSED
+
+
+def test_released_probe_frees_its_slot():
+    breaker = make_breaker()
+    trip(breaker)
+    probe = breaker.acquire()
+    breaker.release(probe)  # отмена / ошибка до отправки — ответа не было
+    assert breaker.acquire() is not None
+
+
+def test_release_after_record_is_noop():
+    breaker = make_breaker(half_open_probes=2)
+    trip(breaker)
+    first, second = breaker.acquire(), breaker.acquire()
+    breaker.record(first, True, 0.1)
+    breaker.release(first)
+    assert breaker.acquire() is None  # одно место занято second, одно — засчитанным успехом
+    breaker.record(second, True, 0.1)
+    assert breaker.state == CLOSED
+
+
+def test_late_response_does_not_settle_probe():
+    breaker = make_breaker()
+    stale = breaker.acquire()  # отправлен, пока предохранитель был замкнут
+    trip(breaker)
+    probe = breaker.acquire()
+    breaker.record(stale, True, 0.1)
+    assert breaker.state == HALF_OPEN
+    assert breaker.acquire() is None
+    breaker.record(probe, False, 0.1)
+    assert breaker.state == HALF_OPEN  # reset_timeout=0: снова открыт и сразу ждёт пробу
+    assert breaker.times_opened == 2
+
+
+@pytest.fixture
+def nlu(monkeypatch):
+    monkeypatch.setattr("src.services.nlu.parse_ride_message", lambda *a, **k: {})
+    processor = NLUProcessor()
+    processor.api_token, processor.bot_id = "token", "1"
+    processor.breaker = make_breaker()
+    trip(processor.breaker)
+    return processor
+
+
+async def test_cancelled_probe_is_released(nlu, monkeypatch):
+    async def hang(url, payload, permit):
+        await asyncio.sleep(3600)
+
+    monkeypatch.setattr(nlu, "_post", hang)
+    task = asyncio.create_task(nlu.parse_intent("привет", 1))
+    while not nlu.breaker._probes_in_flight:  # ждём, пока пробный запрос уйдёт
+        await asyncio.sleep(0)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert nlu.breaker.acquire() is not None
+
+
+async def test_probe_failing_before_request_is_released(nlu):
+    nlu.bot_id = "not-a-number"
+    with pytest.raises(ValueError):
+        await nlu.parse_intent("привет", 1)
+    assert nlu.breaker.acquire() is not None
@@ -0,0 +1,89 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select
+
+from src.database.models import Booking, Ride, RideArchive, User
+from src.services import cleanup
+
+TODAY = date.today()
+
+
+@pytest.fixture(autouse=True)
+def no_pause(monkeypatch):
+    monkeypatch.setattr(cleanup, "CLEANUP_BATCH_PAUSE", 0)
+
+
+def ride(user, ride_date, role="driver"):
+    return Ride(
+        user=user, role=role, origin="Здравое", destination="Краснодар", ride_date=ride_date,
+        initial_seats=2, seats=2, created_at=datetime.now() - timedelta(days=30)
+    )
+
+
+async def seed(session_factory, old: int, upcoming: int) -> list:
+    """old прошедших поездок с бронями и upcoming будущих, созданных так же давно; id прошедших"""
+    async with session_factory() as s:
+        user = User(telegram_id=1)
+        old_rides = [ride(user, TODAY - timedelta(days=3 + i % 5)) for i in range(old)]
+        passenger = ride(user, TODAY - timedelta(days=3), role="passenger")
+        upcoming_rides = [ride(user, TODAY + timedelta(days=7)) for _ in range(upcoming)]
+        s.add_all([*old_rides, passenger, *upcoming_rides])
+        await s.flush()
+        s.add_all([Booking(driver_ride_id=r.id, passenger_ride_id=passenger.id) for r in old_rides])
+        await s.commit()
+        return [r.id for r in old_rides] + [passenger.id]
+
+
+async def count(session_factory, model) -> int:
+    async with session_factory() as s:
+        return (await s.execute(select(func.count()).select_from(model))).scalar_one()
+
+
+async def test_deletes_by_ride_date_in_batches(session_factory):
+    old_ids = await seed(session_factory, old=24, upcoming=5)
+
+    stats = await cleanup.clean_old_rides(keep_days=2, batch_size=10, archive=False)
+
+    assert stats["deleted"] == len(old_ids) == 25
+    assert stats["batches"] == 3
+    assert stats["rows_per_sec"] > 0 and stats["lock_time"] <= stats["duration"]
+    # Будущие поездки остаются, хоть и созданы давно; брони ушли вместе с поездками
+    assert await count(session_factory, Ride) == 5
+    assert await count(session_factory, Booking) == 0
+    assert await count(session_factory, RideArchive) == 0
+
+
+async def test_archive_keeps_ride_history(session_factory):
+    old_ids = await seed(session_factory, old=12, upcoming=1)
+
+    await cleanup.clean_old_rides(keep_days=2, batch_size=5, archive=True)
+
+    async with session_factory() as s:
+        archived = (await s.execute(select(RideArchive))).scalars().all()
+    assert sorted(a.ride_id for a in archived) == sorted(old_ids)
+    assert all(a.origin == "Здравое" and a.archived_at for a in archived)
+    assert await count(session_factory, Ride) == 1
+
+
+async def test_archive_survives_ride_id_reuse(session_factory):
+    # SQLite отдаёт новой поездке id удалённой, если та была последней в таблице
+    async with session_factory() as s:
+        user = User(telegram_id=1)
+        s.add(user)
+        await s.commit()
+
+    ride_ids = []
+    for seats in (1, 3):
+        async with session_factory() as s:
+            old = ride(await s.get(User, user.id), TODAY - timedelta(days=5))
+            old.seats = seats
+            s.add(old)
+            await s.commit()
+            ride_ids.append(old.id)
+        await cleanup.clean_old_rides(keep_days=2, batch_size=10, archive=True)
+
+    assert ride_ids[0] == ride_ids[1]
+    async with session_factory() as s:
+        archived = (await s.execute(select(RideArchive).order_by(RideArchive.id))).scalars().all()
+    assert [(a.ride_id, a.seats) for a in archived] == [(ride_ids[0], 1), (ride_ids[0], 3)]
@@ -0,0 +1,103 @@
+from datetime import date, datetime
+
+import pytest
+
+from src.services.fast_parser import extract_ride_fields, is_self_contained, parse_ride_message
+
+TODAY = date(2026, 10, 17)  # суббота
+NOW = datetime(2026, 10, 17, 12, 0)
+
+
+def ride(origin, destination, ride_date, start_time, seats):
+    return {"origin": origin, "destination": destination, "date": ride_date, "start_time": start_time, "seats": seats}
+
+
+# (сообщение, роль, ожидаемый результат parse_ride_message без raw_text; None — ожидаемый промах, уходит в LLM)
+CORPUS = [
+    ("Из Здравого в Краснодар завтра в 9:00, 2 места", "driver",
+     ride("Здравое", "Краснодар", "18.10.2026", "09:00", 2)),
+    ("из Краснодара в Сказочный край сегодня в 18:00, одно место", "passenger",
+     ride("Краснодар", "Сказочный край", "17.10.2026", "18:00", 1)),
+    ("Из Сказочного края в Краснодар завтра в 9 утра, есть два места", "driver",
+     ride("Сказочный край", "Краснодар", "18.10.2026", "09:00", 2)),
+    ("Еду из Энема до Здравого 25.12 в 7 вечера, 3 места", "driver",
+     ride("Энем", "Здравое", "25.12.2026", "19:00", 3)),
+    ("Краснодар - Здравое послезавтра 6:30 3 места", "driver",
+     ride("Краснодар", "Здравое", "19.10.2026", "06:30", 3)),
+    ("В аэропорт из Здравого 20 октября в 5 утра, 1 место", "passenger",
+     ride("Здравое", "Аэропорт Краснодар", "20.10.2026", "05:00", 1)),
+    ("Нужно на жд вокзал из Афипского завтра, 2 человека", "passenger",
+     ride("Афипский", "Ж/д вокзал Краснодар", "18.10.2026", None, 2)),
+    ("Из Здравого в Краснодар через 2 дня в 8 утра, 2 места", "driver",
+     ride("Здравое", "Краснодар", "19.10.2026", "08:00", 2)),
+    ("Из Здравого в Краснодар завтра в 9.05, 1 место", "driver",
+     ride("Здравое", "Краснодар", "18.10.2026", "09:05", 1)),
+    ("Из Здравого в Краснодар 9.05 в 18:00, 1 место", "driver",
+     ride("Здравое", "Краснодар", "09.05.2027", "18:00", 1)),
+    ("из Григорьевской в Краснодар 1.11.2026 в 2 дня, 4 места", "driver",
+     ride("Григорьевская", "Краснодар", "01.11.2026", "14:00", 4)),
+    ("Из Яблоновского в Краснодар завтра в 7:30, 3 места", "driver",
+     ride("Яблоновский", "Краснодар", "18.10.2026", "07:30", 3)),
+    ("Из Смоленской до Краснодара 20.10 в 8 утра, 2 места", "driver",
+     ride("Смоленская", "Краснодар", "20.10.2026", "08:00", 2)),
+    ("Северская - Краснодар завтра в 10:00, 1 место", "passenger",
+     ride("Северская", "Краснодар", "18.10.2026", "10:00", 1)),
+    # Ожидаемые промахи: чего-то не хватает или сообщение неоднозначно
+    ("Из Здравого в Краснодар завтра", "driver", None),           # ни времени, ни мест
+    ("Из Здравого в Краснодар завтра, 2 места", "driver", None),  # водителю нужно время
+    ("Кто едет завтра в Краснодар?", "passenger", None),          # вопрос
+    ("Здравое завтра в 9:00, 1 место", "driver", None),           # одна остановка
+    ("Из Здравого в Краснодар вчера в 9:00, 1 место", "driver", None),  # прошлое
+    ("Из Здравого в Краснодар в понедельник в 9:00, 1 место", "driver", None),  # день недели — к LLM
+    ("Из Здравого через Энем в Краснодар завтра в 9:00, 1 место", "driver", None),  # три города
+    ("Добрый день!", "passenger", None),
+    ("Из Здравого в Краснодар завтра в 9:00 2 места, нет, в 10:00", "driver", None),  # поправка
+    ("Из Здравого в Краснодар завтра в 18:00, 2 места, обратно послезавтра в 20:00", "driver", None),  # туда-обратно
+    ("Из Здравого в Краснодар завтра в 9 утра, 2 места, или в 10:30", "driver", None),  # два варианта
+    ("Из Здравого в Краснодар сегодня в 5:00, 1 место", "driver", None),  # уже прошло
+]
+
+
+@pytest.mark.parametrize("text, role, expected", CORPUS, ids=[c[0] for c in CORPUS])
+def test_corpus(text, role, expected):
+    result = parse_ride_message(text, role, TODAY, NOW)
+    result.pop("raw_text", None)
+    assert result == (expected or {})
+
+
+def test_corpus_hit_rate():
+    hits = sum(1 for text, role, _ in CORPUS if parse_ride_message(text, role, TODAY, NOW))
+    expected_hits = sum(1 for *_, expected in CORPUS if expected)
+    assert hits == expected_hits
+    assert hits / len(CORPUS) >= 0.5
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("через 2 дня", {"date": "19.10.2026"}),
+    ("через три дня", {"date": "20.10.2026"}),
+    ("выезд в 2 дня", {"start_time": "14:00"}),
+    ("в 9.05", {"start_time": "09:05"}),
+    ("на 9.05", {"date": "09.05.2027"}),
+    ("в 9.05.2027", {"date": "09.05.2027"}),
+    ("из Здравого", {"origin": "Здравое"}),
+    ("Краснодар", {"city": "Краснодар"}),
+    ("3", {}),
+    ("завтра в 9:00, нет, в 10:00", {"date": "18.10.2026"}),
+    ("в 8:30 вечера", {"start_time": "20:30"}),
+    ("завтра или послезавтра в 9:00", {"start_time": "09:00"}),
+])
+def test_extract_ride_fields(text, expected):
+    assert extract_ride_fields(text, TODAY) == expected
+
+
+def test_time_passed_only_matters_today():
+    text = "Из Здравого в Краснодар {} в 5:00, 1 место"
+    assert not parse_ride_message(text.format("сегодня"), "driver", TODAY, NOW)
+    assert parse_ride_message(text.format("завтра"), "driver", TODAY, NOW)["start_time"] == "05:00"
+    assert parse_ride_message(text.format("сегодня"), "driver", TODAY, datetime(2026, 10, 17, 4, 0))
+
+
+def test_self_contained_ignores_time_as_date():
+    assert is_self_contained("Из Здравого в Краснодар завтра в 18:00", TODAY)
+    assert not is_self_contained("Из Здравого в Краснодар в 18:00", TODAY)
+    assert not is_self_contained("Из Здравого в Краснодар в 9.05", TODAY)
@@ -0,0 +1,132 @@
+import asyncio
+import time
+
+import pytest
+from aiogram import Bot, Dispatcher
+from aiohttp.test_utils import TestClient, TestServer
+
+import main
+from src.services import health as health_module
+from src.services.circuit import CircuitBreaker
+from src.services.health import HealthMonitor
+
+
+def breaker(opened: bool = False) -> CircuitBreaker:
+    result = CircuitBreaker(
+        name="test", window=60, min_calls=1, error_rate=0.5, slow_call=10, slow_rate=1.0, reset_timeout=60
+    )
+    if opened:
+        result.record(result.acquire(), False, 0.1)
+    return result
+
+
+class CountingSessions:
+    """Фабрика сессий поверх настоящей: считает пробы БД и может их ронять"""
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.opened = 0
+        self.fail = False
+
+    def __call__(self):
+        self.opened += 1
+        if self.fail:
+            raise ConnectionError("db is down")
+        return self.factory()
+
+
+@pytest.fixture
+def sessions(session_factory):
+    return CountingSessions(session_factory)
+
+
+def monitor(sessions, **kwargs) -> HealthMonitor:
+    result = HealthMonitor(**{"cache_ttl": 60, "max_update_age": 0, "max_poll_age": 120, **kwargs})
+    result.configure(sessions, breaker=breaker())
+    return result
+
+
+async def test_ready_and_cached(sessions):
+    health = monitor(sessions)
+
+    results = await asyncio.gather(*(health.readiness() for _ in range(50)))
+
+    assert all(r["ready"] and r["status"] == "ok" for r in results)
+    assert results[0]["checks"]["db"]["ok"] and results[0]["checks"]["polling"]["mode"] == "webhook"
+    # 50 одновременных опросов — одна проба БД
+    assert sessions.opened == 1
+
+
+async def test_probe_repeats_after_ttl(sessions):
+    health = monitor(sessions, cache_ttl=0.05)
+    await health.readiness()
+    await asyncio.sleep(0.06)
+    await health.readiness()
+    assert sessions.opened == 2
+
+
+async def test_db_failure_is_not_ready(sessions):
+    sessions.fail = True
+    result = await monitor(sessions).readiness()
+    assert not result["ready"] and result["status"] == "unavailable"
+    assert result["checks"]["db"] == {"ok": False, "error": "ConnectionError"}
+
+
+async def test_stale_updates_are_not_ready(sessions):
+    health = monitor(sessions, max_update_age=60)
+    health.last_update_at = time.monotonic() - 120
+    result = await health.readiness()
+    assert not result["ready"] and not result["checks"]["updates"]["ok"]
+
+
+async def test_polling_checks(sessions):
+    finished = asyncio.create_task(asyncio.sleep(0))
+    await finished
+    health = monitor(sessions)
+    health.configure(sessions, breaker=breaker(), polling_task=finished)
+    result = await health.readiness()
+    assert not result["ready"] and result["checks"]["polling"]["error"] == "polling task finished"
+
+    running = asyncio.create_task(asyncio.sleep(60))
+    health = monitor(sessions, max_poll_age=60)
+    health.configure(sessions, breaker=breaker(), polling_task=running)
+    health.last_poll_at = time.monotonic() - 120
+    assert not (await health.readiness())["ready"]
+    health._cached = None
+    health.mark_poll()
+    assert (await health.readiness())["ready"]
+    running.cancel()
+
+
+async def test_open_breaker_degrades_unless_required(sessions, monkeypatch):
+    health = monitor(sessions)
+    health.configure(sessions, breaker=breaker(opened=True))
+    result = await health.readiness()
+    assert result["ready"] and result["status"] == "degraded"
+
+    monkeypatch.setattr(health_module, "HEALTH_REQUIRE_NLU", True)
+    health._cached = None
+    result = await health.readiness()
+    assert not result["ready"] and result["checks"]["nlu"]["state"] == "open"
+
+
+async def test_endpoints(sessions, monkeypatch):
+    health = monitor(sessions)
+    monkeypatch.setattr(main, "health", health)
+    monkeypatch.setattr(main, "WEBHOOK_URL", None)
+    bot = Bot(token="123456:TEST")
+    client = TestClient(TestServer(main.create_app(Dispatcher(), bot)))
+    await client.start_server()
+    try:
+        assert (await client.get("/readyz")).status == 200
+
+        sessions.fail = True
+        health._cached = None
+        resp = await client.get("/readyz")
+        assert resp.status == 503 and (await resp.json())["status"] == "unavailable"
+        # /health — тот же readiness; liveness не зависит от БД
+        assert (await client.get("/health")).status == 503
+        assert (await client.get("/livez")).status == 200
+    finally:
+        await client.close()
+        await bot.session.close()
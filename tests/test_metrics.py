@@ -0,0 +1,97 @@
+import time
+
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Update
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.bot.middlewares import HandlerMetricsMiddleware
+from src.services.metrics import instrument_engine, registry
+
+# Бенчмарк накладных расходов инструментирования: один и тот же поток с метриками и без
+BENCH_UPDATES = 2000
+BENCH_QUERIES = 2000
+
+
+def metric_value(line_prefix: str) -> float:
+    for line in registry.render().splitlines():
+        if line.startswith(line_prefix + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+def message_update(update_id: int, bot: Bot) -> Update:
+    return Update.model_validate({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": 0, "text": "привет",
+            "chat": {"id": 1, "type": "private"}, "from": {"id": 1, "is_bot": False, "first_name": "Тест"},
+        },
+    }, context={"bot": bot})
+
+
+async def feed_updates(instrumented: bool) -> float:
+    """Секунд на один апдейт через диспетчер с пустым хендлером"""
+    router = Router()
+
+    @router.message()
+    async def bench_noop(message):
+        pass
+
+    if instrumented:
+        router.message.middleware(HandlerMetricsMiddleware())
+    dp = Dispatcher()
+    dp.include_router(router)
+    bot = Bot(token="123456:TEST")
+    updates = [message_update(i, bot) for i in range(BENCH_UPDATES)]
+    started = time.perf_counter()
+    for update in updates:
+        await dp.feed_update(bot, update)
+    elapsed = time.perf_counter() - started
+    await bot.session.close()
+    return elapsed / BENCH_UPDATES
+
+
+async def run_queries(engine) -> float:
+    """Секунд на один SELECT 1 через async-движок"""
+    async with engine.connect() as conn:
+        started = time.perf_counter()
+        for _ in range(BENCH_QUERIES):
+            await conn.execute(text("SELECT 1"))
+        return (time.perf_counter() - started) / BENCH_QUERIES
+
+
+async def test_handler_middleware_overhead():
+    counted = 'bot_handler_seconds_count{handler="bench_noop",status="ok"}'
+    before = metric_value(counted)
+    await feed_updates(instrumented=False)  # прогрев
+    plain = await feed_updates(instrumented=False)
+    instrumented = await feed_updates(instrumented=True)
+
+    print(
+        f"\nhandler: plain={plain * 1e6:.1f}us instrumented={instrumented * 1e6:.1f}us "
+        f"overhead={(instrumented - plain) * 1e6:.1f}us/update"
+    )
+    assert metric_value(counted) - before == BENCH_UPDATES
+    # Middleware добавляет единицы микросекунд на апдейт; порог с большим запасом для медленных CI
+    assert instrumented - plain < 100e-6
+
+
+async def test_engine_listeners_overhead():
+    engine = create_async_engine("sqlite+aiosqlite://")
+    counted = 'db_query_seconds_count{operation="SELECT"}'
+    try:
+        await run_queries(engine)  # прогрев
+        plain = await run_queries(engine)
+        before = metric_value(counted)
+        instrument_engine(engine)
+        instrumented = await run_queries(engine)
+    finally:
+        await engine.dispose()
+
+    print(
+        f"\nsql: plain={plain * 1e6:.1f}us instrumented={instrumented * 1e6:.1f}us "
+        f"overhead={(instrumented - plain) * 1e6:.1f}us/query"
+    )
+    assert metric_value(counted) - before == BENCH_QUERIES
+    assert instrumented - plain < 100e-6
@@ -0,0 +1,110 @@
+import json
+from datetime import date
+
+import pytest
+
+from src.services.nlu_cache import CacheBackend, NLUCache, SQLiteCacheBackend
+
+RIDE = {"origin": "Здравое", "destination": "Краснодар", "date": "18.10.2026", "start_time": "09:00", "seats": 2}
+
+
+def test_backend_is_abstract():
+    with pytest.raises(TypeError):
+        CacheBackend()
+
+    class NoClear(CacheBackend):
+        async def get(self, key):
+            return None
+
+        async def set(self, key, value, ttl):
+            pass
+
+    with pytest.raises(TypeError):
+        NoClear()
+
+
+def test_key_normalizes_text_but_keeps_role_and_date():
+    key = NLUCache.make_key("Из Здравого,  в Краснодар ЗАВТРА!", "driver", "17.10.2026")
+    assert key == NLUCache.make_key("из здравого в краснодар завтра", "driver", "17.10.2026")
+    assert NLUCache.make_key("Ёлка", None, "17.10.2026") == NLUCache.make_key("елка", None, "17.10.2026")
+    assert key != NLUCache.make_key("из здравого в краснодар завтра", "passenger", "17.10.2026")
+    # "завтра" завтра — уже другая дата
+    assert key != NLUCache.make_key("из здравого в краснодар завтра", "driver", "18.10.2026")
+
+
+async def test_get_returns_copy_and_counts():
+    cache = NLUCache(10, 60)
+    assert await cache.get("k") is None
+    await cache.set("k", RIDE)
+    value = await cache.get("k")
+    value["seats"] = 5
+    assert (await cache.get("k"))["seats"] == 2
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 1
+
+
+async def test_local_cache_cleared_at_midnight():
+    cache = NLUCache(10, 3600)
+    await cache.set("k", RIDE)
+    cache._date = date(2000, 1, 1)  # кэш заполнен "вчера"
+    assert await cache.get("k") is None
+    assert cache._date == date.today()
+
+
+async def test_sqlite_backend_roundtrip_and_expiry(tmp_path):
+    backend = SQLiteCacheBackend(str(tmp_path / "nlu.db"))
+    await backend.set("fresh", RIDE, 60)
+    await backend.set("stale", RIDE, -1)
+    assert await backend.get("fresh") == RIDE
+    assert await backend.get("stale") is None
+    await backend.clear()
+    assert await backend.get("fresh") is None
+
+
+async def test_replicas_share_backend(tmp_path):
+    path = str(tmp_path / "nlu.db")
+    first, second = NLUCache(10, 60, SQLiteCacheBackend(path)), NLUCache(10, 60, SQLiteCacheBackend(path))
+    await first.set("k", RIDE)
+    assert await second.get("k") == RIDE  # промах локального кэша второй реплики, попадание в общий
+    assert second.stats()["hits"] == 1
+    assert second._items.lookup("k") == RIDE  # и прогрев локального
+
+
+async def test_broken_backend_is_a_miss(tmp_path):
+    class Broken(CacheBackend):
+        async def get(self, key):
+            raise OSError("disk")
+
+        async def set(self, key, value, ttl):
+            raise OSError("disk")
+
+        async def clear(self):
+            pass
+
+    cache = NLUCache(10, 60, Broken())
+    await cache.set("k", RIDE)  # ошибка бэкенда не ломает запись в локальный кэш
+    assert await cache.get("k") == RIDE
+    assert await NLUCache(10, 60, Broken()).get("k") is None
+
+
+def reply_with(ride: dict) -> str:
+    return "Отлично, я сохраняю вашу поездку!\n" + json.dumps(ride, ensure_ascii=False)
+
+
+async def test_only_self_contained_complete_rides_are_cached(stub_nlu, protalk_stub):
+    protalk_stub.reply = reply_with(RIDE)
+    text = "Из Здравого в Краснодар завтра, подскажите"
+    first = await stub_nlu.parse_intent(text, user_id=1, role="driver")
+    second = await stub_nlu.parse_intent(text, user_id=2, role="driver")
+    assert first["origin"] == second["origin"] == "Здравое"
+    assert protalk_stub.requests == 1
+
+    # Ответ на "да, 2 места" собран из истории диалога — другому пользователю он не подходит
+    await stub_nlu.parse_intent("да, 2 места", user_id=1, role="driver")
+    await stub_nlu.parse_intent("да, 2 места", user_id=2, role="driver")
+    assert protalk_stub.requests == 3
+
+    # Неполный ответ (нет даты) не кэшируется даже для самодостаточного текста
+    protalk_stub.reply = reply_with({"origin": "Здравое", "destination": "Краснодар"})
+    await stub_nlu.parse_intent("Из Здравого в Краснодар послезавтра", user_id=1, role="driver")
+    await stub_nlu.parse_intent("Из Здравого в Краснодар послезавтра", user_id=2, role="driver")
+    assert protalk_stub.requests == 5
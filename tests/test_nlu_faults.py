@@ -0,0 +1,127 @@
+import asyncio
+
+import pytest
+
+from src.services.circuit import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+# Самодостаточное сообщение: маршрут и дата в тексте, поэтому запрос можно хеджировать
+ROUTE_TEXT = "Из Здравого в Краснодар завтра"
+
+
+def breaker(**overrides) -> CircuitBreaker:
+    params = dict(
+        name="test", window=60, min_calls=4, error_rate=0.5, slow_call=1.0,
+        slow_rate=0.5, reset_timeout=60, half_open_probes=1
+    )
+    params.update(overrides)
+    return CircuitBreaker(**params)
+
+
+def recorded(nlu) -> list:
+    """(успех, медленный) каждого исхода, записанного в окно предохранителя"""
+    return [(ok, slow) for _, ok, slow in nlu.breaker._calls]
+
+
+@pytest.fixture
+def nlu(stub_nlu):
+    stub_nlu.breaker = breaker()
+    return stub_nlu
+
+
+@pytest.fixture
+def hedging(monkeypatch):
+    monkeypatch.setattr("src.services.nlu.NLU_HEDGE_DELAY", 0.05)
+
+
+async def test_server_errors_open_breaker(nlu, protalk_stub):
+    protalk_stub.status = 500
+    for user_id in range(4):
+        assert await nlu.parse_intent("привет", user_id) == {}
+
+    assert nlu.breaker.state == OPEN
+    # Разомкнутый предохранитель не пускает запрос в pro-talk
+    assert await nlu.parse_intent("привет", 5) == {}
+    assert protalk_stub.requests == 4
+
+
+async def test_dropped_connections_count_as_errors(nlu, protalk_stub):
+    protalk_stub.drop_next = 4
+    results = [await nlu.parse_intent("привет", user_id) for user_id in range(4)]
+
+    assert results == [{}] * 4
+    assert recorded(nlu) == [(False, False)] * 4
+    assert nlu.breaker.state == OPEN
+    assert nlu.latency.snapshot()["errors"] == 4
+
+
+async def test_slow_responses_open_breaker(nlu, protalk_stub):
+    nlu.breaker = breaker(slow_call=0.1)
+    protalk_stub.delay = 0.15
+    for user_id in range(4):
+        assert (await nlu.parse_intent("привет", user_id))["raw_text"] == protalk_stub.reply
+
+    assert recorded(nlu) == [(True, True)] * 4
+    assert nlu.breaker.state == OPEN
+
+
+async def test_semaphore_wait_is_not_latency(nlu, protalk_stub):
+    # Один слот: девятый запрос ждёт очереди ~0.4 с, но сам pro-talk отвечает за 0.05 с
+    nlu._semaphore = asyncio.Semaphore(1)
+    nlu.breaker = breaker(slow_call=0.2, min_calls=2)
+    protalk_stub.delay = 0.05
+
+    await asyncio.gather(*(nlu.parse_intent("привет", user_id) for user_id in range(9)))
+
+    assert recorded(nlu) == [(True, False)] * 9
+    assert nlu.breaker.state == CLOSED
+    assert nlu.latency.snapshot()["p99"] < 0.2
+
+
+async def test_hedged_request_records_one_outcome(nlu, protalk_stub, hedging):
+    protalk_stub.delays = [0.5]  # первичный запрос висит, копия отвечает сразу
+
+    result = await nlu.parse_intent(ROUTE_TEXT, 1)
+
+    assert result["raw_text"] == protalk_stub.reply
+    assert nlu.hedges == {"sent": 1, "won": 1}
+    assert protalk_stub.requests == 2
+    assert recorded(nlu) == [(True, False)]
+
+
+async def test_hedged_failures_record_one_outcome(nlu, protalk_stub, hedging):
+    protalk_stub.delays = [0.1]
+    protalk_stub.status = 500
+
+    assert await nlu.parse_intent(ROUTE_TEXT, 1) == {}
+
+    assert nlu.hedges == {"sent": 1, "won": 0}
+    assert recorded(nlu) == [(False, False)]
+
+
+async def test_hedged_probe_closes_breaker(nlu, protalk_stub, hedging):
+    nlu.breaker = breaker(min_calls=1, reset_timeout=0)
+    nlu.breaker.record(nlu.breaker.acquire(), False, 0.1)
+    assert nlu.breaker.state == HALF_OPEN
+    # Пробный запрос хеджируется только при замкнутом предохранителе — проверяем _post_hedged напрямую
+    permit = nlu.breaker.acquire()
+    protalk_stub.delays = [0.5]
+
+    status, _ = await nlu._post_hedged(f"{protalk_stub.base_url}/token", {"message": "x"}, permit)
+
+    assert status == 200 and nlu.breaker.state == CLOSED
+
+
+async def test_cancelled_hedge_leaves_no_tasks(nlu, protalk_stub, hedging):
+    protalk_stub.delay = 0.5
+
+    call = asyncio.create_task(nlu.parse_intent(ROUTE_TEXT, 1))
+    while protalk_stub.requests < 2:  # ушли и первичный запрос, и копия
+        await asyncio.sleep(0.01)
+    call.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await call
+
+    # Обе попытки отменены и дождались, а не брошены висеть
+    attempts = [t for t in asyncio.all_tasks() if t.get_coro().__qualname__ == "NLUProcessor._send"]
+    assert attempts == []
+    assert recorded(nlu) == []
@@ -0,0 +1,70 @@
+import asyncio
+import time
+
+import aiohttp
+
+from src.config import NLU_POOL_SIZE
+from src.services.metrics import LatencyStats
+
+# Бенчмарк против локальной заглушки: задержка сети и pro-talk вынесена за скобки,
+# остаются накладные расходы клиента (TCP-рукопожатие, создание сессии)
+BENCH_REQUESTS = 300
+BENCH_CONCURRENCY = 30
+
+
+async def run_bench(call, requests: int = BENCH_REQUESTS, concurrency: int = BENCH_CONCURRENCY) -> LatencyStats:
+    stats = LatencyStats(window=requests)
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with gate:
+            started = time.perf_counter()
+            await call(i)
+            stats.observe(time.perf_counter() - started)
+
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return stats
+
+
+async def test_pooled_session_reuses_connections(stub_nlu, protalk_stub):
+    async def pooled(i):
+        result = await stub_nlu.parse_intent("привет", user_id=i)
+        assert result["raw_text"] == protalk_stub.reply
+
+    pooled_stats = await run_bench(pooled)
+    pooled_connections = len(protalk_stub.peers)
+
+    url = f"{protalk_stub.base_url}/token"
+    protalk_stub.peers.clear()
+
+    async def fresh(i):
+        # Прежнее поведение: новая ClientSession (и новое соединение) на каждый запрос
+        async with aiohttp.ClientSession() as session:
+            async with session.post(url, json={"bot_id": 1, "chat_id": str(i), "message": "привет"}) as resp:
+                await resp.text()
+
+    fresh_stats = await run_bench(fresh)
+
+    print(
+        f"\npooled: p50={pooled_stats.percentile(0.5) * 1000:.1f}ms p99={pooled_stats.percentile(0.99) * 1000:.1f}ms "
+        f"connections={pooled_connections}\n"
+        f"fresh:  p50={fresh_stats.percentile(0.5) * 1000:.1f}ms p99={fresh_stats.percentile(0.99) * 1000:.1f}ms "
+        f"connections={len(protalk_stub.peers)}"
+    )
+    assert stub_nlu.latency.snapshot()["count"] == BENCH_REQUESTS
+    assert stub_nlu.latency.snapshot()["errors"] == 0
+    # Соединения переиспользуются и не выходят за размер пула
+    assert pooled_connections <= NLU_POOL_SIZE
+    assert len(protalk_stub.peers) > NLU_POOL_SIZE
+
+
+async def test_session_survives_calls_and_restarts_after_close(stub_nlu):
+    await stub_nlu.parse_intent("привет", user_id=1)
+    session = stub_nlu._session
+    await stub_nlu.parse_intent("привет", user_id=2)
+    assert stub_nlu._session is session
+
+    await stub_nlu.close()
+    assert stub_nlu._session is None
+    await stub_nlu.parse_intent("привет", user_id=3)
+    assert stub_nlu._session is not None and not stub_nlu._session.closed
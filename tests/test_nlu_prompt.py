@@ -0,0 +1,58 @@
+import asyncio
+
+from src.services.nlu import ROLE_CONTEXT
+
+
+def instruction_sent(message: str) -> bool:
+    return "СПРАВОЧНИК ГОРОДОВ" in message
+
+
+async def test_instruction_sent_once_per_conversation(stub_nlu, protalk_stub):
+    for text in ("Привет", "Еду завтра", "Из Здравого"):
+        await stub_nlu.parse_intent(text, user_id=1, role="driver")
+
+    first, *rest = protalk_stub.messages
+    assert instruction_sent(first) and ROLE_CONTEXT["driver"] in first
+    assert rest == ["Сообщение пользователя: Еду завтра", "Сообщение пользователя: Из Здравого"]
+
+    stats = stub_nlu.prompt_stats()
+    assert stats["full"]["turns"] == 1 and stats["delta"]["turns"] == 2
+    assert stats["delta"]["bytes_per_turn"] * 10 < stats["full"]["bytes_per_turn"]
+
+
+async def test_instruction_per_chat(stub_nlu, protalk_stub):
+    await stub_nlu.parse_intent("Привет", user_id=1, role="driver")
+    await stub_nlu.parse_intent("Привет", user_id=2, role="driver")
+    assert all(instruction_sent(m) for m in protalk_stub.messages)
+
+
+async def test_instruction_resent_after_reset(stub_nlu, protalk_stub):
+    await stub_nlu.parse_intent("Привет", user_id=1, role="driver")
+    stub_nlu.reset_conversation(1)  # /start или выбор роли
+    await stub_nlu.parse_intent("Привет", user_id=1, role="driver")
+    assert [instruction_sent(m) for m in protalk_stub.messages] == [True, True]
+
+
+async def test_instruction_resent_on_role_change(stub_nlu, protalk_stub):
+    await stub_nlu.parse_intent("Привет", user_id=1, role="driver")
+    await stub_nlu.parse_intent("Привет", user_id=1, role="passenger")
+    assert [instruction_sent(m) for m in protalk_stub.messages] == [True, True]
+    assert ROLE_CONTEXT["passenger"] in protalk_stub.messages[1]
+
+
+async def test_instruction_resent_after_ttl(stub_nlu, protalk_stub, monkeypatch):
+    monkeypatch.setattr("src.services.nlu.NLU_CONVERSATION_TTL", 0.05)
+    await stub_nlu.parse_intent("Привет", user_id=1, role="driver")
+    await stub_nlu.parse_intent("Ещё", user_id=1, role="driver")
+    await asyncio.sleep(0.1)
+    await stub_nlu.parse_intent("Снова", user_id=1, role="driver")
+    assert [instruction_sent(m) for m in protalk_stub.messages] == [True, False, True]
+
+
+async def test_failed_turn_is_not_remembered(stub_nlu, protalk_stub):
+    protalk_stub.status = 500
+    await stub_nlu.parse_intent("Привет", user_id=1, role="driver")
+    protalk_stub.status = 200
+    await stub_nlu.parse_intent("Привет", user_id=1, role="driver")
+    # Первая реплика до pro-talk не дошла — инструкцию нужно прислать снова
+    assert [instruction_sent(m) for m in protalk_stub.messages] == [True, True]
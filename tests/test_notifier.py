@@ -0,0 +1,129 @@
+import asyncio
+import time
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from src.services.notifier import NotificationDispatcher
+
+
+class FakeBot:
+    """Bot API в памяти: запоминает время каждой отправки; ошибки по чатам задаются из теста"""
+
+    def __init__(self):
+        self.sent = []  # (monotonic-время, chat_id, text)
+        self.failures = {}  # chat_id -> список исключений для следующих вызовов
+
+    async def send_message(self, chat_id, text, **kwargs):
+        errors = self.failures.get(chat_id)
+        if errors:
+            raise errors.pop(0)
+        self.sent.append((time.monotonic(), chat_id, text))
+
+    def times(self, chat_id):
+        return [at for at, chat, _ in self.sent if chat == chat_id]
+
+
+def retry_after(seconds: int) -> TelegramRetryAfter:
+    return TelegramRetryAfter(SendMessage(chat_id=1, text="x"), "Flood control exceeded", seconds)
+
+
+async def run(dispatcher: NotificationDispatcher, bot: FakeBot, timeout: float = 10):
+    dispatcher.start(bot)
+    started = time.monotonic()
+    await dispatcher.stop(timeout)
+    return started
+
+
+async def test_burst_to_one_chat_does_not_starve_others():
+    dispatcher = NotificationDispatcher(global_rate=200, chat_interval=0.05, concurrency=4)
+    bot = FakeBot()
+    for i in range(30):
+        dispatcher.enqueue(1, f"карточка {i}")
+    for chat_id in range(2, 22):
+        dispatcher.enqueue(chat_id, "совпадение")
+
+    await run(dispatcher, bot)
+
+    assert dispatcher.stats["sent"] == 50
+    burst = bot.times(1)
+    # Все остальные чаты получили своё, пока пачка в чат 1 ещё только началась
+    others_done = max(at for at, chat, _ in bot.sent if chat != 1)
+    assert others_done < burst[3]
+    # Пачка в чат 1 пришла по порядку
+    assert [text for _, chat, text in bot.sent if chat == 1] == [f"карточка {i}" for i in range(30)]
+
+
+async def test_per_chat_interval():
+    dispatcher = NotificationDispatcher(global_rate=1000, chat_interval=0.05, concurrency=8)
+    bot = FakeBot()
+    for i in range(10):
+        for chat_id in (1, 2, 3):
+            dispatcher.enqueue(chat_id, f"сообщение {i}")
+
+    await run(dispatcher, bot)
+
+    for chat_id in (1, 2, 3):
+        times = bot.times(chat_id)
+        assert len(times) == 10
+        gaps = [b - a for a, b in zip(times, times[1:])]
+        assert min(gaps) >= 0.05 * 0.9
+
+
+async def test_global_rate():
+    rate = 50
+    dispatcher = NotificationDispatcher(global_rate=rate, chat_interval=0, concurrency=8)
+    bot = FakeBot()
+    for chat_id in range(150):
+        dispatcher.enqueue(chat_id, "совпадение")
+
+    started = await run(dispatcher, bot)
+
+    assert len(bot.sent) == 150
+    # Не больше ёмкости корзины плюс rate в секунду на любом отрезке с начала
+    for n, (at, _, _) in enumerate(sorted(bot.sent), start=1):
+        assert n <= rate + rate * (at - started) + 1
+    assert bot.sent[-1][0] - started >= (150 - rate) / rate * 0.9
+
+
+async def test_retry_after_delays_only_that_chat():
+    dispatcher = NotificationDispatcher(global_rate=1000, chat_interval=0, concurrency=2)
+    bot = FakeBot()
+    bot.failures[1] = [retry_after(1)]
+    dispatcher.enqueue(1, "первое")
+    dispatcher.enqueue(1, "второе")
+    for chat_id in range(2, 12):
+        dispatcher.enqueue(chat_id, "совпадение")
+
+    started = await run(dispatcher, bot)
+
+    assert dispatcher.stats["retried"] == 1 and dispatcher.stats["sent"] == 12
+    assert [text for _, chat, text in bot.sent if chat == 1] == ["первое", "второе"]
+    assert min(bot.times(1)) - started >= 1
+    assert max(at for at, chat, _ in bot.sent if chat != 1) - started < 0.5
+
+
+async def test_bad_request_is_not_retried_and_dedup():
+    dispatcher = NotificationDispatcher(global_rate=1000, chat_interval=0, concurrency=2)
+    bot = FakeBot()
+    bot.failures[1] = [TelegramBadRequest(SendMessage(chat_id=1, text="x"), "chat not found")]
+    assert dispatcher.enqueue(1, "привет")
+    assert dispatcher.enqueue(2, "привет")
+    assert not dispatcher.enqueue(2, "привет")  # тот же текст в тот же чат
+
+    await run(dispatcher, bot)
+
+    assert dispatcher.stats["failed"] == 1 and dispatcher.stats["retried"] == 0
+    assert dispatcher.stats["deduplicated"] == 1
+    assert [chat for _, chat, _ in bot.sent] == [2]
+    assert dispatcher.pending() == 0
+
+
+async def test_stop_waits_for_deferred_messages():
+    dispatcher = NotificationDispatcher(global_rate=1000, chat_interval=0.2, concurrency=1)
+    bot = FakeBot()
+    for i in range(3):
+        dispatcher.enqueue(1, f"сообщение {i}")
+
+    await run(dispatcher, bot)
+    assert len(bot.sent) == 3
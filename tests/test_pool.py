@@ -0,0 +1,118 @@
+import asyncio
+import time
+from datetime import date, time as dtime, timedelta
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from src.database import session as db
+from src.database.models import Ride, User
+from src.services.metrics import LatencyStats
+from src.services.search import fetch_drivers, fetch_user_rides
+
+# Стенд пула на файловой SQLite вместо Postgres: тот же AsyncAdaptedQueuePool (у aiosqlite по умолчанию
+# NullPool, поэтому пул задаём явно), те же запросы хендлеров
+POOL_SIZE = 4
+MAX_OVERFLOW = 2
+CONCURRENCY_LEVELS = (1, 4, 8, 16, 32)
+QUERIES_PER_LEVEL = 200
+
+
+@pytest.fixture
+async def pool_engine(tmp_path, monkeypatch):
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}",
+        poolclass=AsyncAdaptedQueuePool, pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW,
+        pool_timeout=30, pool_pre_ping=True
+    )
+    monkeypatch.setattr(db, "engine", engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(db.Base.metadata.create_all)
+    factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with factory() as s:
+        user = User(telegram_id=1, username="driver")
+        s.add_all([
+            Ride(
+                user=user, role="driver", origin="Здравое", destination="Краснодар",
+                ride_date=date.today() + timedelta(days=1 + i % 7), start_time=dtime(9, 0), initial_seats=3, seats=3
+            )
+            for i in range(100)
+        ])
+        await s.commit()
+    # Соединения, открытые при наполнении, возвращаем: пул начинает холодным
+    await engine.dispose()
+    yield engine, factory
+    await engine.dispose()
+
+
+async def handler_query(factory, i: int):
+    """Запросы, которые делают хендлеры на один апдейт"""
+    async with factory() as s:
+        user_id = (await s.execute(select(User.id).where(User.telegram_id == 1))).scalar_one()
+        if i % 2:
+            await fetch_drivers(s)
+        else:
+            await fetch_user_rides(s, user_id)
+
+
+async def test_warm_pool_opens_connections(pool_engine):
+    await db.warm_pool(3)
+    assert db.pool_stats() == {"size": POOL_SIZE, "checked_out": 0, "checked_in": 3, "overflow": -1}
+
+    # Больше размера пула не греем
+    await db.warm_pool(POOL_SIZE + 5)
+    assert db.pool_stats()["checked_in"] == POOL_SIZE
+
+
+async def test_warm_pool_skips_static_pool(monkeypatch):
+    engine = create_async_engine("sqlite+aiosqlite://")
+    monkeypatch.setattr(db, "engine", engine)
+    await db.warm_pool(3)
+    assert db.pool_stats() == {}
+    await engine.dispose()
+
+
+async def test_pool_under_increasing_concurrency(pool_engine):
+    _, factory = pool_engine
+    await db.warm_pool(POOL_SIZE)
+
+    for level in CONCURRENCY_LEVELS:
+        stats = LatencyStats(window=QUERIES_PER_LEVEL)
+        gate = asyncio.Semaphore(level)
+        peak = {"checked_out": 0, "overflow": -POOL_SIZE}
+        running = True
+
+        async def sample():
+            while running:
+                current = db.pool_stats()
+                for key in peak:
+                    peak[key] = max(peak[key], current[key])
+                await asyncio.sleep(0)
+
+        async def one(i):
+            async with gate:
+                started = time.perf_counter()
+                await handler_query(factory, i)
+                stats.observe(time.perf_counter() - started)
+
+        sampler = asyncio.create_task(sample())
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(QUERIES_PER_LEVEL)))
+        elapsed = time.perf_counter() - started
+        running = False
+        await sampler
+
+        print(
+            f"\nconcurrency={level}: {QUERIES_PER_LEVEL / elapsed:.0f} updates/s "
+            f"p50={stats.percentile(0.5) * 1000:.1f}ms p99={stats.percentile(0.99) * 1000:.1f}ms "
+            f"peak_checked_out={peak['checked_out']} peak_overflow={peak['overflow']}"
+        )
+        # Пул не выходит за pool_size + max_overflow, а под нагрузкой действительно им пользуется
+        assert peak["checked_out"] <= POOL_SIZE + MAX_OVERFLOW
+        assert peak["overflow"] <= MAX_OVERFLOW
+        if level >= POOL_SIZE + MAX_OVERFLOW:
+            assert peak["checked_out"] == POOL_SIZE + MAX_OVERFLOW
+        # Все соединения вернулись
+        assert db.pool_stats()["checked_out"] == 0
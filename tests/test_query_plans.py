@@ -0,0 +1,65 @@
+from datetime import date, time, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from src.config import MATCH_INDEX_DAYS
+from src.database.models import Ride, User
+from src.services.matching import find_compatible_rides
+from src.services.search import fetch_drivers, fetch_user_rides
+
+# Дата за горячим окном SegmentIndex: матчинг идёт SQL-запросом, а не из памяти
+FAR_DATE = date.today() + timedelta(days=MATCH_INDEX_DAYS + 30)
+
+
+@pytest.fixture
+async def captured(engine, session_factory):
+    """SQL и параметры всех SELECT, выполненных через engine за время теста"""
+    statements = []
+
+    def on_execute(conn, cursor, statement, params, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, params))
+
+    event.listen(engine.sync_engine, "before_cursor_execute", on_execute)
+    yield statements
+    event.remove(engine.sync_engine, "before_cursor_execute", on_execute)
+
+
+async def query_plan(engine, statement, params) -> str:
+    async with engine.connect() as conn:
+        rows = (await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", params)).all()
+    return "\n".join(row[-1] for row in rows)
+
+
+async def run_and_explain(engine, captured, session_factory, query) -> str:
+    async with session_factory() as s:
+        user = User(telegram_id=1)
+        ride = Ride(
+            user=user, role="passenger", origin="Здравое", destination="Краснодар",
+            ride_date=FAR_DATE, start_time=time(9, 0), initial_seats=1, seats=1
+        )
+        s.add(ride)
+        await s.commit()
+        captured.clear()
+        await query(s, ride, user)
+    (statement, params), = [c for c in captured if "FROM rides" in c[0]]
+    return await query_plan(engine, statement, params)
+
+
+async def test_matching_uses_stop_pair_index(engine, captured, session_factory):
+    plan = await run_and_explain(
+        engine, captured, session_factory, lambda s, ride, user: find_compatible_rides(s, ride, exclude_user_id=0)
+    )
+    assert "USING INDEX ix_rides_stop_pair (ride_date=? AND role=?)" in plan
+
+
+async def test_driver_listing_uses_partial_index(engine, captured, session_factory):
+    plan = await run_and_explain(engine, captured, session_factory, lambda s, ride, user: fetch_drivers(s))
+    assert "USING INDEX ix_rides_open_drivers" in plan
+    assert "SCAN rides" not in plan
+
+
+async def test_user_rides_use_user_date_index(engine, captured, session_factory):
+    plan = await run_and_explain(engine, captured, session_factory, lambda s, ride, user: fetch_user_rides(s, user.id))
+    assert "USING INDEX ix_rides_user_date (user_id=?)" in plan
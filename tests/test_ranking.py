@@ -0,0 +1,97 @@
+import random
+import time as time_module
+from datetime import time
+from types import SimpleNamespace
+
+from src.config import MATCH_TOP_N
+from src.services.ranking import rank_drivers
+from src.services.routes import route_graph
+
+ZDRAVOE = route_graph.resolve("Здравое")
+KRASNODAR = route_graph.resolve("Краснодар")
+SKAZOCHNY = route_graph.resolve("Сказочный край")
+
+
+def driver(ride_id, start=time(9, 0), seats=3, origin=ZDRAVOE, dest=KRASNODAR):
+    ride = SimpleNamespace(id=ride_id, start_time=start, seats=seats, origin_stop_id=origin, dest_stop_id=dest)
+    return ride, f"user{ride_id}"
+
+
+def passenger(start=time(9, 0), seats=1):
+    return SimpleNamespace(start_time=start, initial_seats=seats, origin_stop_id=ZDRAVOE, dest_stop_id=KRASNODAR)
+
+
+def ranked_ids(passenger_ride, candidates, limit=10):
+    return [ride.id for ride, _ in rank_drivers(passenger_ride, candidates, limit)]
+
+
+def test_exact_stops_before_containing_route():
+    candidates = [driver(1, origin=SKAZOCHNY), driver(2)]
+    assert ranked_ids(passenger(), candidates) == [2, 1]
+
+
+def test_closer_departure_first():
+    candidates = [driver(1, start=time(10, 0)), driver(2, start=time(8, 50)), driver(3, start=time(9, 30))]
+    assert ranked_ids(passenger(), candidates) == [2, 3, 1]
+
+
+def test_flexible_time_is_neutral():
+    candidates = [driver(1, start=time(10, 25)), driver(2, start=None), driver(3, start=time(9, 5))]
+    assert ranked_ids(passenger(), candidates) == [3, 2, 1]
+
+
+def test_not_enough_seats_goes_last():
+    # Лучшее время и точный маршрут не перевешивают нехватку мест
+    candidates = [driver(1, seats=1), driver(2, start=time(10, 29), origin=SKAZOCHNY, seats=2)]
+    assert ranked_ids(passenger(seats=2), candidates) == [2, 1]
+
+
+def test_spare_seats_break_near_ties():
+    candidates = [driver(1, seats=1), driver(2, seats=4)]
+    assert ranked_ids(passenger(), candidates) == [2, 1]
+
+
+def test_exact_ties_keep_ride_id_order():
+    candidates = [driver(3), driver(1), driver(2)]
+    assert ranked_ids(passenger(), candidates) == [1, 2, 3]
+
+
+def test_limit_and_empty():
+    candidates = [driver(i, start=time(9, i)) for i in range(1, 8)]
+    assert ranked_ids(passenger(), candidates, limit=3) == [1, 2, 3]
+    assert rank_drivers(passenger(), []) == []
+
+
+def test_unknown_stops_are_neutral():
+    candidates = [driver(1, origin=None, dest=None), driver(2, origin=SKAZOCHNY)]
+    # Нераспознанный маршрут (штраф 0.5) хуже и точного, и короткого объезда (1 - 6/8)
+    assert ranked_ids(passenger(), candidates + [driver(3)]) == [3, 2, 1]
+
+
+# --- БЕНЧМАРК: тысячи кандидатов ---
+BENCH_SIZES = (1000, 5000, 20000)
+
+
+def random_candidates(count: int, seed: int = 1) -> list:
+    rng = random.Random(seed)
+    stops = [s for s in route_graph.names if route_graph.span((s, KRASNODAR))]
+    candidates = []
+    for i in range(count):
+        start = None if rng.random() < 0.1 else time(rng.randrange(7, 12), rng.randrange(60))
+        candidates.append(driver(i, start=start, seats=rng.randrange(1, 5), origin=rng.choice(stops)))
+    return candidates
+
+
+def test_ranking_benchmark():
+    for count in BENCH_SIZES:
+        candidates = random_candidates(count)
+        started = time_module.perf_counter()
+        best = rank_drivers(passenger(seats=2), candidates)
+        elapsed = time_module.perf_counter() - started
+
+        print(f"\nrank_drivers: {count} candidates in {elapsed * 1000:.1f}ms ({elapsed / count * 1e6:.2f}us per candidate)")
+        assert len(best) == MATCH_TOP_N
+        # Среди тысяч кандидатов лучшие всегда с достаточным числом мест
+        assert all(ride.seats >= 2 for ride, _ in best)
+        # Порог с большим запасом: локально это единицы миллисекунд на тысячу кандидатов
+        assert elapsed / count < 50e-6
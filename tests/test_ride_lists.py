@@ -0,0 +1,107 @@
+from datetime import date, time, timedelta
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+from sqlalchemy import func, select
+
+from src.bot.handlers import delete_ride, find_rides, list_rides, more_rides, more_user_rides
+from src.database.models import Ride, User
+from src.services.search import PAGE_SIZE
+from src.services.user_cache import UserCache
+
+RIDES = 30
+
+
+class BotApi:
+    """Считает вызовы Bot API, которые делают хэндлеры: sendMessage, editMessageText, answerCallbackQuery"""
+
+    def __init__(self):
+        self.calls = []  # (метод, текст, клавиатура)
+
+    def message(self):
+        async def answer(text, reply_markup=None, **kwargs):
+            self.calls.append(("sendMessage", text, reply_markup))
+
+        async def edit_text(text, reply_markup=None, **kwargs):
+            self.calls.append(("editMessageText", text, reply_markup))
+
+        return SimpleNamespace(answer=answer, edit_text=edit_text)
+
+    def command(self, user_id: int = 1):
+        message = self.message()
+        message.from_user = SimpleNamespace(id=user_id, username="user")
+        return message
+
+    def callback(self, data: str, user_id: int = 1):
+        async def answer(*args, **kwargs):
+            self.calls.append(("answerCallbackQuery", None, None))
+
+        return SimpleNamespace(
+            data=data, answer=answer, message=self.message(),
+            from_user=SimpleNamespace(id=user_id, username="user")
+        )
+
+    def count(self, method: str) -> int:
+        return sum(1 for name, _, _ in self.calls if name == method)
+
+    def last_buttons(self) -> list:
+        markup = self.calls[-1][2]
+        return [button for row in markup.inline_keyboard for button in row]
+
+
+@pytest.fixture
+async def rides(session_factory, monkeypatch):
+    """RIDES поездок водителя с telegram_id=1 на ближайшие дни"""
+    monkeypatch.setattr("src.bot.handlers.user_cache", UserCache())
+    async with session_factory() as s:
+        user = User(telegram_id=1, username="driver")
+        s.add_all([
+            Ride(
+                user=user, role="driver", origin="Здравое", destination="Краснодар",
+                ride_date=date.today() + timedelta(days=1 + i % 5), start_time=time(9, 0), initial_seats=2, seats=2
+            )
+            for i in range(RIDES)
+        ])
+        await s.commit()
+
+
+async def test_my_rides_is_one_message_per_page(rides):
+    api = BotApi()
+    await list_rides(api.command(), AsyncMock())
+
+    assert api.count("sendMessage") == 1
+    assert api.calls[0][1].count("Я - Водитель") == PAGE_SIZE
+    more = next(b for b in api.last_buttons() if b.text.startswith("Ещё"))
+
+    # Вторая страница редактирует то же сообщение
+    await more_user_rides(api.callback(more.callback_data))
+    assert api.count("sendMessage") == 1 and api.count("editMessageText") == 1
+    assert api.calls[-1][1].count("Я - Водитель") == RIDES - PAGE_SIZE
+
+
+async def test_delete_redraws_page_in_place(rides, session_factory):
+    api = BotApi()
+    await list_rides(api.command(), AsyncMock())
+    delete = next(b for b in api.last_buttons() if b.text.startswith("❌"))
+
+    await delete_ride(api.callback(delete.callback_data))
+
+    # Ответ на нажатие и одна правка списка — без повторной отправки
+    assert api.count("sendMessage") == 1
+    assert api.count("answerCallbackQuery") == 1 and api.count("editMessageText") == 1
+    async with session_factory() as s:
+        assert (await s.execute(select(func.count()).select_from(Ride))).scalar() == RIDES - 1
+
+
+async def test_find_rides_is_one_message_per_page(rides):
+    api = BotApi()
+    await find_rides(api.command(user_id=2), AsyncMock())
+
+    assert api.count("sendMessage") == 1
+    assert api.calls[0][1].count("Водитель") == PAGE_SIZE
+    more = next(b for b in api.last_buttons() if b.text.startswith("Ещё"))
+
+    await more_rides(api.callback(more.callback_data, user_id=2))
+    assert api.count("sendMessage") == 1 and api.count("editMessageText") == 1
+    assert api.calls[-1][1].count("Водитель") == RIDES - PAGE_SIZE
@@ -0,0 +1,114 @@
+import random
+import time
+
+import pytest
+
+from src.services.routes import DEFAULT_ROUTES, DEFAULT_STOPS, RouteGraph
+
+graph = RouteGraph.from_network(DEFAULT_STOPS, DEFAULT_ROUTES)
+
+
+def pair(origin: str, destination: str) -> tuple:
+    return graph.resolve(origin), graph.resolve(destination)
+
+
+VOKZAL = "Ж/д вокзал Краснодар"
+AIRPORT = "Аэропорт Краснодар"
+
+
+@pytest.mark.parametrize("driver, passenger, expected", [
+    # Ветка на вокзал накрывает общий ствол, но не ветку в аэропорт
+    (("Сказочный край", VOKZAL), ("Здравое", "Краснодар"), True),
+    (("Сказочный край", VOKZAL), ("Краснодар", VOKZAL), True),
+    (("Сказочный край", VOKZAL), ("Здравое", AIRPORT), False),
+    (("Сказочный край", VOKZAL), ("Краснодар", AIRPORT), False),
+    (("Сказочный край", AIRPORT), ("Живой дом", AIRPORT), True),
+    # Обратное направление
+    ((VOKZAL, "Сказочный край"), ("Краснодар", "Здравое"), True),
+    ((VOKZAL, "Сказочный край"), ("Здравое", "Краснодар"), False),
+    ((AIRPORT, "Здравое"), (VOKZAL, "Здравое"), False),
+    # Между концами веток общего маршрута нет
+    ((VOKZAL, AIRPORT), (VOKZAL, AIRPORT), False),
+    (("Сказочный край", AIRPORT), (VOKZAL, AIRPORT), False),
+    # Коридор через Северскую делит с основным Здравое и Краснодар, но не промежуточные остановки
+    (("Здравое", "Краснодар"), ("Северская", "Краснодар"), True),
+    (("Здравое", "Краснодар"), ("Смоленская", "Краснодар"), True),
+    (("Сказочный край", VOKZAL), ("Северская", "Краснодар"), False),
+    (("Здравое", "Краснодар"), ("Смоленская", "Северская"), False),
+])
+def test_branch_containment(driver, passenger, expected):
+    assert graph.contains(pair(*driver), pair(*passenger)) is expected
+
+
+def test_branch_ends_are_not_a_pair():
+    assert graph.resolve_pair(VOKZAL, AIRPORT) == (None, None)
+    assert graph.span(pair(VOKZAL, AIRPORT)) is None
+    assert graph.resolve(AIRPORT) not in graph.destinations(graph.resolve(VOKZAL))
+
+
+def test_precomputed_sets_agree_with_contains():
+    pairs = [(a, b) for a in graph.names for b in graph.names if a != b]
+    for driver in pairs:
+        contained = graph.contained_pairs(driver)
+        assert contained == {p for p in pairs if graph.contains(driver, p)}
+        for passenger in contained:
+            assert driver in graph.containing_pairs(passenger)
+
+
+# --- БЕНЧМАРК НА СИНТЕТИЧЕСКОЙ СЕТИ ---
+TRUNK_STOPS = 20
+BRANCHES = 4
+BRANCH_STOPS = 5
+BENCH_CHECKS = 50_000
+
+
+def synthetic_network(corridors: int):
+    """corridors коридоров: ствол из TRUNK_STOPS остановок и BRANCHES веток, маршрут — ствол + ветка"""
+    stops, routes = {}, {}
+    for c in range(corridors):
+        trunk = [f"c{c}-t{i}" for i in range(TRUNK_STOPS)]
+        for b in range(BRANCHES):
+            branch = [f"c{c}-b{b}-{i}" for i in range(BRANCH_STOPS)]
+            routes[f"c{c}-r{b}"] = trunk + branch
+            stops.update({name: [] for name in trunk + branch})
+    return stops, routes
+
+
+def bench_contains(corridors: int, seed: int = 1):
+    """(секунд на загрузку, секунд на проверку contains) для сети из corridors коридоров"""
+    stops, routes = synthetic_network(corridors)
+    started = time.perf_counter()
+    network = RouteGraph.from_network(stops, routes)
+    load = time.perf_counter() - started
+
+    # Кандидаты из того же коридора, что и водитель: только такие пары реально доходят до проверки
+    rng = random.Random(seed)
+    sequences = list(network.routes.values())
+
+    def random_pair(corridor: int):
+        seq = sequences[corridor * BRANCHES + rng.randrange(BRANCHES)]
+        i, j = rng.sample(range(len(seq)), 2)
+        return seq[i], seq[j]
+
+    checks = []
+    for _ in range(BENCH_CHECKS):
+        corridor = rng.randrange(corridors)
+        checks.append((random_pair(corridor), random_pair(corridor)))
+    # Лучший из трёх прогонов: меньше шума от соседних процессов
+    best = float("inf")
+    for _ in range(3):
+        started = time.perf_counter()
+        for driver, passenger in checks:
+            network.contains(driver, passenger)
+        best = min(best, time.perf_counter() - started)
+    return load, best / BENCH_CHECKS
+
+
+def test_contains_does_not_grow_with_network():
+    results = {corridors: bench_contains(corridors) for corridors in (5, 50, 200)}
+    for corridors, (load, per_check) in results.items():
+        stops = corridors * (TRUNK_STOPS + BRANCHES * BRANCH_STOPS)
+        print(f"\n{corridors} corridors / {stops} stops: load={load:.2f}s contains={per_check * 1e6:.2f}us")
+    # Проверка — поиск в словаре пар и перебор общих маршрутов пары, а не обход сети: вчетверо
+    # большая сеть не делает её вчетверо дороже (разница между 5 и 50 — кэш процессора, а не алгоритм)
+    assert results[200][1] < results[50][1] * 2.5
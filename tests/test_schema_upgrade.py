@@ -0,0 +1,123 @@
+from datetime import date, time
+
+from sqlalchemy import inspect, select, text
+
+from src.database import session as db
+from src.database.session import Base
+from src.database.models import Ride, RideArchive
+
+# Схема первой версии бота (до миграций): start_time — строка, нет остановок, флагов и индексов
+BASELINE_SCHEMA = [
+    """CREATE TABLE users (
+        id INTEGER PRIMARY KEY, telegram_id BIGINT NOT NULL UNIQUE, username VARCHAR, created_at DATETIME
+    )""",
+    """CREATE TABLE rides (
+        id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES users(id), role VARCHAR NOT NULL,
+        origin VARCHAR NOT NULL, destination VARCHAR NOT NULL, ride_date DATE NOT NULL, start_time VARCHAR,
+        initial_seats INTEGER, seats INTEGER, raw_text VARCHAR, created_at DATETIME
+    )""",
+    """CREATE TABLE bookings (
+        id INTEGER PRIMARY KEY, driver_ride_id INTEGER NOT NULL REFERENCES rides(id),
+        passenger_ride_id INTEGER NOT NULL REFERENCES rides(id), status VARCHAR, created_at DATETIME
+    )""",
+]
+
+
+async def test_upgrade_from_baseline_sqlite(engine):
+    async with engine.begin() as conn:
+        for ddl in BASELINE_SCHEMA:
+            await conn.execute(text(ddl))
+        await conn.execute(text("INSERT INTO users (id, telegram_id) VALUES (1, 100)"))
+        await conn.execute(text(
+            "INSERT INTO rides (id, user_id, role, origin, destination, ride_date, start_time, seats) VALUES "
+            "(1, 1, 'driver', 'Здравое', 'Краснодар', '2030-01-10', '9:05', 3), "
+            "(2, 1, 'driver', 'Здравое', 'Краснодар', '2030-01-10', '18:30', 3), "
+            "(3, 1, 'passenger', 'Сказочный край', 'Энем', '2030-01-10', 'По договоренности', 1)"
+        ))
+        # Дубль отклика: уникальный индекс uq_bookings_pair создаётся только после чистки
+        await conn.execute(text(
+            "INSERT INTO bookings (driver_ride_id, passenger_ride_id, status) VALUES (1, 3, 'pending'), (1, 3, 'pending')"
+        ))
+        # Индекс прошлой версии, который больше не нужен моделям
+        await conn.execute(text("CREATE INDEX ix_rides_route_segment ON rides (ride_date, role, origin, destination)"))
+
+    await db.init_models()
+
+    async with db.async_session() as s:
+        rides = {r.id: r for r in (await s.execute(select(Ride))).scalars()}
+        bookings = (await s.execute(text("SELECT COUNT(*) FROM bookings"))).scalar()
+
+    assert rides[1].start_time == time(9, 5)
+    assert rides[2].start_time == time(18, 30)
+    assert rides[3].start_time is None
+    assert rides[1].ride_date == date(2030, 1, 10)
+    # Остановки проставлены по сети маршрутов
+    assert rides[1].origin_stop_id is not None and rides[3].dest_stop_id is not None
+    assert bookings == 1
+
+    # Все индексы моделей на месте, устаревший удалён
+    async with engine.connect() as conn:
+        indexes = await conn.run_sync(lambda sync_conn: {
+            table: {i["name"] for i in inspect(sync_conn).get_indexes(table)}
+            for table in ("rides", "bookings", "route_stops")
+        })
+    for table, names in indexes.items():
+        assert {i.name for i in Base.metadata.tables[table].indexes} <= names
+    assert {"ix_rides_open_drivers", "ix_rides_stop_pair", "uq_rides_template_date"} <= indexes["rides"]
+    assert "uq_bookings_pair" in indexes["bookings"]
+    assert "ix_rides_route_segment" not in indexes["rides"]
+
+
+async def test_upgrade_is_idempotent(session_factory):
+    # Свежая база по моделям: повторный init_models ничего не ломает
+    await db.init_models()
+    await db.init_models()
+
+
+async def test_time_flexible_column_is_dropped(engine):
+    async with engine.begin() as conn:
+        for ddl in BASELINE_SCHEMA:
+            await conn.execute(text(ddl))
+        await conn.execute(text("INSERT INTO users (id, telegram_id) VALUES (1, 100)"))
+        await conn.execute(text(
+            "INSERT INTO rides (id, user_id, role, origin, destination, ride_date, start_time, seats) VALUES "
+            "(1, 1, 'driver', 'Здравое', 'Краснодар', '2030-01-10', '9:05', 3)"
+        ))
+    await db.init_models()
+    # База после прошлой версии: флаг time_flexible уже добавлен, start_time уже переведён
+    async with engine.begin() as conn:
+        await conn.execute(text("ALTER TABLE rides ADD COLUMN time_flexible BOOLEAN"))
+
+    await db.init_models()
+    await db.init_models()
+
+    async with engine.connect() as conn:
+        columns = {row[1] for row in (await conn.execute(text("PRAGMA table_info(rides)"))).all()}
+    async with db.async_session() as s:
+        ride = await s.get(Ride, 1)
+    assert "time_flexible" not in columns
+    assert ride.start_time == time(9, 5)
+
+
+async def test_archive_gets_surrogate_id(engine):
+    # Архив прошлой версии: id архива совпадал с id поездки
+    async with engine.begin() as conn:
+        for ddl in BASELINE_SCHEMA:
+            await conn.execute(text(ddl))
+        await conn.execute(text(
+            "CREATE TABLE rides_archive (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, role VARCHAR NOT NULL, "
+            "origin VARCHAR NOT NULL, destination VARCHAR NOT NULL, ride_date DATE NOT NULL, start_time TIME, "
+            "initial_seats INTEGER, seats INTEGER, created_at DATETIME, archived_at DATETIME)"
+        ))
+        await conn.execute(text(
+            "INSERT INTO rides_archive (id, user_id, role, origin, destination, ride_date) "
+            "VALUES (7, 1, 'driver', 'Здравое', 'Краснодар', '2030-01-10')"
+        ))
+
+    await db.init_models()
+
+    async with db.async_session() as s:
+        s.add(RideArchive(ride_id=7, user_id=1, role="driver", origin="Здравое", destination="Краснодар", ride_date=date(2030, 1, 11)))
+        await s.commit()
+        archived = (await s.execute(select(RideArchive.id, RideArchive.ride_id).order_by(RideArchive.id))).all()
+    assert [tuple(row) for row in archived] == [(7, 7), (8, 7)]
@@ -0,0 +1,178 @@
+from datetime import date, time, timedelta
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+
+from src.bot import handlers
+from src.database.models import Ride, User
+from src.services.routes import StopTrie, route_graph
+from src.services.search import inline_cache, parse_find_query, route_search_cache, suggest_routes
+
+TODAY = date(2026, 10, 17)
+
+
+def stop(name):
+    return route_graph.resolve(name)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Здравое Краснодар", ((stop("Здравое"), stop("Краснодар")), None)),
+    ("Здравое Краснодар завтра", ((stop("Здравое"), stop("Краснодар")), date(2026, 10, 18))),
+    ("из Краснодара в Сказочный край 25.12", ((stop("Краснодар"), stop("Сказочный край")), date(2026, 12, 25))),
+    # Неполный маршрут — решает пошаговый выбор остановок
+    ("из Здравого", None),
+    ("в Краснодар", None),
+    ("Здравое", None),
+    ("Здравое Луна", None),
+    ("", None),
+])
+def test_parse_find_query(text, expected):
+    assert parse_find_query(text, TODAY) == expected
+
+
+def test_route_cache_invalidation():
+    passenger_pair = (stop("Здравое"), stop("Краснодар"))
+    other_pair = (stop("Краснодар"), stop("Здравое"))
+    route_search_cache.clear()
+    route_search_cache.put((passenger_pair, TODAY), ["today"])
+    route_search_cache.put((passenger_pair, None), ["any"])
+    route_search_cache.put((other_pair, TODAY), ["back"])
+    inline_cache.put("здравое кра", ["answer"])
+
+    # Водитель Сказочный край -> Краснодар проходит через Здравое: его поездка влияет на выдачу
+    route_search_cache.invalidate(TODAY, "driver", stop("Сказочный край"), stop("Краснодар"))
+
+    assert route_search_cache.keys() == [(other_pair, TODAY)]
+    assert inline_cache.lookup("здравое кра") is None
+
+
+def test_route_cache_ignores_passengers_and_unknown_stops():
+    pair = (stop("Здравое"), stop("Краснодар"))
+    route_search_cache.clear()
+    route_search_cache.put((pair, TODAY), ["today"])
+    inline_cache.put("здравое кра", ["answer"])
+
+    # В выдачу попадают только водители с известными остановками — остальные кэш не трогают
+    route_search_cache.invalidate(TODAY, "passenger", stop("Сказочный край"), stop("Краснодар"))
+    route_search_cache.invalidate(TODAY, "driver", None, None)
+
+    assert route_search_cache.keys() == [(pair, TODAY)]
+    assert inline_cache.lookup("здравое кра") == ["answer"]
+
+
+# --- АВТОДОПОЛНЕНИЕ И INLINE-РЕЖИМ ---
+def names(stop_ids) -> list:
+    return [route_graph.names[s] for s in stop_ids]
+
+
+def test_stop_trie():
+    trie = StopTrie({"краснодар": 1, "сказочный край": 2, "ж/д вокзал краснодар": 3, "кр": 4})
+    # Написания целиком раньше слов внутри них
+    assert trie.complete("кра") == [1, 2, 3]
+    assert trie.complete("Край") == [2]
+    assert trie.complete("ж/д") == [3]
+    assert trie.complete("кр") == [1, 4, 2, 3]
+    assert trie.complete("") == []
+    assert trie.complete("луна") == []
+    assert StopTrie().complete("кра") == []
+
+
+def test_route_graph_trie_uses_aliases():
+    assert names(route_graph.trie.complete("кра")) == [
+        "Краснодар", "Сказочный край", "Ж/д вокзал Краснодар", "Аэропорт Краснодар"
+    ]
+    assert names(route_graph.trie.complete("ЗДР")) == ["Здравое"]
+    assert names(route_graph.trie.complete("аэ")) == ["Аэропорт Краснодар"]
+
+
+@pytest.mark.parametrize("query, expected, ride_date", [
+    # Последнее слово — начало названия
+    ("Здравое Кра", [("Здравое", "Краснодар"), ("Здравое", "Сказочный край"), ("Здравое", "Ж/д вокзал Краснодар")], None),
+    ("из Здравого в Кра", [("Здравое", "Краснодар"), ("Здравое", "Сказочный край"), ("Здравое", "Ж/д вокзал Краснодар")], None),
+    ("Здравое Краснодар завтра", [
+        ("Здравое", "Краснодар"), ("Здравое", "Ж/д вокзал Краснодар"), ("Здравое", "Аэропорт Краснодар")
+    ], date(2026, 10, 18)),
+    ("Сказочный край Краснодар 25.12", [
+        ("Сказочный край", "Краснодар"), ("Сказочный край", "Ж/д вокзал Краснодар"),
+        ("Сказочный край", "Аэропорт Краснодар")
+    ], date(2026, 12, 25)),
+    # Одна остановка — направления из неё
+    ("здравое", [("Здравое", "Сказочный край"), ("Здравое", "Живой дом"), ("Здравое", "Григорьевская")], None),
+    ("луна", [], None),
+    ("завтра", [], date(2026, 10, 18)),
+    ("", [], None),
+])
+def test_suggest_routes(query, expected, ride_date):
+    pairs, found_date = suggest_routes(query, TODAY, limit=3)
+    assert [tuple(names(p)) for p in pairs] == expected
+    assert found_date == ride_date
+
+
+def test_suggest_routes_single_stop_lists_all_destinations():
+    origin = stop("Здравое")
+    pairs, _ = suggest_routes("Здравое", TODAY, limit=100)
+    assert pairs == [(origin, d) for d in route_graph.destinations(origin)]
+
+
+@pytest.fixture
+def inline_env(session_factory, monkeypatch):
+    """Кэши пусты, запросы к БД за выдачей по маршруту считаются"""
+    route_search_cache.clear()
+    inline_cache.clear()
+    calls = []
+    fetch = handlers.fetch_route_drivers
+
+    async def counting_fetch(session, pair, ride_date=None):
+        calls.append((pair, ride_date))
+        return await fetch(session, pair, ride_date)
+
+    monkeypatch.setattr(handlers, "fetch_route_drivers", counting_fetch)
+    yield calls
+    route_search_cache.clear()
+    inline_cache.clear()
+
+
+def inline_query(text: str):
+    return SimpleNamespace(query=text, answer=AsyncMock())
+
+
+async def test_inline_search_is_served_from_cache(inline_env, session_factory):
+    async with session_factory() as s:
+        s.add(Ride(
+            user=User(telegram_id=1, username="driver"), role="driver", origin="Сказочный край",
+            destination="Краснодар", ride_date=date.today() + timedelta(days=1), start_time=time(9, 0),
+            initial_seats=3, seats=3
+        ))
+        await s.commit()
+
+    first = inline_query("Здравое Крас")
+    await handlers.inline_search(first)
+    results = first.answer.await_args.args[0]
+    assert [r.title for r in results][:2] == ["Здравое -> Краснодар", "Здравое -> Ж/д вокзал Краснодар"]
+    assert results[0].description.startswith("Водителей: 1")
+    assert first.answer.await_args.kwargs["is_personal"] is False
+    fetched = len(inline_env)
+    assert fetched == len(results)
+
+    # То же нажатие от другого пользователя (и с другим регистром) — без единого запроса к БД
+    second = inline_query("здравое  КРАС")
+    await handlers.inline_search(second)
+    assert second.answer.await_args.args[0] is results
+    assert len(inline_env) == fetched
+
+
+async def test_new_driver_ride_invalidates_inline_answers(inline_env, session_factory):
+    await handlers.inline_search(inline_query("Здравое Крас"))
+    fetched = len(inline_env)
+
+    # Поездка пассажира выдачу не меняет — ответ остаётся в кэше
+    route_search_cache.invalidate(None, "passenger", stop("Здравое"), stop("Краснодар"))
+    await handlers.inline_search(inline_query("Здравое Крас"))
+    assert len(inline_env) == fetched
+
+    # Новый водитель на маршруте: ответ собирается заново, и только отрезки внутри его маршрута идут в БД
+    route_search_cache.invalidate(None, "driver", stop("Сказочный край"), stop("Краснодар"))
+    await handlers.inline_search(inline_query("Здравое Крас"))
+    refetched = inline_env[fetched:]
+    assert refetched == [((stop("Здравое"), stop("Краснодар")), None)]
@@ -0,0 +1,147 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from src.bot.storage import SQLAlchemyStorage
+
+KEY = StorageKey(bot_id=1, chat_id=10, user_id=10)
+
+
+def gated_factory(factory):
+    """Фабрика сессий, у которой первое чтение ждёт gate — имитация медленного запроса"""
+    gate = asyncio.Event()
+    reads = []
+
+    @asynccontextmanager
+    async def session():
+        async with factory() as s:
+            if not reads:
+                real_get = s.get
+
+                async def slow_get(*args, **kwargs):
+                    await gate.wait()
+                    return await real_get(*args, **kwargs)
+
+                s.get = slow_get
+            reads.append(1)
+            yield s
+
+    return session, gate, reads
+
+
+async def test_write_during_read_is_kept(session_factory):
+    seed = SQLAlchemyStorage(session_factory)
+    await seed.set_state(KEY, "old")
+    await seed.flush()
+
+    factory, gate, reads = gated_factory(session_factory)
+    storage = SQLAlchemyStorage(factory)
+    reader = asyncio.create_task(storage.get_state(KEY))
+    while not reads:
+        await asyncio.sleep(0)
+    await storage.set_state(KEY, "new")  # пока первое чтение ещё идёт
+    gate.set()
+    await reader
+
+    assert await storage.get_state(KEY) == "new"
+    await storage.flush()
+    assert await SQLAlchemyStorage(session_factory).get_state(KEY) == "new"
+
+
+def counting_factory(factory):
+    """Фабрика сессий, которая считает обращения к БД"""
+    calls = []
+
+    def session():
+        calls.append(1)
+        return factory()
+
+    return session, calls
+
+
+async def test_replicas_see_flushed_changes_without_cache(session_factory):
+    first, second = SQLAlchemyStorage(session_factory), SQLAlchemyStorage(session_factory, cache_ttl=0)
+    await first.set_state(KEY, "chatting")
+    await first.set_data(KEY, {"role": "driver"})
+    await first.flush()
+    assert await second.get_state(KEY) == "chatting"
+
+    await first.set_state(KEY, None)
+    await first.set_data(KEY, {})
+    await first.flush()
+    assert await second.get_state(KEY) is None
+    assert await second.get_data(KEY) == {}
+
+
+async def test_unflushed_changes_win_over_database(session_factory):
+    storage = SQLAlchemyStorage(session_factory)
+    await storage.set_data(KEY, {"form_pending": "seats"})
+    # В БД ещё ничего нет, но читатель в этом процессе видит свою запись
+    assert await storage.get_data(KEY) == {"form_pending": "seats"}
+    assert await SQLAlchemyStorage(session_factory).get_data(KEY) == {}
+
+
+async def test_cached_state_skips_database(session_factory):
+    factory, calls = counting_factory(session_factory)
+    storage = SQLAlchemyStorage(factory, cache_ttl=60)
+    for _ in range(100):  # get_state из FSMContextMiddleware на каждый апдейт
+        assert await storage.get_state(KEY) is None
+    assert len(calls) == 1
+
+
+async def test_stale_entry_is_reread_after_ttl(session_factory):
+    writer = SQLAlchemyStorage(session_factory)
+    factory, calls = counting_factory(session_factory)
+    reader = SQLAlchemyStorage(factory, cache_ttl=0.05)
+    assert await reader.get_state(KEY) is None
+    await writer.set_state(KEY, "chatting")
+    await writer.flush()
+    assert await reader.get_state(KEY) is None  # ещё в пределах TTL
+    await asyncio.sleep(0.1)
+    assert await reader.get_state(KEY) == "chatting"
+    assert len(calls) == 2
+
+
+async def test_dirty_entry_outlives_ttl(session_factory):
+    storage = SQLAlchemyStorage(session_factory, cache_ttl=0)
+    await storage.set_state(KEY, "form")
+    # Незаписанное изменение не вытесняется и не затирается чтением из БД
+    assert await storage.get_state(KEY) == "form"
+
+
+BENCH_USERS = 100
+BENCH_OPS = 5000
+
+
+async def run_fsm_bench(storage) -> float:
+    """update_data/get_data по BENCH_USERS чатам, как при переписке с ботом; возвращает секунды"""
+    keys = [StorageKey(bot_id=1, chat_id=i, user_id=i) for i in range(BENCH_USERS)]
+    started = time.perf_counter()
+    for i in range(BENCH_OPS):
+        key = keys[i % BENCH_USERS]
+        await storage.update_data(key, {"step": i})
+        await storage.get_data(key)
+    return time.perf_counter() - started
+
+
+async def test_fsm_throughput_vs_memory(session_factory):
+    memory_seconds = await run_fsm_bench(MemoryStorage())
+
+    factory, calls = counting_factory(session_factory)
+    storage = SQLAlchemyStorage(factory)
+    cold_seconds = await run_fsm_bench(storage)  # первое обращение к каждому чату читает БД
+    warm_seconds = await run_fsm_bench(storage)
+    await storage.flush()
+
+    print(
+        f"\nFSM {BENCH_OPS} update_data+get_data: memory {BENCH_OPS / memory_seconds:.0f} ops/s, "
+        f"sql cold {BENCH_OPS / cold_seconds:.0f} ops/s, sql warm {BENCH_OPS / warm_seconds:.0f} ops/s, "
+        f"DB round trips {len(calls)}"
+    )
+    # Одно чтение на чат и один flush: остальное обслуживает кэш в процессе
+    assert len(calls) == BENCH_USERS + 1
+    probe = SQLAlchemyStorage(session_factory)
+    assert await probe.get_data(StorageKey(bot_id=1, chat_id=0, user_id=0)) == {"step": BENCH_OPS - BENCH_USERS}
@@ -0,0 +1,128 @@
+import asyncio
+from datetime import date, time, timedelta
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+from sqlalchemy import delete, select
+
+from src.bot.handlers import list_templates
+from src.database.models import Ride, RideTemplate, User
+from src.services.templates import WEEKDAYS_MASK, materialize_templates, template_dates
+from src.services.user_cache import UserCache
+
+TODAY = date.today()
+EVERY_DAY = 0b1111111
+
+
+async def add_template(session_factory, mask: int = EVERY_DAY, active: bool = True) -> int:
+    async with session_factory() as s:
+        template = RideTemplate(
+            user=User(telegram_id=1), role="driver", origin="Здравое", destination="Краснодар",
+            weekday_mask=mask, start_time=time(7, 30), seats=3, active=active
+        )
+        s.add(template)
+        await s.commit()
+        return template.id
+
+
+async def template_rides(session_factory, template_id: int) -> list:
+    async with session_factory() as s:
+        return (await s.execute(
+            select(Ride.ride_date).where(Ride.template_id == template_id).order_by(Ride.ride_date)
+        )).scalars().all()
+
+
+async def materialized_until(session_factory, template_id: int):
+    async with session_factory() as s:
+        return (await s.get(RideTemplate, template_id)).materialized_until
+
+
+def test_template_dates():
+    monday = TODAY - timedelta(days=TODAY.weekday())
+    template = RideTemplate(weekday_mask=WEEKDAYS_MASK, materialized_until=None)
+    dates = template_dates(template, monday + timedelta(days=13), monday)
+    # Со вторника по пятницу первой недели и пн–пт второй: не раньше завтра и без выходных
+    assert dates == [monday + timedelta(days=d) for d in (1, 2, 3, 4, 7, 8, 9, 10, 11)]
+
+    template.materialized_until = monday + timedelta(days=9)
+    assert template_dates(template, monday + timedelta(days=13), monday) == [
+        monday + timedelta(days=d) for d in (10, 11)
+    ]
+    assert template_dates(template, monday + timedelta(days=9), monday) == []
+
+
+async def test_materialize_creates_rides_and_moves_mark(session_factory):
+    template_id = await add_template(session_factory)
+
+    await materialize_templates(days_ahead=7)
+
+    assert await template_rides(session_factory, template_id) == [TODAY + timedelta(days=d) for d in range(1, 8)]
+    assert await materialized_until(session_factory, template_id) == TODAY + timedelta(days=7)
+
+
+async def test_materialize_is_idempotent(session_factory):
+    template_id = await add_template(session_factory)
+    await materialize_templates(days_ahead=7)
+
+    # Повторный прогон и прогон, у которого отметка ещё не сдвинулась (упал до UPDATE или другая реплика):
+    # uq_rides_template_date не даёт создать поездку шаблона на ту же дату второй раз
+    await materialize_templates(days_ahead=7)
+    async with session_factory() as s:
+        template = await s.get(RideTemplate, template_id)
+        template.materialized_until = None
+        await s.commit()
+    await materialize_templates(days_ahead=7)
+    await asyncio.gather(*(materialize_templates(days_ahead=7) for _ in range(3)))
+
+    assert len(await template_rides(session_factory, template_id)) == 7
+    assert await materialized_until(session_factory, template_id) == TODAY + timedelta(days=7)
+
+
+async def test_deleted_date_is_not_recreated(session_factory):
+    template_id = await add_template(session_factory)
+    await materialize_templates(days_ahead=3)
+    async with session_factory() as s:
+        await s.execute(delete(Ride).where(Ride.ride_date == TODAY + timedelta(days=2)))
+        await s.commit()
+
+    await materialize_templates(days_ahead=5)
+
+    # Отметка ушла вперёд до нового горизонта, удалённая дата позади неё
+    assert await template_rides(session_factory, template_id) == [TODAY + timedelta(days=d) for d in (1, 3, 4, 5)]
+    assert await materialized_until(session_factory, template_id) == TODAY + timedelta(days=5)
+
+
+async def test_inactive_template_is_skipped(session_factory):
+    inactive_id = await add_template(session_factory, active=False)
+    await materialize_templates(days_ahead=7)
+    assert await template_rides(session_factory, inactive_id) == []
+    assert await materialized_until(session_factory, inactive_id) is None
+
+
+async def test_materialized_rides_are_matched(session_factory):
+    async with session_factory() as s:
+        s.add(Ride(
+            user=User(telegram_id=3), role="passenger", origin="Григорьевская", destination="Северская",
+            ride_date=TODAY + timedelta(days=1), start_time=time(7, 30), initial_seats=1, seats=1
+        ))
+        await s.commit()
+    template_id = await add_template(session_factory)
+
+    matches = await materialize_templates(days_ahead=2, template_ids=[template_id])
+
+    assert [(new.template_id, other.role, other.ride_date) for new, _, other, _ in matches] == [
+        (template_id, "passenger", TODAY + timedelta(days=1))
+    ]
+
+
+async def test_templates_command_leaves_dialog(session_factory, monkeypatch):
+    monkeypatch.setattr("src.bot.handlers.user_cache", UserCache())
+    await add_template(session_factory)
+    state = AsyncMock()
+    m = SimpleNamespace(from_user=SimpleNamespace(id=1), answer=AsyncMock())
+
+    await list_templates(m, state)
+
+    # /templates посреди диалога с ИИ выходит из него, как и остальные команды
+    state.clear.assert_awaited_once()
+    assert "Здравое ➡️ Краснодар | 07:30" in m.answer.await_args.args[0]
@@ -0,0 +1,26 @@
+from src.services import ttl_cache
+from src.services.ttl_cache import TTLCache
+
+
+def test_lru_eviction_and_stats():
+    cache = TTLCache(max_size=2, ttl=60)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # "a" теперь свежее "b"
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.keys() == ["a", "c"]
+    assert cache.stats() == {"size": 2, "hits": 1, "misses": 1, "hit_rate": 0.5}
+
+
+def test_expired_entries_are_dropped(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ttl_cache.time, "monotonic", lambda: now[0])
+    cache = TTLCache(max_size=10, ttl=5)
+    cache.put("a", 1)
+    now[0] += 4
+    assert cache.lookup("a") == 1
+    now[0] += 2
+    assert cache.lookup("a") is None
+    assert len(cache) == 0
+    assert cache.stats()["hits"] == cache.stats()["misses"] == 0  # lookup не считается
@@ -0,0 +1,114 @@
+import time
+from datetime import date
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+from sqlalchemy import event, select
+
+from src.bot.handlers import start
+from src.database.models import Ride, User
+from src.services.user_cache import UserCache
+
+
+async def test_telegram_id_for_ride_warms_cache(session_factory):
+    async with session_factory() as s:
+        user = User(telegram_id=555, username="anna")
+        ride = Ride(user=user, role="driver", origin="Здравое", destination="Краснодар", ride_date=date(2030, 1, 1), seats=2)
+        s.add(ride)
+        await s.commit()
+
+    cache = UserCache()
+    async with session_factory() as s:
+        assert await cache.telegram_id_for_ride(s, ride.id) == 555
+        assert await cache.telegram_id_for_ride(s, ride.id + 1) is None
+        cached = await cache.get(s, 555)
+    assert cached.username == "anna"
+    assert cache.stats()["hits"] == 1
+
+
+@pytest.fixture
+def queries(engine):
+    """SQL-запросы к тестовой базе по порядку"""
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement.split()[0])
+
+    event.listen(engine.sync_engine, "before_cursor_execute", record)
+    yield statements
+    event.remove(engine.sync_engine, "before_cursor_execute", record)
+
+
+async def add_user(session_factory, telegram_id: int = 555, username="anna"):
+    async with session_factory() as s:
+        s.add(User(telegram_id=telegram_id, username=username))
+        await s.commit()
+
+
+async def test_hit_skips_database(session_factory, queries):
+    await add_user(session_factory)
+    cache = UserCache()
+
+    async with session_factory() as s:
+        first = await cache.get(s, 555)
+        queries.clear()
+        second = await cache.get(s, 555, username="anna")
+
+    assert first == second and first.username == "anna"
+    assert queries == []
+    assert cache.stats() == {"size": 1, "hits": 1, "misses": 1, "hit_rate": 0.5}
+
+
+async def test_unknown_user_is_not_cached(session_factory):
+    cache = UserCache()
+    async with session_factory() as s:
+        assert await cache.get(s, 777) is None
+        assert await cache.get(s, 777) is None
+    assert cache.stats()["size"] == 0
+
+
+async def test_username_change_updates_row_and_cache(session_factory, queries):
+    await add_user(session_factory)
+    cache = UserCache()
+    async with session_factory() as s:
+        await cache.get(s, 555)
+        assert (await cache.get(s, 555, username="anna_k")).username == "anna_k"
+        # Username скрыт: None из апдейта тоже сохраняется
+        assert (await cache.get(s, 555, username=None)).username is None
+        queries.clear()
+        # Без username из апдейта сверять не с чем — только кэш
+        assert (await cache.get(s, 555)).username is None
+    assert queries == []
+
+    async with session_factory() as s:
+        assert (await s.execute(select(User.username).where(User.telegram_id == 555))).scalar_one() is None
+
+
+async def test_cache_is_bounded_and_expires(session_factory, monkeypatch):
+    for telegram_id in (1, 2, 3):
+        await add_user(session_factory, telegram_id, f"user{telegram_id}")
+    cache = UserCache(max_size=2, ttl=60)
+    async with session_factory() as s:
+        for telegram_id in (1, 2, 3):
+            await cache.get(s, telegram_id)
+    # Самая давно использованная запись вытеснена
+    assert sorted(cache._items.keys()) == [2, 3]
+
+    clock = time.monotonic() + 61
+    monkeypatch.setattr("src.services.ttl_cache.time.monotonic", lambda: clock)
+    assert cache._items.lookup(2) is None
+
+
+async def test_start_populates_cache(session_factory, monkeypatch, queries):
+    cache = UserCache()
+    monkeypatch.setattr("src.bot.handlers.user_cache", cache)
+    m = SimpleNamespace(from_user=SimpleNamespace(id=555, username="anna"), answer=AsyncMock())
+
+    await start(m, AsyncMock())
+
+    async with session_factory() as s:
+        user_id = (await s.execute(select(User.id).where(User.telegram_id == 555))).scalar_one()
+        queries.clear()
+        assert await cache.get(s, 555) == (user_id, 555, "anna")
+    assert queries == []
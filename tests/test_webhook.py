@@ -0,0 +1,101 @@
+import asyncio
+import time
+
+import pytest
+from aiogram import Bot, Dispatcher, Router
+from aiohttp.test_utils import TestClient, TestServer
+
+import main
+from src.services.metrics import LatencyStats
+
+SECRET = "test_secret-123"
+LOAD_UPDATES = 1000
+LOAD_CONCURRENCY = 50
+
+
+def update(update_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": 1000 + update_id % 50, "type": "private"},
+            "from": {"id": 1000 + update_id % 50, "is_bot": False, "first_name": "Тест"},
+            "text": "привет",
+        },
+    }
+
+
+@pytest.fixture
+def webhook_mode(monkeypatch):
+    monkeypatch.setattr(main, "WEBHOOK_URL", "https://bot.example.com")
+    monkeypatch.setattr(main, "WEBHOOK_SECRET", SECRET)
+
+
+@pytest.fixture
+async def webhook(webhook_mode):
+    """Webhook-приложение из create_app с диспетчером, который только считает апдейты"""
+    handled = []
+    router = Router()
+
+    @router.message()
+    async def count(message):
+        handled.append(message.message_id)
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    bot = Bot(token="123456:TEST")
+    client = TestClient(TestServer(main.create_app(dp, bot)))
+    await client.start_server()
+    yield client, handled
+    await client.close()
+    await bot.session.close()
+
+
+@pytest.mark.parametrize("secret", [None, "", "with space", "x" * 257])
+def test_webhook_mode_requires_valid_secret(webhook_mode, monkeypatch, secret):
+    monkeypatch.setattr(main, "WEBHOOK_SECRET", secret)
+    with pytest.raises(RuntimeError):
+        main.create_app(Dispatcher(), Bot(token="123456:TEST"))
+
+
+def test_polling_mode_needs_no_secret(monkeypatch):
+    monkeypatch.setattr(main, "WEBHOOK_URL", None)
+    monkeypatch.setattr(main, "WEBHOOK_SECRET", None)
+    main.create_app(Dispatcher(), Bot(token="123456:TEST"))
+
+
+async def test_forged_updates_rejected(webhook):
+    client, handled = webhook
+    for headers in ({}, {"X-Telegram-Bot-Api-Secret-Token": "guess"}):
+        resp = await client.post(main.WEBHOOK_PATH, json=update(1), headers=headers)
+        assert resp.status == 401
+    await asyncio.sleep(0.05)
+    assert handled == []
+
+
+async def test_webhook_load(webhook):
+    """Локальный нагрузочный тест: ответ Telegram не ждёт обработки, все апдейты доходят до хендлера"""
+    client, handled = webhook
+    headers = {"X-Telegram-Bot-Api-Secret-Token": SECRET}
+    latency = LatencyStats(window=LOAD_UPDATES)
+    gate = asyncio.Semaphore(LOAD_CONCURRENCY)
+
+    async def post(update_id):
+        async with gate:
+            started = time.perf_counter()
+            resp = await client.post(main.WEBHOOK_PATH, json=update(update_id), headers=headers)
+            latency.observe(time.perf_counter() - started, ok=resp.status == 200)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(post(i) for i in range(1, LOAD_UPDATES + 1)))
+    while len(handled) < LOAD_UPDATES and time.perf_counter() - started < 30:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+
+    print(
+        f"\nwebhook: {LOAD_UPDATES / elapsed:.0f} updates/s, "
+        f"response p50={latency.percentile(0.5) * 1000:.1f}ms p99={latency.percentile(0.99) * 1000:.1f}ms"
+    )
+    assert latency.errors == 0
+    assert sorted(handled) == list(range(1, LOAD_UPDATES + 1))